@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class FitnessappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'FitnessApp'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
@@ -0,0 +1,112 @@
+# async_views.py
+"""Async variants of the read endpoints, served under /async/.
+
+DRF views are sync only, so these are plain Django async views using the async queryset API
+(aget, aiterator, aexists); rows are read with values(), as values_list() querysets execute
+eagerly inside aiterator() and so cannot run in an async context. Served through backend/asgi.py, a worker keeps handling other
+requests while one waits on the database. Authentication reuses CachedJWTAuthentication
+through sync_to_async, and responses are rendered like DRF's JSONRenderer so the bodies
+match the sync endpoints.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from rest_framework import exceptions, status
+from rest_framework.utils.encoders import JSONEncoder
+
+from .authentication import CachedJWTAuthentication
+from .models import Item, Recipe, Action, PantryItem, MealRequirement
+from .views import EatenFoodView
+
+JSON_PARAMS = {'separators': (',', ':'), 'ensure_ascii': False, 'allow_nan': False}
+
+
+def render(data, status_code=status.HTTP_200_OK):
+    return JsonResponse(data, status=status_code, safe=False, encoder=JSONEncoder, json_dumps_params=JSON_PARAMS)
+
+
+def async_authenticated(view):
+    authenticate = sync_to_async(CachedJWTAuthentication().authenticate)
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            result = await authenticate(request)
+        except exceptions.APIException as error:
+            detail = error.detail if isinstance(error.detail, (list, dict)) else {'detail': error.detail}
+            return render(detail, status_code=error.status_code)
+        if result is None:
+            return render({'detail': 'Authentication credentials were not provided.'}, status_code=status.HTTP_401_UNAUTHORIZED)
+        request.user = result[0]
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+async def item_list(request):
+    items = [item async for item in Item.objects.order_by('item_id').values().aiterator()]
+    return render(items)
+
+
+async def item_detail(request, pk):
+    try:
+        item = await Item.objects.values().aget(pk=pk)
+    except Item.DoesNotExist:
+        return render({'detail': 'No Item matches the given query.'}, status_code=status.HTTP_404_NOT_FOUND)
+    return render(item)
+
+
+async def item_ingredients(request, item_id):
+    try:
+        item = await Item.objects.aget(pk=item_id)
+    except Item.DoesNotExist:
+        return render({'detail': 'Item not found.'}, status_code=status.HTTP_404_NOT_FOUND)
+    if not item.is_meal:
+        return render({'detail': 'Item is not a meal.'}, status_code=status.HTTP_400_BAD_REQUEST)
+
+    recipes = Recipe.objects.filter(meal=item).values('ingredient_id', 'ingredient__name', 'quantity')
+    return render([
+        {'ingredient_id': recipe['ingredient_id'], 'name': recipe['ingredient__name'], 'quantity': recipe['quantity']}
+        async for recipe in recipes.aiterator()
+    ])
+
+
+@async_authenticated
+async def available_ingredients(request):
+    if not await sync_to_async(Action.has_history)(request.user):
+        return render({}, status_code=status.HTTP_404_NOT_FOUND)
+    pantry = PantryItem.objects.filter(user=request.user, quantity__gt=0).values('item_id', 'quantity')
+    return render({entry['item_id']: entry['quantity'] async for entry in pantry.aiterator()})
+
+
+@async_authenticated
+async def eaten_food(request):
+    try:
+        since = EatenFoodView.parse_bound(request.GET.get('since'), is_until=False)
+        until = EatenFoodView.parse_bound(request.GET.get('until'), is_until=True)
+        limit = request.GET.get('limit')
+        limit = int(limit) if limit is not None else None
+    except ValueError:
+        return render({'detail': 'since/until must be ISO dates or datetimes and limit an integer.'}, status_code=status.HTTP_400_BAD_REQUEST)
+    if limit is not None and limit < 1:
+        return render({'detail': 'limit must be positive.'}, status_code=status.HTTP_400_BAD_REQUEST)
+
+    if not await sync_to_async(Action.has_history)(request.user):
+        return render({}, status_code=status.HTTP_404_NOT_FOUND)
+    action = Action(user=request.user)
+    return render([
+        {'action_id': row['action_id'], 'item_id': row['item'], 'quantity': row['quantity'], 'timestamp': row['timestamp']}
+        async for row in action.get_eaten_food_queryset(since, until, limit).aiterator(chunk_size=2000)
+    ])
+
+
+@async_authenticated
+async def meal_recommendations(request):
+    if not await sync_to_async(Action.has_history)(request.user):
+        return render({'detail': 'No actions found for the user.'}, status_code=status.HTTP_404_NOT_FOUND)
+
+    cookable = MealRequirement.get_cookable_meal_ids(request.user)
+    meals = [meal async for meal in Item.objects.filter(item_id__in=cookable).order_by('item_id').values().aiterator()]
+    if not meals:
+        return render({'detail': 'No valid meal recommendations found.'}, status_code=status.HTTP_204_NO_CONTENT)
+    return render(meals)
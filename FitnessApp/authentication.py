@@ -0,0 +1,64 @@
+# authentication.py
+"""JWT authentication that resolves users from a short-lived cache instead of the database.
+
+simplejwt's JWTAuthentication loads the user with one SELECT per request. Here the user is
+cached per user_id, with its UserSettings row attached, for FITNESSAPP_AUTH_CACHE_TIMEOUT
+seconds. The is_active and password checks still run on every request against the cached
+copy, and signals drop the entry after any User or UserSettings write (see signals.py).
+
+That drop only reaches other workers through a shared cache. With a process-local (locmem)
+cache the other workers keep a deactivated user, or a token issued before a password
+change, working for up to FITNESSAPP_AUTH_CACHE_TIMEOUT seconds; `check --deploy` warns
+about this configuration (see checks.py).
+"""
+from django.conf import settings
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .caching import get_cache
+from .models import UserSettings
+
+
+def _user_key(user_id):
+    return f'fitnessapp:auth:user:{user_id}'
+
+
+def invalidate_cached_user(user_id):
+    # Deleting again after commit keeps a request that raced the write from re-caching stale data
+    get_cache().delete(_user_key(user_id))
+    transaction.on_commit(lambda: get_cache().delete(_user_key(user_id)))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        cache = get_cache()
+        user = cache.get(_user_key(user_id))
+        if user is None:
+            user = self.load_user(user_id)
+            cache.set(_user_key(user_id), user, getattr(settings, 'FITNESSAPP_AUTH_CACHE_TIMEOUT', 60))
+
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
+
+    def load_user(self, user_id):
+        try:
+            user = self.user_model.objects.select_related('usersettings').get(**{api_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        UserSettings.for_user(user)
+        return user
@@ -0,0 +1,487 @@
+# benchmarking.py
+"""Synthetic data and an end-to-end benchmark of every route in backend/urls.py.
+
+Driven by the benchmark_api management command: it seeds users, a food catalog with nested
+meals and long Action histories, replays each scenario through the test client with real
+JWT authentication, and reports latency percentiles, queries per request and peak memory.
+The benchmark_concurrency command reuses the seed to compare the sync read endpoints under
+concurrent load through the WSGI handler with their /async/ variants through the ASGI one,
+and benchmark_writers to measure parallel /actions/ writers on each database profile.
+"""
+import asyncio
+import math
+import random
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import timedelta
+from time import perf_counter
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, get_resolver
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .caching import get_cache
+from .models import Item, Recipe, Action, UserSettings, PantryItem, MealRequirement, DailyNutrition
+from .nutrition import NUTRIENT_FIELDS, ROLLUP_FIELDS, per_gram_values, set_totals
+
+SCALES = {
+    'smoke': {
+        'users': 20, 'items': 500, 'meals': 40, 'nested_meals': 10,
+        'actions_per_user': 20, 'heavy_users': 1, 'heavy_actions': 500, 'requests': 5,
+    },
+    'default': {
+        'users': 2000, 'items': 100_000, 'meals': 3000, 'nested_meals': 500,
+        'actions_per_user': 50, 'heavy_users': 5, 'heavy_actions': 20_000, 'requests': 30,
+    },
+}
+PASSWORD = 'bench-password-2024'
+WORDS = [
+    'apple', 'bean', 'beef', 'bread', 'broccoli', 'butter', 'carrot', 'cheese', 'chicken', 'corn',
+    'egg', 'lentil', 'milk', 'oat', 'onion', 'pasta', 'pepper', 'pork', 'potato', 'rice',
+    'salmon', 'spinach', 'tofu', 'tomato', 'tuna', 'turkey', 'walnut', 'wheat', 'yogurt', 'zucchini',
+]
+ACTION_BATCH = 20_000
+
+
+@dataclass
+class Dataset:
+    users: list
+    heavy_users: list
+    raw_item_ids: list
+    meals: dict  # meal_id -> [(ingredient_id, quantity)]
+    nested_meal_ids: list
+
+
+def seed(scale, rng=None):
+    """Creates the synthetic dataset described by a SCALES entry and returns its handles."""
+    rng = rng or random.Random(0)
+    with transaction.atomic():
+        users = _seed_users(scale['users'] + scale['heavy_users'])
+        raw_items = _seed_raw_items(scale['items'], rng)
+        meals, nested_meal_ids = _seed_meals(scale['meals'], scale['nested_meals'], raw_items, rng)
+
+    heavy_users = users[:scale['heavy_users']]
+    dataset = Dataset(users[scale['heavy_users']:], heavy_users, [item.item_id for item in raw_items], meals, nested_meal_ids)
+    items = Item.objects.in_bulk()
+    for user in users:
+        with transaction.atomic():
+            actions = scale['heavy_actions'] if user in heavy_users else scale['actions_per_user']
+            _seed_history(user, actions, dataset, items, rng)
+    return dataset
+
+
+def _seed_users(count):
+    password = make_password(PASSWORD)
+    User.objects.bulk_create(User(username=f'bench_{i}', password=password) for i in range(count))
+    users = list(User.objects.filter(username__startswith='bench_').order_by('pk'))
+    UserSettings.objects.bulk_create(UserSettings(user=user) for user in users)
+    return users
+
+
+def _seed_raw_items(count, rng):
+    items = [
+        Item(
+            name=f'{rng.choice(WORDS)} {rng.choice(WORDS)} {i}',
+            calories=rng.randint(20, 600),
+            serving_weight=100,
+            protein=round(rng.uniform(0, 30), 1),
+            fats_saturated=round(rng.uniform(0, 10), 1),
+            fats_unsaturated=round(rng.uniform(0, 20), 1),
+            carbs_sugar=round(rng.uniform(0, 20), 1),
+            carbs_fiber=round(rng.uniform(0, 10), 1),
+            carbs_starch=round(rng.uniform(0, 60), 1),
+        )
+        for i in range(count)
+    ]
+    return Item.objects.bulk_create(items, batch_size=5000)
+
+
+def _seed_meals(count, nested_count, raw_items, rng):
+    base_meals = Item.objects.bulk_create(Item(name=f'{rng.choice(WORDS)} bowl {i}', is_meal=True) for i in range(count))
+    nested_meals = Item.objects.bulk_create(Item(name=f'{rng.choice(WORDS)} platter {i}', is_meal=True) for i in range(nested_count))
+
+    meals = {}
+    recipes = []
+    for meal in base_meals + nested_meals:
+        parts = [(ingredient, rng.randint(20, 200)) for ingredient in rng.sample(raw_items, rng.randint(3, 8))]
+        if meal in nested_meals:
+            parts += [(sub_meal, rng.randint(100, 300)) for sub_meal in rng.sample(base_meals, rng.randint(1, 2))]
+
+        # Base meals are finalized before nested ones, so sub-meal values are already rolled up
+        totals = dict.fromkeys(ROLLUP_FIELDS, 0.0)
+        for ingredient, quantity in parts:
+            ingredient_per_gram = per_gram_values(ingredient)
+            for field in NUTRIENT_FIELDS:
+                totals[field] += quantity * ingredient_per_gram[field]
+            totals['serving_weight'] += quantity
+            recipes.append(Recipe(meal=meal, ingredient=ingredient, quantity=quantity))
+        set_totals(meal, totals)
+        meals[meal.item_id] = [(ingredient.item_id, quantity) for ingredient, quantity in parts]
+
+    Item.objects.bulk_update(base_meals + nested_meals, ROLLUP_FIELDS, batch_size=1000)
+    Recipe.objects.bulk_create(recipes, batch_size=5000)
+    MealRequirement.objects.bulk_create((
+        MealRequirement(meal_id=meal_id, ingredient_id=ingredient_id, quantity=quantity)
+        for meal_id, parts in meals.items()
+        for ingredient_id, quantity in _merge(parts).items()
+    ), batch_size=5000)
+    return meals, [meal.item_id for meal in nested_meals]
+
+
+def _seed_history(user, count, dataset, items, rng):
+    # Users keep restocking a few staples, including the ingredients of some meals, so their
+    # pantries stay positive and some meals are cookable
+    favourite_meals = rng.sample(sorted(dataset.meals), 3)
+    staples = rng.sample(dataset.raw_item_ids, 10) + [
+        ingredient_id for meal_id in favourite_meals for ingredient_id, _ in dataset.meals[meal_id]
+    ]
+    now = timezone.now()
+    pantry = {}
+    days = {}
+    actions = []
+    for _ in range(count):
+        action_type = rng.choices(['ADD', 'EAT', 'DISPOSE', 'COOK'], weights=[40, 35, 10, 15])[0]
+        item_id = ingredient_id = rng.choice(staples)
+        quantity = rng.randint(200, 1000) if action_type == 'ADD' else rng.randint(20, 150)
+        if action_type == 'COOK':
+            item_id = rng.choice(favourite_meals)
+            ingredient_id, quantity = rng.choice(dataset.meals[item_id])
+        action = Action(
+            user=user, item_id=item_id, ingredient_id=ingredient_id, action_type=action_type,
+            quantity=quantity, timestamp=now - timedelta(seconds=rng.randint(0, 365 * 86400)),
+        )
+        actions.append(action)
+
+        for pantry_item_id, delta in PantryItem.get_action_deltas(action).items():
+            pantry[pantry_item_id] = pantry.get(pantry_item_id, 0) + delta
+        if action_type == 'EAT':
+            totals = days.setdefault(timezone.localdate(action.timestamp), dict.fromkeys(DailyNutrition.TOTAL_FIELDS, 0.0))
+            for field, value in DailyNutrition.get_eaten_totals(items[item_id], quantity).items():
+                totals[field] += value
+                setattr(action, field, value)
+        if len(actions) >= ACTION_BATCH:
+            Action.objects.bulk_create(actions)
+            actions = []
+
+    Action.objects.bulk_create(actions)
+    PantryItem.objects.bulk_create(PantryItem(user=user, item_id=item_id, quantity=quantity) for item_id, quantity in pantry.items())
+    DailyNutrition.objects.bulk_create(DailyNutrition(user=user, date=date, **totals) for date, totals in days.items())
+
+
+def _merge(parts):
+    merged = {}
+    for ingredient_id, quantity in parts:
+        merged[ingredient_id] = merged.get(ingredient_id, 0) + quantity
+    return merged
+
+
+@dataclass
+class Scenario:
+    name: str
+    route: str
+    build: callable  # (context, iteration) -> (method, path, data, user or None)
+    requests: int = None
+
+
+class Context:
+    def __init__(self, dataset, rng):
+        self.dataset = dataset
+        self.rng = rng
+        self.tokens = {}
+
+    def user(self, i):
+        return self.dataset.users[i % len(self.dataset.users)]
+
+    def heavy_user(self, i):
+        return self.dataset.heavy_users[i % len(self.dataset.heavy_users)]
+
+    def staff_user(self):
+        # Outside the bench_ prefix so --current-db does not load it as a regular user
+        user, created = User.objects.get_or_create(username='metrics_scraper', defaults={'is_staff': True})
+        if created:
+            UserSettings.objects.create(user=user)
+        return user
+
+    def refresh_token(self, user):
+        if user.pk not in self.tokens:
+            self.tokens[user.pk] = RefreshToken.for_user(user)
+        return self.tokens[user.pk]
+
+    def log_action(self, user):
+        item_id = self.rng.choice(self.dataset.raw_item_ids)
+        with transaction.atomic():
+            action = Action.objects.create(user=user, item_id=item_id, ingredient_id=item_id, action_type='ADD', quantity=100)
+            action.apply_to_rollups()
+        return action
+
+    def stock_meal(self, user, meal_id):
+        # Tops each ingredient up to one batch, plus a gram against float rounding, so the cook request succeeds
+        requirements = dict(MealRequirement.objects.filter(meal_id=meal_id).values_list('ingredient', 'quantity'))
+        stock = dict(PantryItem.objects.filter(user=user, item_id__in=requirements).values_list('item_id', 'quantity'))
+        with transaction.atomic():
+            actions = Action.objects.bulk_create(
+                Action(user=user, item_id=ingredient_id, ingredient_id=ingredient_id, action_type='ADD', quantity=quantity - stock.get(ingredient_id, 0) + 1)
+                for ingredient_id, quantity in requirements.items() if stock.get(ingredient_id, 0) < quantity
+            )
+            Action.apply_all_to_rollups(actions)
+        return meal_id
+
+    def new_meal(self, i):
+        return Item.objects.create(name=f'bench bulk meal {i}', is_meal=True)
+
+
+def _scenarios():
+    def raw(context):
+        return context.rng.choice(context.dataset.raw_item_ids)
+
+    def meal(context):
+        return context.rng.choice(sorted(context.dataset.meals))
+
+    def ingredients(context, count):
+        return [{'ingredient': raw(context), 'quantity': 50} for _ in range(count)]
+
+    def offline_actions(context, i, count):
+        actions = []
+        for n in range(count):
+            item_id = raw(context)
+            action_type = context.rng.choice(('ADD', 'EAT'))
+            timestamp = timezone.now() - timedelta(hours=count - n)
+            actions.append({'client_key': f'bench-{i}-{n}', 'item': item_id, 'ingredient': item_id,
+                            'action_type': action_type, 'quantity': 50, 'timestamp': timestamp.isoformat()})
+        return actions
+
+    return [
+        Scenario('items.page', 'item_list_create', lambda c, i: ('GET', '/items/?page_size=100&fields=name,calories', None, None)),
+        Scenario('items.full', 'item_list_create', lambda c, i: ('GET', '/items/', None, None), requests=3),
+        Scenario('items.create', 'item_list_create', lambda c, i: ('POST', '/items/', {'name': f'bench new item {i}', 'calories': 100, 'serving_weight': 100}, None)),
+        Scenario('items.search', 'item_search', lambda c, i: ('GET', f'/items/search/?q={c.rng.choice(WORDS)[:3]}', None, None)),
+        Scenario('items.detail', 'item_detail', lambda c, i: ('GET', f'/items/{raw(c)}/', None, None)),
+        Scenario('items.update', 'item_detail', lambda c, i: ('PATCH', f'/items/{raw(c)}/', {'protein': 10 + i}, c.user(i))),
+        Scenario('items.ingredients', 'item_ingredients', lambda c, i: ('GET', f'/items/{meal(c)}/ingredients/', None, None)),
+        Scenario('recipes.list', 'recipe_list_create', lambda c, i: ('GET', '/recipes/', None, None), requests=3),
+        Scenario('recipes.create', 'recipe_list_create', lambda c, i: ('POST', '/recipes/', {'meal': meal(c), 'ingredient': raw(c), 'quantity': 40}, None)),
+        Scenario('recipes.bulk', 'recipe_bulk_create', lambda c, i: ('POST', '/recipes/bulk/', {'meal': c.new_meal(i).item_id, 'ingredients': ingredients(c, 15)}, c.user(i))),
+        Scenario('recipes.detail', 'recipe_detail', lambda c, i: ('GET', f'/recipes/{Recipe.objects.filter(meal_id=meal(c)).first().pk}/', None, None)),
+        Scenario('recipes.delete', 'recipe_detail', lambda c, i: ('DELETE', f'/recipes/{Recipe.objects.create(meal_id=meal(c), ingredient_id=raw(c), quantity=10).pk}/', None, c.user(i))),
+        Scenario('actions.list', 'action_list_create', lambda c, i: ('GET', '/actions/', None, c.user(i)), requests=2),
+        Scenario('actions.create', 'action_list_create', lambda c, i: ('POST', '/actions/', {'item': raw(c), 'ingredient': raw(c), 'action_type': 'ADD', 'quantity': 100}, c.heavy_user(i))),
+        Scenario('actions.batch', 'action_batch_create', lambda c, i: ('POST', '/actions/batch/', {'actions': offline_actions(c, i, 200)}, c.heavy_user(i))),
+        Scenario('actions.cook', 'action_cook', lambda c, i: ('POST', '/actions/cook/', {'meal': c.stock_meal(c.heavy_user(i), meal(c)), 'servings': 1}, c.heavy_user(i))),
+        Scenario('actions.delete', 'action_delete', lambda c, i: ('DELETE', f'/actions/{c.log_action(c.heavy_user(i)).pk}/', None, c.heavy_user(i))),
+        Scenario('auth.token', 'token_obtain_pair', lambda c, i: ('POST', '/api/token/', {'username': c.user(i).username, 'password': PASSWORD}, None), requests=3),
+        Scenario('auth.refresh', 'token_refresh', lambda c, i: ('POST', '/api/token/refresh/', {'refresh': str(c.refresh_token(c.user(i)))}, None)),
+        Scenario('auth.verify', 'token_verify', lambda c, i: ('POST', '/api/token/verify/', {'token': str(c.refresh_token(c.user(i)).access_token)}, None)),
+        Scenario('auth.register', 'user_registration', lambda c, i: ('POST', '/api/register/', {'username': f'bench_new_{i}', 'password': PASSWORD}, None), requests=3),
+        Scenario('user.settings', 'user_settings', lambda c, i: ('GET', '/user-settings/', None, c.user(i))),
+        Scenario('pantry', 'available_ingredients', lambda c, i: ('GET', '/available-ingredients/', None, c.user(i))),
+        Scenario('pantry.heavy', 'available_ingredients', lambda c, i: ('GET', '/available-ingredients/', None, c.heavy_user(i))),
+        Scenario('eaten.month', 'eaten_food', lambda c, i: ('GET', f'/eaten-food/?since={timezone.localdate() - timedelta(days=30)}', None, c.heavy_user(i))),
+        Scenario('eaten.export', 'eaten_food', lambda c, i: ('GET', '/eaten-food/?export=ndjson', None, c.heavy_user(i)), requests=3),
+        Scenario('recommendations', 'meal_recommendations', lambda c, i: ('GET', '/meal-recommendations/', None, c.user(i))),
+        Scenario('recommend.partial', 'meal_recommendations', lambda c, i: ('GET', '/meal-recommendations/?mode=partial&limit=20', None, c.user(i))),
+        Scenario('recommend.expand', 'meal_recommendations', lambda c, i: ('GET', '/meal-recommendations/?expand=1', None, c.heavy_user(i))),
+        Scenario('meal.plan', 'meal_plan', lambda c, i: ('GET', '/meal-plan/', None, c.heavy_user(i))),
+        Scenario('summary.year', 'daily_summary', lambda c, i: ('GET', f'/daily-summary/?since={timezone.localdate() - timedelta(days=364)}', None, c.heavy_user(i))),
+        Scenario('async.items', 'async_item_list', lambda c, i: ('GET', '/async/items/', None, None), requests=3),
+        Scenario('async.item', 'async_item_detail', lambda c, i: ('GET', f'/async/items/{raw(c)}/', None, None)),
+        Scenario('async.ingredients', 'async_item_ingredients', lambda c, i: ('GET', f'/async/items/{meal(c)}/ingredients/', None, None)),
+        Scenario('async.pantry', 'async_available_ingredients', lambda c, i: ('GET', '/async/available-ingredients/', None, c.heavy_user(i))),
+        Scenario('async.eaten', 'async_eaten_food', lambda c, i: ('GET', f'/async/eaten-food/?since={timezone.localdate() - timedelta(days=30)}', None, c.heavy_user(i))),
+        Scenario('async.recommend', 'async_meal_recommendations', lambda c, i: ('GET', '/async/meal-recommendations/', None, c.user(i))),
+        Scenario('metrics', 'metrics', lambda c, i: ('GET', '/metrics/', None, c.staff_user())),
+    ]
+
+
+def get_route_names():
+    return {pattern.name for pattern in get_resolver().url_patterns if isinstance(pattern, URLPattern) and pattern.name}
+
+
+def get_scenarios():
+    scenarios = _scenarios()
+    missing = get_route_names() - {scenario.route for scenario in scenarios}
+    if missing:
+        raise ValueError(f"No benchmark scenario for route(s): {', '.join(sorted(missing))}")
+    return scenarios
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def run_scenarios(dataset, scenarios, requests, rng=None):
+    context = Context(dataset, rng or random.Random(1))
+    client = APIClient()
+    get_cache().clear()
+
+    results = {}
+    for scenario in scenarios:
+        count = min(scenario.requests or requests, requests)
+        timings, query_counts, errors = [], [], 0
+        for i in range(count):
+            response, elapsed, queries = _request(client, context, scenario, i)
+            timings.append(elapsed)
+            query_counts.append(queries)
+            errors += response.status_code >= 400
+
+        tracemalloc.start()
+        try:
+            _request(client, context, scenario, count)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        results[scenario.name] = {
+            'route': scenario.route,
+            'requests': count,
+            'p50_ms': percentile(timings, 0.50) * 1000,
+            'p95_ms': percentile(timings, 0.95) * 1000,
+            'p99_ms': percentile(timings, 0.99) * 1000,
+            'queries': max(query_counts),
+            'peak_kb': peak / 1024,
+            'errors': errors,
+        }
+    return results
+
+
+def _request(client, context, scenario, i):
+    method, path, data, user = scenario.build(context, i)
+    headers = {}
+    if user is not None:
+        headers['HTTP_AUTHORIZATION'] = f'Bearer {context.refresh_token(user).access_token}'
+
+    with CaptureQueriesContext(connection) as queries:
+        started = perf_counter()
+        response = getattr(client, method.lower())(path, data, format='json', **headers)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        elapsed = perf_counter() - started
+    return response, elapsed, len(queries)
+
+
+# (sync path, async path) pairs driven by the benchmark_concurrency command
+CONCURRENCY_ENDPOINTS = {
+    'item': lambda c, i: ('/items/{}/', '/async/items/{}/', raw_item_id(c)),
+    'ingredients': lambda c, i: ('/items/{}/ingredients/', '/async/items/{}/ingredients/', c.rng.choice(sorted(c.dataset.meals))),
+    'pantry': lambda c, i: ('/available-ingredients/', '/async/available-ingredients/', None),
+    'eaten': lambda c, i: ('/eaten-food/', '/async/eaten-food/', None),
+    'recommendations': lambda c, i: ('/meal-recommendations/', '/async/meal-recommendations/', None),
+}
+
+
+def raw_item_id(context):
+    return context.rng.choice(context.dataset.raw_item_ids)
+
+
+def build_load(dataset, endpoint, requests, rng=None):
+    """Returns [(sync path, async path, headers)] for one endpoint, rotating over the heavy users."""
+    context = Context(dataset, rng or random.Random(2))
+    load = []
+    for i in range(requests):
+        sync_path, async_path, arg = CONCURRENCY_ENDPOINTS[endpoint](context, i)
+        token = context.refresh_token(context.heavy_user(i)).access_token
+        load.append((sync_path.format(arg), async_path.format(arg), {'Authorization': f'Bearer {token}'}))
+    return load
+
+
+def run_wsgi_load(load, concurrency):
+    """Drives the sync views through the WSGI handler from a pool of threads."""
+    def fetch(request):
+        path, _, headers = request
+        started = perf_counter()
+        response = Client().get(path, headers=headers)
+        return response.status_code, perf_counter() - started
+
+    started = perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(fetch, load))
+    return _summarize_load(results, perf_counter() - started)
+
+
+def run_asgi_load(load, concurrency):
+    """Drives the async views through the ASGI handler from one event loop."""
+    async def run():
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(request):
+            _, path, headers = request
+            async with semaphore:
+                started = perf_counter()
+                response = await client.get(path, headers=headers)
+                return response.status_code, perf_counter() - started
+
+        started = perf_counter()
+        results = await asyncio.gather(*(fetch(request) for request in load))
+        return results, perf_counter() - started
+
+    results, elapsed = asyncio.run(run())
+    return _summarize_load(results, elapsed)
+
+
+def _summarize_load(results, elapsed):
+    timings = [timing for _, timing in results]
+    return {
+        'requests': len(results),
+        'throughput': len(results) / elapsed,
+        'p50_ms': percentile(timings, 0.50) * 1000,
+        'p95_ms': percentile(timings, 0.95) * 1000,
+        'errors': sum(status_code >= 400 for status_code, _ in results),
+    }
+
+
+def build_write_load(dataset, requests, rng=None):
+    """Returns [(body, headers)] of ADD actions for /actions/, rotating over all users."""
+    context = Context(dataset, rng or random.Random(3))
+    load = []
+    for i in range(requests):
+        item_id = raw_item_id(context)
+        token = context.refresh_token(context.user(i)).access_token
+        body = {'item': item_id, 'ingredient': item_id, 'action_type': 'ADD', 'quantity': 100}
+        load.append((body, {'Authorization': f'Bearer {token}'}))
+    return load
+
+
+def run_write_load(load, writers):
+    """Posts the load to /actions/ from `writers` threads, each on its own database connection."""
+    def write(share):
+        # Failed writes such as "database is locked" come back as 500 responses and count as errors
+        client = Client(raise_request_exception=False)
+        results = []
+        try:
+            for body, headers in share:
+                started = perf_counter()
+                response = client.post('/actions/', body, content_type='application/json', headers=headers)
+                results.append((response.status_code, perf_counter() - started))
+        finally:
+            connection.close()
+        return results
+
+    started = perf_counter()
+    with ThreadPoolExecutor(max_workers=writers) as pool:
+        results = [result for share in pool.map(write, [load[i::writers] for i in range(writers)]) for result in share]
+    return _summarize_load(results, perf_counter() - started)
+
+
+def compare(results, baseline, tolerance, slack_ms=5.0):
+    """Lists regressions against a baseline: more queries, or p95 beyond the tolerance."""
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if result['queries'] > expected['queries']:
+            regressions.append(f"{name}: {result['queries']} queries, baseline {expected['queries']}")
+        limit = expected['p95_ms'] * (1 + tolerance) + slack_ms
+        if result['p95_ms'] > limit:
+            regressions.append(f"{name}: p95 {result['p95_ms']:.1f} ms, baseline {expected['p95_ms']:.1f} ms (limit {limit:.1f} ms)")
+        if result['errors'] > expected.get('errors', 0):
+            regressions.append(f"{name}: {result['errors']} error responses")
+    return regressions
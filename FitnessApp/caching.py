@@ -0,0 +1,105 @@
+# caching.py
+"""Per-user response caching with write-driven invalidation.
+
+Every user has a version number, bumped after any of their Actions is created or deleted,
+and the food catalog has one, bumped after Item or Recipe writes. Cached responses and
+ETags embed the versions they were computed from, so a bump invalidates them without
+having to find and delete keys. Uses the cache alias named by FITNESSAPP_CACHE_ALIAS.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+CACHEABLE_STATUSES = (status.HTTP_200_OK, status.HTTP_204_NO_CONTENT, status.HTTP_404_NOT_FOUND)
+
+
+def get_cache():
+    return caches[getattr(settings, 'FITNESSAPP_CACHE_ALIAS', 'default')]
+
+
+def is_process_local():
+    """True for a locmem cache alias, which management commands cannot invalidate for running servers."""
+    return isinstance(get_cache(), LocMemCache)
+
+
+def _user_version_key(user_id):
+    return f'fitnessapp:version:user:{user_id}'
+
+
+CATALOG_VERSION_KEY = 'fitnessapp:version:catalog'
+
+
+def _get_version(key):
+    cache = get_cache()
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock so a version lost to eviction never repeats an older one
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _bump_version(key):
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), timeout=None)
+
+
+def get_user_version(user_id):
+    return _get_version(_user_version_key(user_id))
+
+
+def get_catalog_version():
+    return _get_version(CATALOG_VERSION_KEY)
+
+
+def bump_user_version(user_id):
+    transaction.on_commit(lambda: _bump_version(_user_version_key(user_id)))
+
+
+def bump_catalog_version():
+    transaction.on_commit(lambda: _bump_version(CATALOG_VERSION_KEY))
+
+
+def cache_user_response(scope, catalog=False):
+    """Caches a view's GET response per user and answers If-None-Match with 304.
+
+    With catalog=True the response also depends on the catalog version.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            versions = [get_user_version(request.user.pk)]
+            if catalog:
+                versions.append(get_catalog_version())
+            query = request.META.get('QUERY_STRING', '')
+            if query:
+                versions.append(hashlib.sha1(query.encode()).hexdigest()[:12])
+            etag = '"{}-{}-{}"'.format(scope, request.user.pk, '-'.join(map(str, versions)))
+
+            if etag in parse_etags(request.headers.get('If-None-Match', '')):
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+            cache = get_cache()
+            cache_key = f'fitnessapp:response:{etag}'
+            cached = cache.get(cache_key)
+            if cached is not None:
+                response = Response(cached[1], status=cached[0])
+            else:
+                response = method(view, request, *args, **kwargs)
+                if response.status_code in CACHEABLE_STATUSES:
+                    cache.set(cache_key, (response.status_code, response.data), getattr(settings, 'FITNESSAPP_CACHE_TIMEOUT', 300))
+            response['ETag'] = etag
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,323 @@
+# catalog_import.py
+"""Streaming import of a food catalog from CSV or JSONL files.
+
+The items file has one row per item: external_id (required, the upsert key), name, is_meal,
+serving_weight and the nutrient columns; missing values take the model defaults. Rows are
+validated and upserted one chunk at a time with bulk_create(update_conflicts=True), so an
+import can be re-run to apply a newer version of a dataset.
+
+The recipes file has meal, ingredient and quantity columns. References are matched on
+external_id first and then on an unambiguous name, so recipes can use items created through
+the API. A meal named in the file has its existing recipe replaced by the file's rows.
+
+Once everything is loaded, MealRequirement is refreshed for the imported meals and every
+meal's nutrition is recomputed with one UPDATE per chunk of meals, deepest sub-meals first.
+The import runs in one transaction and is rolled back if its recipes close a cycle. Only one
+chunk of rows is held in memory at a time, plus the ids of the imported meals and the meal
+graph.
+"""
+import csv
+import json
+from dataclasses import dataclass, field
+from itertools import islice
+from pathlib import Path
+from time import perf_counter
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, F, FloatField, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Round
+
+from . import recipe_graph
+from .caching import bump_catalog_version
+from .models import Item, Recipe, MealRequirement
+from .nutrition import INTEGER_FIELDS, NUTRIENT_FIELDS, ROLLUP_FIELDS
+from .routers import pin_catalog_to_primary
+
+ITEM_FIELDS = ('name', 'is_meal') + ROLLUP_FIELDS
+CHUNK_SIZE = 2000
+UPDATE_CHUNK_SIZE = 500
+MAX_REPORTED_ERRORS = 20
+BOOLEANS = {'true': True, 'yes': True, 't': True, '1': True, 'false': False, 'no': False, 'f': False, '0': False}
+
+
+class CatalogFormatError(ValueError):
+    pass
+
+
+@dataclass
+class ImportReport:
+    rows: int = 0
+    imported: int = 0
+    invalid: int = 0
+    elapsed: float = 0.0
+    errors: list = field(default_factory=list)
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def add_error(self, source, line, errors):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f'{source}:{line}: ' + '; '.join(f'{key}: {message}' for key, message in errors.items()))
+
+
+def read_rows(path):
+    """Yields (line number, row) from a .csv or .jsonl file; row is None for an unparsable line."""
+    path = Path(path)
+    if path.suffix == '.csv':
+        with path.open(newline='', encoding='utf-8') as file:
+            reader = csv.DictReader(file)
+            for row in reader:
+                # Surplus cells are collected under the None key
+                yield reader.line_num, (None if None in row else row)
+    elif path.suffix in ('.jsonl', '.ndjson'):
+        with path.open(encoding='utf-8') as file:
+            for line_number, line in enumerate(file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                yield line_number, (row if isinstance(row, dict) else None)
+    else:
+        raise CatalogFormatError(f'{path.name}: expected a .csv, .jsonl or .ndjson file.')
+
+
+def chunked(rows, size):
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def _is_blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def clean_item_row(row):
+    """Returns (external_id, {field: value}, {field: error})."""
+    errors = {}
+    external_id = '' if _is_blank(row.get('external_id')) else str(row['external_id']).strip()
+    if not external_id:
+        errors['external_id'] = 'This field is required.'
+    elif len(external_id) > Item._meta.get_field('external_id').max_length:
+        errors['external_id'] = 'Too long.'
+
+    values = {}
+    for name in ITEM_FIELDS:
+        model_field = Item._meta.get_field(name)
+        value = row.get(name)
+        if _is_blank(value):
+            if name == 'name':
+                errors[name] = 'This field is required.'
+            values[name] = model_field.get_default()
+            continue
+        if isinstance(value, str):
+            value = value.strip()
+        try:
+            if name == 'is_meal' and isinstance(value, str):
+                value = BOOLEANS.get(value.lower(), value)
+            elif name in INTEGER_FIELDS:
+                # Datasets often carry decimals in columns stored as integers
+                value = round(float(value))
+            values[name] = model_field.clean(value, None)
+        except (TypeError, ValueError):
+            errors[name] = 'A number is required.'
+        except ValidationError as error:
+            errors[name] = ' '.join(error.messages)
+        else:
+            if name != 'is_meal' and name != 'name' and values[name] < 0:
+                errors[name] = 'Must not be negative.'
+    return external_id, values, errors
+
+
+def clean_recipe_row(row):
+    """Returns (meal reference, ingredient reference, quantity, {field: error})."""
+    errors = {}
+    refs = []
+    for name in ('meal', 'ingredient'):
+        value = row.get(name)
+        if _is_blank(value):
+            errors[name] = 'This field is required.'
+        refs.append('' if _is_blank(value) else str(value).strip())
+    quantity = None
+    try:
+        quantity = float(row.get('quantity'))
+    except (TypeError, ValueError):
+        errors['quantity'] = 'A number is required.'
+    else:
+        if not quantity > 0:
+            errors['quantity'] = 'Must be positive.'
+    return refs[0], refs[1], quantity, errors
+
+
+def import_items(path, chunk_size=CHUNK_SIZE):
+    report = ImportReport()
+    started = perf_counter()
+    for chunk in chunked(read_rows(path), chunk_size):
+        items = {}
+        for line_number, row in chunk:
+            report.rows += 1
+            if row is None:
+                report.add_error(Path(path).name, line_number, {'row': 'Malformed row.'})
+                continue
+            external_id, values, errors = clean_item_row(row)
+            if errors:
+                report.add_error(Path(path).name, line_number, errors)
+                continue
+            # A later row of the same chunk wins, as one upsert cannot touch a row twice on PostgreSQL
+            items[external_id] = Item(external_id=external_id, **values)
+        Item.objects.bulk_create(
+            items.values(), update_conflicts=True, unique_fields=['external_id'], update_fields=ITEM_FIELDS,
+        )
+        report.imported += len(items)
+    report.elapsed = perf_counter() - started
+    return report
+
+
+def resolve_references(refs):
+    """Maps each reference to (item_id, is_meal), by external_id first and then by unique name."""
+    resolved = {
+        external_id: (item_id, is_meal)
+        for external_id, item_id, is_meal in Item.objects.filter(external_id__in=refs).values_list('external_id', 'item_id', 'is_meal')
+    }
+    by_name = {}
+    ambiguous = set()
+    for name, item_id, is_meal in Item.objects.filter(name__in=refs - resolved.keys()).values_list('name', 'item_id', 'is_meal'):
+        if name in by_name:
+            ambiguous.add(name)
+        by_name[name] = (item_id, is_meal)
+    for name in ambiguous:
+        del by_name[name]
+    return {**by_name, **resolved}, ambiguous
+
+
+def import_recipes(path, chunk_size=CHUNK_SIZE):
+    """Loads recipe rows and returns the report and the ids of the meals they describe."""
+    report = ImportReport()
+    meal_ids = set()
+    started = perf_counter()
+    for chunk in chunked(read_rows(path), chunk_size):
+        rows = []
+        for line_number, row in chunk:
+            report.rows += 1
+            if row is None:
+                report.add_error(Path(path).name, line_number, {'row': 'Malformed row.'})
+                continue
+            meal_ref, ingredient_ref, quantity, errors = clean_recipe_row(row)
+            if errors:
+                report.add_error(Path(path).name, line_number, errors)
+                continue
+            rows.append((line_number, meal_ref, ingredient_ref, quantity))
+
+        items, ambiguous = resolve_references({ref for _, meal_ref, ingredient_ref, _ in rows for ref in (meal_ref, ingredient_ref)})
+        recipes = []
+        for line_number, meal_ref, ingredient_ref, quantity in rows:
+            errors = {}
+            for name, ref in (('meal', meal_ref), ('ingredient', ingredient_ref)):
+                if ref in ambiguous:
+                    errors[name] = f"Several items are named '{ref}', use the external_id."
+                elif ref not in items:
+                    errors[name] = f"Unknown item '{ref}'."
+            if 'meal' not in errors and not items[meal_ref][1]:
+                errors['meal'] = 'Item is not a meal.'
+            if not errors and items[meal_ref][0] == items[ingredient_ref][0]:
+                errors['ingredient'] = 'A meal cannot contain itself.'
+            if errors:
+                report.add_error(Path(path).name, line_number, errors)
+                continue
+            recipes.append(Recipe(meal_id=items[meal_ref][0], ingredient_id=items[ingredient_ref][0], quantity=quantity))
+
+        # The first chunk naming a meal replaces the recipe it had before the import
+        new_meal_ids = {recipe.meal_id for recipe in recipes} - meal_ids
+        Recipe.objects.filter(meal_id__in=new_meal_ids).delete()
+        meal_ids |= new_meal_ids
+        Recipe.objects.bulk_create(recipes)
+        report.imported += len(recipes)
+    report.elapsed = perf_counter() - started
+    return report, meal_ids
+
+
+def refresh_requirements(meal_ids):
+    meal_ids = sorted(meal_ids)
+    for start in range(0, len(meal_ids), UPDATE_CHUNK_SIZE):
+        chunk = meal_ids[start:start + UPDATE_CHUNK_SIZE]
+        MealRequirement.objects.filter(meal_id__in=chunk).delete()
+        totals = Recipe.objects.filter(meal_id__in=chunk).values('meal', 'ingredient').annotate(total=Sum('quantity')).order_by()
+        MealRequirement.objects.bulk_create(
+            MealRequirement(meal_id=row['meal'], ingredient_id=row['ingredient'], quantity=row['total']) for row in totals
+        )
+
+
+def get_meal_levels():
+    """Groups the meals with requirements so each group only uses meals of earlier groups.
+
+    Returns the groups and the meals left out because they are in, or depend on, a cycle.
+    """
+    meal_ids = set(MealRequirement.objects.values_list('meal', flat=True).distinct())
+    pending = dict.fromkeys(meal_ids, 0)
+    parents = {}
+    for meal_id, ingredient_id in MealRequirement.objects.filter(ingredient__in=meal_ids).values_list('meal', 'ingredient'):
+        pending[meal_id] += 1
+        parents.setdefault(ingredient_id, []).append(meal_id)
+
+    levels = []
+    level = [meal_id for meal_id, count in pending.items() if not count]
+    while level:
+        levels.append(level)
+        next_level = []
+        for meal_id in level:
+            for parent_id in parents.get(meal_id, ()):
+                pending[parent_id] -= 1
+                if not pending[parent_id]:
+                    next_level.append(parent_id)
+        level = next_level
+    return levels, {meal_id for meal_id, count in pending.items() if count}
+
+
+def _total(expression):
+    return Subquery(
+        MealRequirement.objects.filter(meal=OuterRef('pk')).values('meal')
+        .annotate(total=Sum(expression, output_field=FloatField())).values('total')
+    )
+
+
+def rollup_meal_nutrition():
+    """Recomputes every meal's nutrition from its requirements; returns the number of meals."""
+    quantity = Cast('quantity', FloatField())
+    totals = {'serving_weight': _total(quantity)}
+    for name in NUTRIENT_FIELDS:
+        totals[name] = _total(Case(
+            When(ingredient__serving_weight__gt=0,
+                 then=quantity * Cast(f'ingredient__{name}', FloatField()) / F('ingredient__serving_weight')),
+            default=Value(0.0),
+        ))
+    updates = {
+        name: Cast(Round(total), IntegerField()) if name in INTEGER_FIELDS else total
+        for name, total in totals.items()
+    }
+
+    levels, cyclic = get_meal_levels()
+    if cyclic:
+        raise CatalogFormatError(f'Recipe cycle through the meals {sorted(cyclic)[:10]}.')
+    for level in levels:
+        for start in range(0, len(level), UPDATE_CHUNK_SIZE):
+            Item.objects.filter(pk__in=level[start:start + UPDATE_CHUNK_SIZE]).update(**updates)
+    return sum(map(len, levels))
+
+
+def import_catalog(items_path=None, recipes_path=None, chunk_size=CHUNK_SIZE):
+    """Runs the whole import in one transaction; returns (items report, recipes report, meals rolled up)."""
+    with transaction.atomic():
+        items_report = import_items(items_path, chunk_size) if items_path else None
+        recipes_report, meal_ids = import_recipes(recipes_path, chunk_size) if recipes_path else (None, set())
+        refresh_requirements(meal_ids)
+        meal_count = rollup_meal_nutrition()
+        meal_ids = sorted(meal_ids)
+        for start in range(0, len(meal_ids), UPDATE_CHUNK_SIZE):
+            recipe_graph.invalidate(meal_ids[start:start + UPDATE_CHUNK_SIZE])
+        bump_catalog_version()
+        pin_catalog_to_primary()
+    return items_report, recipes_report, meal_count
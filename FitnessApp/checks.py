@@ -0,0 +1,17 @@
+# checks.py
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+from .caching import is_process_local
+
+
+@register(Tags.caches, deploy=True)
+def check_auth_cache_is_shared(app_configs, **kwargs):
+    if getattr(settings, 'FITNESSAPP_AUTH_CACHE_TIMEOUT', 60) and is_process_local():
+        return [Warning(
+            'CachedJWTAuthentication uses a process-local cache, so deactivating a user or changing '
+            'a password only takes effect in the other workers after FITNESSAPP_AUTH_CACHE_TIMEOUT seconds.',
+            hint='Point FITNESSAPP_CACHE_ALIAS at a shared cache backend, or set FITNESSAPP_AUTH_CACHE_TIMEOUT = 0.',
+            id='FitnessApp.W001',
+        )]
+    return []
@@ -0,0 +1,83 @@
+# fast_serializers.py
+"""Read-only list serialization straight from .values() rows.
+
+ModelSerializer builds its fields by introspection and calls to_representation field by field
+for every object. ValuesSerializer compiles a ModelSerializer's fields once into
+(name, column, converter) accessors. Fields whose database value already is their JSON
+representation (integers, floats, booleans, strings, choices and primary-key relations) need
+no converter, so rows of a .values() queryset are returned as they come. Other fields go
+through the serializer field's own to_representation, which keeps the output identical.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models
+from rest_framework import serializers
+from rest_framework.response import Response
+
+# Serializer field type -> model field types whose values it renders unchanged
+PASSTHROUGH_FIELDS = {
+    serializers.IntegerField: (models.IntegerField, models.AutoField),
+    serializers.FloatField: (models.FloatField,),
+    serializers.BooleanField: (models.BooleanField,),
+    serializers.ChoiceField: (models.CharField,),
+    serializers.CharField: (models.CharField, models.TextField),
+    serializers.PrimaryKeyRelatedField: (models.ForeignKey, models.OneToOneField),
+}
+
+
+class ValuesSerializer:
+    _compiled = {}
+
+    def __init__(self, serializer_class):
+        model = serializer_class.Meta.model
+        self.columns = []
+        self.converters = []
+        for name, field in serializer_class().fields.items():
+            if field.write_only:
+                continue
+            if len(field.source_attrs) != 1:
+                raise ImproperlyConfigured(f'{serializer_class.__name__}.{name} does not map to a single column.')
+            column = field.source_attrs[0]
+            if column != name:
+                raise ImproperlyConfigured(f'{serializer_class.__name__}.{name} is renamed from {column}.')
+            model_field = model._meta.get_field(column)
+            self.columns.append(column)
+            if not self._is_passthrough(field, model_field):
+                self.converters.append((name, field.to_representation))
+
+    @classmethod
+    def for_serializer(cls, serializer_class):
+        if serializer_class not in cls._compiled:
+            cls._compiled[serializer_class] = cls(serializer_class)
+        return cls._compiled[serializer_class]
+
+    @staticmethod
+    def _is_passthrough(field, model_field):
+        if isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is not None:
+            return False
+        for field_class, model_field_classes in PASSTHROUGH_FIELDS.items():
+            if type(field) is field_class:
+                return isinstance(model_field, model_field_classes)
+        return False
+
+    def values(self, queryset):
+        return queryset.values(*self.columns)
+
+    def to_representation(self, rows):
+        rows = list(rows)
+        for name, convert in self.converters:
+            for row in rows:
+                if row[name] is not None:
+                    row[name] = convert(row[name])
+        return rows
+
+
+class FastListMixin:
+    """Replaces ListModelMixin.list() with .values() rows compiled from the serializer class."""
+
+    def list(self, request, *args, **kwargs):
+        serializer = ValuesSerializer.for_serializer(self.get_serializer_class())
+        queryset = serializer.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serializer.to_representation(page))
+        return Response(serializer.to_representation(queryset))
@@ -0,0 +1,81 @@
+import json
+import random
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment
+
+from FitnessApp.benchmarking import SCALES, compare, get_scenarios, run_scenarios, seed
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json'
+
+
+class Command(BaseCommand):
+    help = 'Seeds synthetic data, benchmarks every API route and compares the results with a stored baseline.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=sorted(SCALES), default='default')
+        parser.add_argument('--requests', type=int, help='Requests per scenario, overriding the scale default.')
+        parser.add_argument('--only', nargs='+', metavar='SCENARIO', help='Run only these scenarios.')
+        parser.add_argument('--baseline', type=Path, default=DEFAULT_BASELINE)
+        parser.add_argument('--write-baseline', action='store_true', help='Store the results as the new baseline.')
+        parser.add_argument('--tolerance', type=float, default=0.5, help='Allowed p95 slowdown as a fraction of the baseline.')
+        parser.add_argument('--output', type=Path, help='Also write the results as JSON to this file.')
+        parser.add_argument(
+            '--current-db', action='store_true',
+            help='Seed the configured database instead of a throwaway test database. Leaves the synthetic data behind.',
+        )
+
+    def handle(self, *args, **options):
+        scale = SCALES[options['scale']]
+        scenarios = get_scenarios()
+        if options['only']:
+            scenarios = [scenario for scenario in scenarios if scenario.name in options['only']]
+
+        try:
+            setup_test_environment()
+        except RuntimeError:
+            pass  # Already set up, e.g. when called from the test suite
+
+        old_name = None
+        if not options['current_db']:
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.stdout.write(f"Seeding '{options['scale']}' dataset...")
+            dataset = seed(scale, random.Random(0))
+            results = run_scenarios(dataset, scenarios, options['requests'] or scale['requests'])
+        finally:
+            if old_name is not None:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.report(results)
+        document = {'scale': options['scale'], 'results': results}
+        if options['output']:
+            options['output'].write_text(json.dumps(document, indent=2, sort_keys=True) + '\n')
+        if options['write_baseline']:
+            options['baseline'].parent.mkdir(parents=True, exist_ok=True)
+            options['baseline'].write_text(json.dumps(document, indent=2, sort_keys=True) + '\n')
+            self.stdout.write(f"Baseline written to {options['baseline']}")
+            return
+
+        if not options['baseline'].exists():
+            self.stdout.write(f"No baseline at {options['baseline']}, skipping comparison.")
+            return
+        baseline = json.loads(options['baseline'].read_text())
+        if baseline['scale'] != options['scale']:
+            raise CommandError(f"Baseline was recorded at scale '{baseline['scale']}', not '{options['scale']}'.")
+
+        regressions = compare(results, baseline['results'], options['tolerance'])
+        if regressions:
+            raise CommandError('Performance regressions:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
+
+    def report(self, results):
+        self.stdout.write(f"{'scenario':<20}{'route':<24}{'reqs':>6}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}{'peak KB':>10}{'errors':>8}")
+        for name, row in results.items():
+            self.stdout.write(
+                f"{name:<20}{row['route']:<24}{row['requests']:>6}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}"
+                f"{row['p99_ms']:>9.1f}{row['queries']:>9}{row['peak_kb']:>10.0f}{row['errors']:>8}"
+            )
@@ -0,0 +1,50 @@
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment
+
+from FitnessApp.benchmarking import CONCURRENCY_ENDPOINTS, SCALES, build_load, run_asgi_load, run_wsgi_load, seed
+from FitnessApp.caching import get_cache
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares throughput of the sync read endpoints under the WSGI handler with their /async/ '
+        'variants under the ASGI handler, at a fixed number of concurrent clients.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=sorted(SCALES), default='smoke')
+        parser.add_argument('--concurrency', type=int, default=32, help='Requests in flight at once.')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint and mode.')
+        parser.add_argument('--only', nargs='+', choices=sorted(CONCURRENCY_ENDPOINTS), metavar='ENDPOINT')
+
+    def handle(self, *args, **options):
+        try:
+            setup_test_environment()
+        except RuntimeError:
+            pass  # Already set up, e.g. when called from the test suite
+
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.stdout.write(f"Seeding '{options['scale']}' dataset...")
+            dataset = seed(SCALES[options['scale']], random.Random(0))
+            results = []
+            # The async views have no response cache; disable it so both modes do the same work
+            with override_settings(FITNESSAPP_CACHE_TIMEOUT=0):
+                for endpoint in options['only'] or CONCURRENCY_ENDPOINTS:
+                    load = build_load(dataset, endpoint, options['requests'])
+                    get_cache().clear()
+                    results.append((endpoint, 'wsgi', run_wsgi_load(load, options['concurrency'])))
+                    get_cache().clear()
+                    results.append((endpoint, 'asgi', run_asgi_load(load, options['concurrency'])))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write(f"{'endpoint':<18}{'mode':<6}{'reqs':>6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'errors':>8}")
+        for endpoint, mode, row in results:
+            self.stdout.write(
+                f"{endpoint:<18}{mode:<6}{row['requests']:>6}{row['throughput']:>9.1f}{row['p50_ms']:>9.1f}"
+                f"{row['p95_ms']:>9.1f}{row['errors']:>8}"
+            )
@@ -0,0 +1,80 @@
+import random
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment
+
+from FitnessApp.benchmarking import SCALES, build_write_load, run_write_load, seed
+from FitnessApp.caching import get_cache
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures /actions/ write throughput with parallel writers on the configured database profile. '
+        "On SQLite the tuned profile (WAL, synchronous=NORMAL, busy timeout, BEGIN IMMEDIATE) is compared "
+        "with Django's defaults."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=sorted(SCALES), default='smoke')
+        parser.add_argument('--writers', type=int, nargs='+', default=[1, 8, 32], help='Parallel writer counts to run.')
+        parser.add_argument('--requests', type=int, default=400, help='Writes per run.')
+
+    def handle(self, *args, **options):
+        try:
+            setup_test_environment()
+        except RuntimeError:
+            pass  # Already set up, e.g. when called from the test suite
+
+        results = []
+        for profile, settings_dict, pragmas in self.get_profiles():
+            with self.database(settings_dict, pragmas):
+                self.stdout.write(f"Seeding '{options['scale']}' dataset for {profile}...")
+                dataset = seed(SCALES[options['scale']], random.Random(0))
+                for writers in options['writers']:
+                    get_cache().clear()
+                    load = build_write_load(dataset, options['requests'])
+                    results.append((profile, writers, run_write_load(load, writers)))
+
+        self.stdout.write(f"{'profile':<22}{'writers':>8}{'reqs':>6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'errors':>8}")
+        for profile, writers, row in results:
+            self.stdout.write(
+                f"{profile:<22}{writers:>8}{row['requests']:>6}{row['throughput']:>9.1f}{row['p50_ms']:>9.1f}"
+                f"{row['p95_ms']:>9.1f}{row['errors']:>8}"
+            )
+
+    @staticmethod
+    def get_profiles():
+        """Returns [(label, settings_dict overrides, SQLite pragmas)] to run."""
+        settings_dict = connection.settings_dict
+        if connection.vendor != 'sqlite':
+            pool = settings_dict['OPTIONS'].get('pool')
+            label = 'postgresql pool' if pool else f"postgresql age={settings_dict['CONN_MAX_AGE']}"
+            return [(label, {}, {})]
+        options = {key: value for key, value in settings_dict['OPTIONS'].items() if key != 'transaction_mode'}
+        return [
+            ('sqlite default', {'OPTIONS': options}, {}),
+            ('sqlite tuned', {}, None),
+        ]
+
+    @contextmanager
+    def database(self, overrides, pragmas):
+        # A fresh test database per profile; SQLite needs a file so each writer thread gets its own connection
+        settings_dict = connection.settings_dict
+        saved = {key: settings_dict[key] for key in overrides}
+        saved_test_name = settings_dict['TEST'].get('NAME')
+        settings_dict.update(overrides)
+        pragma_settings = {} if pragmas is None else {'FITNESSAPP_SQLITE_PRAGMAS': pragmas}
+        with tempfile.TemporaryDirectory() as directory, override_settings(**pragma_settings):
+            if connection.vendor == 'sqlite':
+                settings_dict['TEST']['NAME'] = str(Path(directory) / 'benchmark.sqlite3')
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                yield
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                settings_dict.update(saved)
+                settings_dict['TEST']['NAME'] = saved_test_name
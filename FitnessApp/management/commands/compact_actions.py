@@ -0,0 +1,43 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from FitnessApp.models import PantrySnapshot
+
+
+class Command(BaseCommand):
+    help = (
+        'Folds Action rows older than --keep-days into per-user pantry snapshots and deletes them. '
+        'Pantry balances and daily nutrition totals are unchanged; the eaten-food history of the folded rows is dropped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-days', type=int, default=365, help='Keep the actions logged in the last N days (default 365).')
+        parser.add_argument('--min-actions', type=int, default=1000, help='Skip users with fewer foldable actions (default 1000).')
+        parser.add_argument('--user', help='Only process the user with this username.')
+
+    def handle(self, *args, **options):
+        if options['keep_days'] < 0:
+            raise CommandError('--keep-days must not be negative.')
+        before = timezone.now() - timedelta(days=options['keep_days'])
+
+        users = User.objects.order_by('pk')
+        if options['user']:
+            users = users.filter(username=options['user'])
+            if not users.exists():
+                raise CommandError(f"User '{options['user']}' does not exist.")
+
+        total = 0
+        for user in users.iterator():
+            with transaction.atomic():
+                up_to = PantrySnapshot.get_compaction_point(user, before)
+                if up_to is None or user.action_set.filter(action_id__lte=up_to).count() < options['min_actions']:
+                    continue
+                snapshot, folded = PantrySnapshot.compact(user, up_to)
+            total += folded
+            self.stdout.write(f'{user.username}: folded {folded} actions into {snapshot.entries.count()} snapshot rows')
+
+        self.stdout.write(self.style.SUCCESS(f'Compacted {total} actions.'))
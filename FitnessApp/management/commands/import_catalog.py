@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from FitnessApp import recipe_graph
+from FitnessApp.caching import is_process_local
+from FitnessApp.catalog_import import CHUNK_SIZE, CatalogFormatError, import_catalog
+
+
+class Command(BaseCommand):
+    help = (
+        'Imports Item and Recipe rows from CSV or JSONL files in chunks. Items are upserted on '
+        'external_id; recipe rows reference items by external_id or unique name and replace the '
+        "recipes of the meals they name. Meal nutrition is recomputed at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', help='CSV/JSONL file of items.')
+        parser.add_argument('--recipes', help='CSV/JSONL file of meal, ingredient, quantity rows.')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help=f'Rows per chunk (default {CHUNK_SIZE}).')
+
+    def handle(self, *args, **options):
+        if not options['items'] and not options['recipes']:
+            raise CommandError('Pass --items and/or --recipes.')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive.')
+        if is_process_local():
+            self.stderr.write(self.style.WARNING(
+                'The FITNESSAPP_CACHE_ALIAS cache is process-local, so running servers will not see this '
+                'invalidation: they keep cached responses for up to FITNESSAPP_CACHE_TIMEOUT seconds and '
+                f'flattened recipes for up to {recipe_graph.CACHE_TIMEOUT} seconds. Use a shared cache or restart them.'
+            ))
+
+        try:
+            items_report, recipes_report, meal_count = import_catalog(options['items'], options['recipes'], options['chunk_size'])
+        except (CatalogFormatError, OSError) as error:
+            raise CommandError(f'Import rolled back: {error}')
+
+        for label, report in (('items', items_report), ('recipes', recipes_report)):
+            if report is None:
+                continue
+            self.stdout.write(
+                f'{label}: {report.rows} rows, {report.imported} imported, {report.invalid} invalid '
+                f'in {report.elapsed:.1f} s ({report.rows_per_second:.0f} rows/s)'
+            )
+            for error in report.errors:
+                self.stdout.write(f'  {error}')
+            if report.invalid > len(report.errors):
+                self.stdout.write(f'  ... {report.invalid - len(report.errors)} more invalid rows')
+        self.stdout.write(self.style.SUCCESS(f'Recomputed nutrition of {meal_count} meals.'))
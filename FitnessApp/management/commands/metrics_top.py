@@ -0,0 +1,49 @@
+import os
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand
+
+from FitnessApp.metrics import parse_prometheus, registry, summarize
+
+SORT_KEYS = {
+    'p95': 'p95',
+    'p99': 'p99',
+    'queries': 'avg_queries',
+    'db': 'avg_db_time',
+    'serialization': 'avg_serialization',
+    'requests': 'requests',
+}
+
+
+class Command(BaseCommand):
+    help = 'Lists the slowest or most query-heavy endpoints recorded by MetricsMiddleware.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Metrics endpoint of a running server; defaults to this process.')
+        parser.add_argument(
+            '--token', default=os.environ.get('FITNESSAPP_METRICS_TOKEN'),
+            help="Access token of a staff user, sent with --url (default: $FITNESSAPP_METRICS_TOKEN).",
+        )
+        parser.add_argument('--sort', choices=sorted(SORT_KEYS), default='p95')
+        parser.add_argument('--limit', type=int, default=10)
+
+    def handle(self, *args, **options):
+        if options['url']:
+            headers = {'Authorization': f"Bearer {options['token']}"} if options['token'] else {}
+            with urlopen(Request(options['url'], headers=headers)) as response:
+                snapshot = parse_prometheus(response.read().decode())
+        else:
+            snapshot = registry.snapshot()
+
+        rows = sorted(summarize(snapshot), key=lambda row: row[SORT_KEYS[options['sort']]], reverse=True)
+        if not rows:
+            self.stdout.write('No requests recorded.')
+            return
+
+        self.stdout.write(f"{'view':<28}{'requests':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}{'db ms':>9}{'ser ms':>9}")
+        for row in rows[:options['limit']]:
+            self.stdout.write(
+                f"{row['view']:<28}{row['requests']:>9}{row['p50'] * 1000:>9.1f}{row['p95'] * 1000:>9.1f}"
+                f"{row['p99'] * 1000:>9.1f}{row['avg_queries']:>9.1f}{row['avg_db_time'] * 1000:>9.1f}"
+                f"{row['avg_serialization'] * 1000:>9.1f}"
+            )
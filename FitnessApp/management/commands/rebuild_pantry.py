@@ -0,0 +1,60 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from FitnessApp.caching import bump_user_version, is_process_local
+from FitnessApp.models import Action, PantryItem
+
+TOLERANCE = 1e-6
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the materialized pantry from the Action log, or verifies it with --verify.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only process the user with this username.')
+        parser.add_argument('--verify', action='store_true', help='Report mismatches without writing anything.')
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('pk')
+        if options['user']:
+            users = users.filter(username=options['user'])
+            if not users.exists():
+                raise CommandError(f"User '{options['user']}' does not exist.")
+
+        if not options['verify'] and is_process_local():
+            self.stderr.write(self.style.WARNING(
+                'The FITNESSAPP_CACHE_ALIAS cache is process-local, so running servers keep cached pantry '
+                'responses for up to FITNESSAPP_CACHE_TIMEOUT seconds. Use a shared cache or restart them.'
+            ))
+
+        mismatched_users = 0
+        for user in users.iterator():
+            if options['verify']:
+                mismatches = self.verify_user(user)
+                if mismatches:
+                    mismatched_users += 1
+                    for item_id, expected, stored in mismatches:
+                        self.stdout.write(f'{user.username}: item {item_id} expected {expected}, stored {stored}')
+            else:
+                with transaction.atomic():
+                    balances = PantryItem.rebuild_for_user(user)
+                    bump_user_version(user.pk)
+                self.stdout.write(f'{user.username}: rebuilt {len(balances)} pantry rows')
+
+        if mismatched_users:
+            raise CommandError(f'Pantry mismatch for {mismatched_users} user(s).')
+        if options['verify']:
+            self.stdout.write(self.style.SUCCESS('Pantry matches the Action log.'))
+
+    def verify_user(self, user):
+        expected = Action.get_balances(user)
+        stored = dict(PantryItem.objects.filter(user=user).values_list('item_id', 'quantity'))
+
+        mismatches = []
+        for item_id in sorted(expected.keys() | stored.keys()):
+            expected_quantity = expected.get(item_id, 0)
+            stored_quantity = stored.get(item_id, 0)
+            if abs(expected_quantity - stored_quantity) > TOLERANCE:
+                mismatches.append((item_id, expected_quantity, stored_quantity))
+        return mismatches
@@ -0,0 +1,178 @@
+# metrics.py
+"""In-process request metrics, exported in the Prometheus text format.
+
+MetricsMiddleware records, per URL name, the request latency, the number and total time of
+database queries and the response rendering (serialization) time into fixed-bucket
+histograms. Each worker process keeps its own registry and /metrics/ is answered by whichever
+worker takes the request, so a scrape reports that one worker's numbers, not the server's;
+run a single worker or scrape each worker separately to see everything.
+Recording is a few dict lookups under a lock, and FITNESSAPP_METRICS['SAMPLE_RATE'] can
+thin it out further.
+"""
+import re
+import threading
+from bisect import bisect_left
+
+from django.conf import settings
+
+DEFAULT_CONFIG = {
+    'ENABLED': True,
+    'SAMPLE_RATE': 1.0,
+}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 1000)
+
+HISTOGRAMS = {
+    'request_duration_seconds': ('Request latency in seconds.', LATENCY_BUCKETS),
+    'db_queries': ('Database queries issued per request.', QUERY_COUNT_BUCKETS),
+    'db_duration_seconds': ('Time spent in database queries per request.', LATENCY_BUCKETS),
+    'serialization_duration_seconds': ('Time spent rendering the response body.', LATENCY_BUCKETS),
+}
+PREFIX = 'fitnessapp_'
+
+
+def get_config():
+    return {**DEFAULT_CONFIG, **getattr(settings, 'FITNESSAPP_METRICS', {})}
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.responses = {}
+
+    def observe(self, view, method, status_code, values):
+        with self.lock:
+            key = (view, method, str(status_code))
+            self.responses[key] = self.responses.get(key, 0) + 1
+            for name, value in values.items():
+                histogram = self.histograms.get((name, view))
+                if histogram is None:
+                    histogram = self.histograms[(name, view)] = Histogram(HISTOGRAMS[name][1])
+                histogram.observe(value)
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.responses.clear()
+
+    def snapshot(self):
+        """Returns {view: {histogram name: {'buckets': [(le, cumulative)], 'sum': .., 'count': ..}}}."""
+        with self.lock:
+            result = {}
+            for (name, view), histogram in self.histograms.items():
+                result.setdefault(view, {})[name] = {
+                    'buckets': histogram.cumulative(),
+                    'sum': histogram.sum,
+                    'count': histogram.count,
+                }
+            return result
+
+    def render_prometheus(self):
+        snapshot = self.snapshot()
+        with self.lock:
+            responses = dict(self.responses)
+
+        lines = [
+            f'# HELP {PREFIX}responses_total Responses by URL name, method and status.',
+            f'# TYPE {PREFIX}responses_total counter',
+        ]
+        for (view, method, status_code), count in sorted(responses.items()):
+            lines.append(f'{PREFIX}responses_total{{view="{view}",method="{method}",status="{status_code}"}} {count}')
+
+        for name, (description, _) in HISTOGRAMS.items():
+            lines.append(f'# HELP {PREFIX}{name} {description}')
+            lines.append(f'# TYPE {PREFIX}{name} histogram')
+            for view in sorted(snapshot):
+                histogram = snapshot[view].get(name)
+                if histogram is None:
+                    continue
+                for bound, count in histogram['buckets']:
+                    le = '+Inf' if bound == float('inf') else repr(float(bound))
+                    lines.append(f'{PREFIX}{name}_bucket{{view="{view}",le="{le}"}} {count}')
+                lines.append(f'{PREFIX}{name}_sum{{view="{view}"}} {histogram["sum"]!r}')
+                lines.append(f'{PREFIX}{name}_count{{view="{view}"}} {histogram["count"]}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+SAMPLE_RE = re.compile(r'^' + PREFIX + r'(\w+?)_(bucket|sum|count)\{view="([^"]*)"(?:,le="([^"]+)")?\} (\S+)$')
+
+
+def parse_prometheus(text):
+    """Parses the histograms of render_prometheus() output back into a snapshot."""
+    snapshot = {}
+    for line in text.splitlines():
+        match = SAMPLE_RE.match(line)
+        if not match or match.group(1) not in HISTOGRAMS:
+            continue
+        name, kind, view, le, value = match.groups()
+        histogram = snapshot.setdefault(view, {}).setdefault(name, {'buckets': [], 'sum': 0.0, 'count': 0})
+        if kind == 'bucket':
+            histogram['buckets'].append((float(le), int(float(value))))
+        elif kind == 'sum':
+            histogram['sum'] = float(value)
+        else:
+            histogram['count'] = int(float(value))
+    return snapshot
+
+
+def quantile(histogram, q):
+    """Estimates a quantile from cumulative buckets by linear interpolation, like histogram_quantile()."""
+    count = histogram['count']
+    if not count:
+        return 0.0
+    rank = q * count
+    lower_bound, lower_count = 0.0, 0
+    for bound, cumulative in histogram['buckets']:
+        if cumulative >= rank:
+            if bound == float('inf'):
+                return lower_bound
+            if cumulative == lower_count:
+                return bound
+            return lower_bound + (bound - lower_bound) * (rank - lower_count) / (cumulative - lower_count)
+        lower_bound, lower_count = bound, cumulative
+    return lower_bound
+
+
+def summarize(snapshot):
+    rows = []
+    for view, histograms in snapshot.items():
+        latency = histograms.get('request_duration_seconds')
+        if not latency or not latency['count']:
+            continue
+        requests = latency['count']
+        rows.append({
+            'view': view,
+            'requests': requests,
+            'p50': quantile(latency, 0.50),
+            'p95': quantile(latency, 0.95),
+            'p99': quantile(latency, 0.99),
+            'avg_queries': histograms.get('db_queries', {}).get('sum', 0) / requests,
+            'avg_db_time': histograms.get('db_duration_seconds', {}).get('sum', 0) / requests,
+            'avg_serialization': histograms.get('serialization_duration_seconds', {}).get('sum', 0) / requests,
+        })
+    return rows
@@ -0,0 +1,95 @@
+# middleware.py
+import random
+from contextlib import ExitStack
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+
+from .metrics import get_config, registry
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += perf_counter() - started
+
+
+class MetricsMiddleware:
+    """Records latency, DB and serialization metrics per URL name, see metrics.py.
+
+    Works in both handler modes so async views under ASGI are not pushed onto a thread.
+    Database connections are per thread, so queries an async view runs in the async ORM's
+    worker thread are not counted.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        config = get_config()
+        if not config['ENABLED'] or random.random() >= config['SAMPLE_RATE']:
+            return self.get_response(request)
+
+        queries = QueryRecorder()
+        request._metrics_serialization = 0.0
+        started = perf_counter()
+        with self.record_queries(queries):
+            response = self.get_response(request)
+        self.observe(request, response, perf_counter() - started, queries)
+        return response
+
+    async def __acall__(self, request):
+        config = get_config()
+        if not config['ENABLED'] or random.random() >= config['SAMPLE_RATE']:
+            return await self.get_response(request)
+
+        queries = QueryRecorder()
+        request._metrics_serialization = 0.0
+        started = perf_counter()
+        with self.record_queries(queries):
+            response = await self.get_response(request)
+        self.observe(request, response, perf_counter() - started, queries)
+        return response
+
+    @staticmethod
+    def record_queries(queries):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(queries))
+        return stack
+
+    @staticmethod
+    def observe(request, response, duration, queries):
+        view = request.resolver_match.url_name if request.resolver_match else 'unresolved'
+        registry.observe(view or 'unnamed', request.method, response.status_code, {
+            'request_duration_seconds': duration,
+            'db_queries': queries.count,
+            'db_duration_seconds': queries.duration,
+            'serialization_duration_seconds': request._metrics_serialization,
+        })
+
+    def process_template_response(self, request, response):
+        # DRF responses render lazily after the view returns; time that rendering pass
+        if hasattr(request, '_metrics_serialization'):
+            started = perf_counter()
+
+            def record(rendered):
+                request._metrics_serialization = perf_counter() - started
+
+            response.add_post_render_callback(record)
+        return response
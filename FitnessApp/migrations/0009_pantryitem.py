@@ -0,0 +1,50 @@
+# Generated by Django 5.1.3 on 2026-10-18 07:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def populate_pantry(apps, schema_editor):
+    Action = apps.get_model('FitnessApp', 'Action')
+    PantryItem = apps.get_model('FitnessApp', 'PantryItem')
+
+    balances = {}
+    added = Action.objects.filter(action_type__in=['ADD', 'COOK']).values('user', 'item').annotate(total=Sum('quantity'))
+    for row in added:
+        key = (row['user'], row['item'])
+        balances[key] = balances.get(key, 0) + row['total']
+    consumed = Action.objects.filter(action_type__in=['EAT', 'DISPOSE', 'COOK']).values('user', 'ingredient').annotate(total=Sum('quantity'))
+    for row in consumed:
+        key = (row['user'], row['ingredient'])
+        balances[key] = balances.get(key, 0) - row['total']
+
+    PantryItem.objects.bulk_create(
+        PantryItem(user_id=user_id, item_id=item_id, quantity=quantity)
+        for (user_id, item_id), quantity in balances.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('FitnessApp', '0008_usersettings'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PantryItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.FloatField(default=0.0)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pantry_items', to='FitnessApp.item')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pantry_items', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'item'), name='unique_pantry_item')],
+            },
+        ),
+        migrations.RunPython(populate_pantry, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.3 on 2026-10-18 07:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def populate_requirements(apps, schema_editor):
+    Recipe = apps.get_model('FitnessApp', 'Recipe')
+    MealRequirement = apps.get_model('FitnessApp', 'MealRequirement')
+
+    totals = Recipe.objects.values('meal', 'ingredient').annotate(total=Sum('quantity')).order_by()
+    MealRequirement.objects.bulk_create(
+        (MealRequirement(meal_id=row['meal'], ingredient_id=row['ingredient'], quantity=row['total']) for row in totals),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('FitnessApp', '0009_pantryitem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MealRequirement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.FloatField()),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='required_by', to='FitnessApp.item')),
+                ('meal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='requirements', to='FitnessApp.item')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('meal', 'ingredient'), name='unique_meal_requirement')],
+            },
+        ),
+        migrations.RunPython(populate_requirements, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+from django.db import migrations
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE FitnessApp_item_fts USING fts5("
+    "name, content='FitnessApp_item', content_rowid='item_id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='1 2 3')",
+    "CREATE TRIGGER FitnessApp_item_fts_insert AFTER INSERT ON FitnessApp_item BEGIN "
+    "INSERT INTO FitnessApp_item_fts(rowid, name) VALUES (new.item_id, new.name); END",
+    "CREATE TRIGGER FitnessApp_item_fts_delete AFTER DELETE ON FitnessApp_item BEGIN "
+    "INSERT INTO FitnessApp_item_fts(FitnessApp_item_fts, rowid, name) VALUES ('delete', old.item_id, old.name); END",
+    "CREATE TRIGGER FitnessApp_item_fts_update AFTER UPDATE OF name ON FitnessApp_item BEGIN "
+    "INSERT INTO FitnessApp_item_fts(FitnessApp_item_fts, rowid, name) VALUES ('delete', old.item_id, old.name); "
+    "INSERT INTO FitnessApp_item_fts(rowid, name) VALUES (new.item_id, new.name); END",
+    "INSERT INTO FitnessApp_item_fts(FitnessApp_item_fts) VALUES ('rebuild')",
+]
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS FitnessApp_item_fts_update",
+    "DROP TRIGGER IF EXISTS FitnessApp_item_fts_delete",
+    "DROP TRIGGER IF EXISTS FitnessApp_item_fts_insert",
+    "DROP TABLE IF EXISTS FitnessApp_item_fts",
+]
+
+POSTGRESQL_FORWARD = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX "FitnessApp_item_name_trgm" ON "FitnessApp_item" USING gin (UPPER("name") gin_trgm_ops)',
+    'CREATE INDEX "FitnessApp_item_name_prefix" ON "FitnessApp_item" (UPPER("name") text_pattern_ops)',
+]
+POSTGRESQL_BACKWARD = [
+    'DROP INDEX IF EXISTS "FitnessApp_item_name_prefix"',
+    'DROP INDEX IF EXISTS "FitnessApp_item_name_trgm"',
+]
+
+GENERIC_FORWARD = ['CREATE INDEX FitnessApp_item_name_prefix ON FitnessApp_item (name)']
+GENERIC_BACKWARD = ['DROP INDEX FitnessApp_item_name_prefix ON FitnessApp_item']
+
+
+def get_statements(vendor, forward):
+    if vendor == 'sqlite':
+        return SQLITE_FORWARD if forward else SQLITE_BACKWARD
+    if vendor == 'postgresql':
+        return POSTGRESQL_FORWARD if forward else POSTGRESQL_BACKWARD
+    return GENERIC_FORWARD if forward else GENERIC_BACKWARD
+
+
+def create_search_index(apps, schema_editor):
+    for statement in get_statements(schema_editor.connection.vendor, forward=True):
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    for statement in get_statements(schema_editor.connection.vendor, forward=False):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('FitnessApp', '0010_mealrequirement'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
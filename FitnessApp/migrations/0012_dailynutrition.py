@@ -0,0 +1,55 @@
+# Generated by Django 5.1.3 on 2026-10-18 08:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def populate_daily_nutrition(apps, schema_editor):
+    Action = apps.get_model('FitnessApp', 'Action')
+    DailyNutrition = apps.get_model('FitnessApp', 'DailyNutrition')
+
+    days = {}
+    for action in Action.objects.filter(action_type='EAT').select_related('item').iterator():
+        item = action.item
+        if not item.serving_weight:
+            continue
+        ratio = action.quantity / item.serving_weight
+        totals = days.setdefault((action.user_id, timezone.localdate(action.timestamp)), dict.fromkeys(['calories', 'protein', 'carbs', 'fats'], 0.0))
+        totals['calories'] += item.calories * ratio
+        totals['protein'] += item.protein * ratio
+        totals['carbs'] += (item.carbs_sugar + item.carbs_fiber + item.carbs_starch) * ratio
+        totals['fats'] += (item.fats_saturated + item.fats_unsaturated) * ratio
+
+    DailyNutrition.objects.bulk_create(
+        (DailyNutrition(user_id=user_id, date=date, **totals) for (user_id, date), totals in days.items()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('FitnessApp', '0011_item_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyNutrition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('calories', models.FloatField(default=0.0)),
+                ('protein', models.FloatField(default=0.0)),
+                ('carbs', models.FloatField(default=0.0)),
+                ('fats', models.FloatField(default=0.0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_nutrition', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'date'), name='unique_daily_nutrition')],
+            },
+        ),
+        migrations.RunPython(populate_daily_nutrition, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.3 on 2026-10-18 08:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('FitnessApp', '0012_dailynutrition'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='action',
+            index=models.Index(fields=['user', 'action_type', 'timestamp'], name='action_user_type_time_idx'),
+        ),
+    ]
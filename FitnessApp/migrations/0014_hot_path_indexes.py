@@ -0,0 +1,27 @@
+# Generated by Django 5.1.3 on 2026-10-18 08:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('FitnessApp', '0013_action_user_type_time_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='action',
+            index=models.Index(fields=['user', 'timestamp'], name='action_user_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['meal', 'ingredient', 'quantity'], name='recipe_meal_ingr_qty_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['ingredient', 'meal', 'quantity'], name='recipe_ingr_meal_qty_idx'),
+        ),
+    ]
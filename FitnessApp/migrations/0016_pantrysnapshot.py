@@ -0,0 +1,42 @@
+# Generated by Django 5.1.3 on 2026-10-18 08:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('FitnessApp', '0015_action_client_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PantrySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action_id', models.IntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pantry_snapshots', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PantrySnapshotEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.FloatField()),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='FitnessApp.item')),
+                ('snapshot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='FitnessApp.pantrysnapshot')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='pantrysnapshot',
+            constraint=models.UniqueConstraint(fields=('user', 'action_id'), name='unique_pantry_snapshot'),
+        ),
+        migrations.AddConstraint(
+            model_name='pantrysnapshotentry',
+            constraint=models.UniqueConstraint(fields=('snapshot', 'item'), name='unique_pantry_snapshot_entry'),
+        ),
+    ]
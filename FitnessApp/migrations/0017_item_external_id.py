@@ -0,0 +1,34 @@
+# Generated by Django 5.1.3 on 2026-10-18 08:55
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+search_index = import_module('FitnessApp.migrations.0011_item_search_index')
+
+
+def restore_search_triggers(apps, schema_editor):
+    # Adding or removing a unique column rebuilds FitnessApp_item on SQLite, which drops the
+    # triggers keeping the search index of migration 0011 in sync
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in search_index.SQLITE_FORWARD:
+        if not statement.startswith('CREATE VIRTUAL TABLE'):
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('FitnessApp', '0016_pantrysnapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        migrations.AddField(
+            model_name='item',
+            name='external_id',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+    ]
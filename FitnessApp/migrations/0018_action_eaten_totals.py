@@ -0,0 +1,33 @@
+# Generated by Django 5.1.3 on 2026-10-18 09:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('FitnessApp', '0017_item_external_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='action',
+            name='calories',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='action',
+            name='carbs',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='action',
+            name='fats',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='action',
+            name='protein',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
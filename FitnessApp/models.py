@@ -1,8 +1,16 @@
 # models.py
+import heapq
+from itertools import groupby
+
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models import F
-from django.db.models.aggregates import Sum
+from django.utils import timezone
+
+from .caching import bump_user_version
+from .routers import pin_to_primary
+from django.db.models import F, Q, Case, Count, Exists, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.aggregates import Max, Min, Sum
 
 class UserSettings(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -14,6 +22,15 @@ class UserSettings(models.Model):
     def __str__(self):
         return f"{self.user.username}'s settings"
 
+    @classmethod
+    def for_user(cls, user):
+        # Reuses the row attached by CachedJWTAuthentication and attaches it otherwise
+        try:
+            return user.usersettings
+        except cls.DoesNotExist:
+            user.usersettings = cls.objects.get_or_create(user=user)[0]
+            return user.usersettings
+
 class Item(models.Model):
     item_id = models.AutoField(primary_key=True)
     name = models.CharField(max_length=100)
@@ -26,6 +43,7 @@ class Item(models.Model):
     carbs_sugar = models.FloatField(default=0.0)
     carbs_fiber = models.FloatField(default=0.0)
     carbs_starch = models.FloatField(default=0.0)
+    external_id = models.CharField(max_length=64, null=True, blank=True, unique=True)  # Key of the row in an imported dataset
 
     def get_nutrition(self):
         if not self.is_meal:
@@ -43,33 +61,28 @@ class Item(models.Model):
                 'carbs_starch': self.carbs_starch,
             }
 
-        recipes = Recipe.objects.filter(meal=self)
-        aggregated_values = recipes.aggregate(
-            total_calories=Sum(F('ingredient__calories') * F('quantity') / F('ingredient__serving_weight')),
-            total_weight=Sum('quantity'),
-            total_protein=Sum(F('ingredient__protein') * F('quantity') / F('ingredient__serving_weight')),
-            total_fats_saturated=Sum(F('ingredient__fats_saturated') * F('quantity') / F('ingredient__serving_weight')),
-            total_fats_unsaturated=Sum(F('ingredient__fats_unsaturated') * F('quantity') / F('ingredient__serving_weight')),
-            total_carbs_sugar=Sum(F('ingredient__carbs_sugar') * F('quantity') / F('ingredient__serving_weight')),
-            total_carbs_fiber=Sum(F('ingredient__carbs_fiber') * F('quantity') / F('ingredient__serving_weight')),
-            total_carbs_starch=Sum(F('ingredient__carbs_starch') * F('quantity') / F('ingredient__serving_weight')),
-        )
+        # Nested meals are expanded down to raw ingredients rather than trusting their stored rollups
+        from .nutrition import ROLLUP_FIELDS
+        from .recipe_graph import get_flat_nutrition
+        if self.requirements.exists():
+            nutrition = get_flat_nutrition(self.item_id)
+        else:
+            nutrition = dict.fromkeys(ROLLUP_FIELDS, 0)
 
         return {
             'item_id': self.item_id,
             'name': self.name,
             'is_meal': self.is_meal,
-            'calories': aggregated_values['total_calories'] or 0,
-            'serving_weight': aggregated_values['total_weight'] or 0,
-            'protein': aggregated_values['total_protein'] or 0,
-            'fats_saturated': aggregated_values['total_fats_saturated'] or 0,
-            'fats_unsaturated': aggregated_values['total_fats_unsaturated'] or 0,
-            'carbs_sugar': aggregated_values['total_carbs_sugar'] or 0,
-            'carbs_fiber': aggregated_values['total_carbs_fiber'] or 0,
-            'carbs_starch': aggregated_values['total_carbs_starch'] or 0,
+            'calories': nutrition['calories'],
+            'serving_weight': nutrition['serving_weight'],
+            'protein': nutrition['protein'],
+            'fats_saturated': nutrition['fats_saturated'],
+            'fats_unsaturated': nutrition['fats_unsaturated'],
+            'carbs_sugar': nutrition['carbs_sugar'],
+            'carbs_fiber': nutrition['carbs_fiber'],
+            'carbs_starch': nutrition['carbs_starch'],
         }
 
-
     def __str__(self):
         return self.name
 
@@ -79,6 +92,88 @@ class Recipe(models.Model):
     ingredient = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='ingredient_recipes')
     quantity = models.FloatField()  # Quantity in grams
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['meal', 'ingredient', 'quantity'], name='recipe_meal_ingr_qty_idx'),
+            models.Index(fields=['ingredient', 'meal', 'quantity'], name='recipe_ingr_meal_qty_idx'),
+        ]
+
+class MealRequirement(models.Model):
+    meal = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='requirements')
+    ingredient = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='required_by')
+    quantity = models.FloatField()  # Total grams of the ingredient across the meal's Recipe rows
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['meal', 'ingredient'], name='unique_meal_requirement'),
+        ]
+
+    @classmethod
+    def sync(cls, meal_id, ingredient_ids):
+        totals = dict(
+            Recipe.objects.filter(meal_id=meal_id, ingredient_id__in=ingredient_ids)
+            .values('ingredient').annotate(total=Sum('quantity')).order_by()
+            .values_list('ingredient', 'total')
+        )
+        cls.objects.filter(meal_id=meal_id, ingredient_id__in=set(ingredient_ids) - totals.keys()).delete()
+        cls.objects.bulk_create(
+            [cls(meal_id=meal_id, ingredient_id=ingredient_id, quantity=total) for ingredient_id, total in totals.items()],
+            update_conflicts=True,
+            unique_fields=['meal', 'ingredient'],
+            update_fields=['quantity'],
+        )
+
+    @classmethod
+    def get_cookable_meal_ids(cls, user):
+        # Only meals sharing at least one ingredient with the pantry are candidates; a meal is
+        # cookable when every one of its requirements is covered by the pantry
+        in_pantry = PantryItem.objects.filter(user=user, quantity__gt=0)
+        in_stock = in_pantry.filter(item=OuterRef('ingredient'), quantity__gte=OuterRef('quantity'))
+        candidates = cls.objects.filter(ingredient__in=in_pantry.values('item')).values('meal')
+        return cls.objects.filter(meal__is_meal=True, meal__in=candidates).values('meal').annotate(
+            required=Count('pk'),
+            satisfied=Count('pk', filter=Exists(in_stock)),
+        ).filter(required=F('satisfied')).order_by().values('meal')
+
+    @classmethod
+    def get_partial_matches(cls, user, limit):
+        """Returns the `limit` meals whose requirements the pantry covers best.
+
+        Coverage is the share of required grams in stock. Requirements are read in one query,
+        streamed in meal order with each row's stock attached, so only the current top
+        `limit` meals are kept in memory. Each result lists the missing ingredients with their
+        shortfall in grams.
+        """
+        in_pantry = PantryItem.objects.filter(user=user, quantity__gt=0)
+        stock = in_pantry.filter(item=OuterRef('ingredient')).values('quantity')[:1]
+        candidates = cls.objects.filter(ingredient__in=in_pantry.values('item')).values('meal')
+        rows = cls.objects.filter(meal__is_meal=True, meal__in=candidates).annotate(
+            stock=Coalesce(Subquery(stock), Value(0.0)),
+        ).order_by('meal', 'ingredient').values_list('meal', 'ingredient', 'quantity', 'stock')
+
+        def matches():
+            for meal_id, requirements in groupby(rows.iterator(chunk_size=5000), key=lambda row: row[0]):
+                required = covered = 0.0
+                missing = []
+                for _, ingredient_id, quantity, in_stock in requirements:
+                    required += quantity
+                    covered += min(quantity, in_stock)
+                    if in_stock < quantity:
+                        missing.append({'ingredient': ingredient_id, 'shortfall': quantity - in_stock})
+                yield {
+                    'meal': meal_id,
+                    'coverage': covered / required if required else 1.0,
+                    'shortfall': required - covered,
+                    'missing': missing,
+                }
+
+        return heapq.nsmallest(limit, matches(), key=lambda match: (-match['coverage'], len(match['missing']), match['meal']))
+
+class InsufficientStockError(ValueError):
+    def __init__(self, shortfalls):
+        super().__init__('Not enough stock to cook the meal.')
+        self.shortfalls = shortfalls  # [{ingredient, required, available}]
+
 class Action(models.Model):
     ACTION_CHOICES = [
         ('ADD', 'Add'),
@@ -94,33 +189,306 @@ class Action(models.Model):
     ingredient = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='actions_as_ingredient')
     action_type = models.CharField(max_length=10, choices=ACTION_CHOICES)
     quantity = models.FloatField()  # Quantity in grams
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)  # Offline clients may log actions after the fact
+    client_key = models.CharField(max_length=64, null=True, blank=True)  # Idempotency key for batch sync
+    # Macros of an EAT action as recorded when it was logged; deleting it subtracts these
+    calories = models.FloatField(null=True, blank=True)
+    protein = models.FloatField(null=True, blank=True)
+    carbs = models.FloatField(null=True, blank=True)
+    fats = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'client_key'], name='unique_action_client_key'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'action_type', 'timestamp'], name='action_user_type_time_idx'),
+            models.Index(fields=['user', 'timestamp'], name='action_user_time_idx'),
+        ]
+
+    @staticmethod
+    def get_balances(user, up_to=None):
+        """Net grams per item: the latest pantry snapshot plus the actions logged after it.
+
+        With up_to, only actions with action_id <= up_to are counted.
+        """
+        latest = PantrySnapshot.objects.filter(user=user).order_by('-action_id')
+        balances = dict(
+            PantrySnapshotEntry.objects.filter(snapshot=Subquery(latest.values('pk')[:1])).values_list('item', 'quantity')
+        )
+
+        # One grouped pass over the tail of the log; COOK rows credit the meal and debit the ingredient
+        actions = Action.objects.filter(user=user, action_id__gt=Coalesce(Subquery(latest.values('action_id')[:1]), 0))
+        if up_to is not None:
+            actions = actions.filter(action_id__lte=up_to)
+        totals = actions.values('item', 'ingredient').annotate(
+            total_added=Sum('quantity', filter=Q(action_type__in=['ADD', 'COOK'])),
+            total_eaten_disposed=Sum('quantity', filter=Q(action_type__in=['EAT', 'DISPOSE', 'COOK'])),
+        ).order_by()
+
+        for row in totals:
+            if row['total_added'] is not None:
+                balances[row['item']] = balances.get(row['item'], 0) + row['total_added']
+            if row['total_eaten_disposed'] is not None:
+                balances[row['ingredient']] = balances.get(row['ingredient'], 0) - row['total_eaten_disposed']
+        return balances
+
+    @staticmethod
+    def has_history(user):
+        # Compaction may have folded every action of a user into a snapshot
+        return Action.objects.filter(user=user).exists() or PantrySnapshot.objects.filter(user=user).exists()
 
     def get_available_ingredients(self):
-        added_foods = Action.objects.filter(user=self.user, action_type__in=['ADD', 'COOK']).values('item').annotate(total_added=Sum('quantity'))
-        eaten_disposed_foods = Action.objects.filter(user=self.user, action_type__in=['EAT', 'DISPOSE', 'COOK']).values('ingredient').annotate(total_eaten_disposed=Sum('quantity'))
-
-        available_ingredients = {}
-        for added in added_foods:
-            item_id = added['item']
-            total_added = added['total_added']
-            total_eaten_disposed = next((e['total_eaten_disposed'] for e in eaten_disposed_foods if e['ingredient'] == item_id), 0)
-            available_quantity = total_added - total_eaten_disposed
-            if available_quantity > 0:
-                available_ingredients[item_id] = available_quantity
-
-        return available_ingredients
-
-    def get_eaten_food(self):
-        eaten_foods = Action.objects.filter(user=self.user, action_type='EAT').values('action_id','item', 'quantity', 'timestamp')
-
-        eaten_food = []
-        for eaten in eaten_foods:
-            eaten_food.append({
+        balances = Action.get_balances(self.user)
+        return {item_id: quantity for item_id, quantity in balances.items() if quantity > 0}
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            Action.record_eaten_totals([self])
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def record_eaten_totals(actions):
+        """Sets on unsaved EAT actions the macros they add to DailyNutrition, which a delete subtracts.
+
+        save() does this itself; callers inserting with bulk_create must call it first.
+        """
+        pending = [action for action in actions if action.action_type == 'EAT' and action.calories is None]
+        missing = {action.item_id for action in pending if not Action.item.is_cached(action)}
+        items = Item.objects.in_bulk(missing) if missing else {}
+        for action in pending:
+            item = items[action.item_id] if action.item_id in items else action.item
+            for field, value in DailyNutrition.get_eaten_totals(item, action.quantity).items():
+                setattr(action, field, value)
+
+    @staticmethod
+    def apply_all_to_rollups(actions, sign=1):
+        # Keeps the materialized tables in step with Action inserts (sign=1) or deletes (sign=-1)
+        PantryItem.apply_actions(actions, sign)
+        DailyNutrition.apply_actions(actions, sign)
+        for user_id in {action.user_id for action in actions}:
+            bump_user_version(user_id)
+            pin_to_primary(user_id)
+
+    def apply_to_rollups(self, sign=1):
+        Action.apply_all_to_rollups([self], sign)
+
+    @staticmethod
+    def cook(user, meal, servings=1):
+        """Logs one COOK action per requirement of the meal, scaled by servings (full batches).
+
+        The user's pantry rows for the ingredients are locked first, so concurrent cooks and
+        eats cannot both spend the same stock; raises InsufficientStockError when an ingredient
+        is short. Must run in a transaction. Returns the actions and the pantry delta per item.
+        """
+        required = {
+            ingredient_id: quantity * servings
+            for ingredient_id, quantity in MealRequirement.objects.filter(meal=meal).values_list('ingredient', 'quantity')
+        }
+        if not required:
+            raise ValueError('The meal has no recipe.')
+
+        stock = dict(
+            PantryItem.objects.select_for_update().filter(user=user, item_id__in=required)
+            .order_by('item_id').values_list('item_id', 'quantity')
+        )
+        shortfalls = [
+            {'ingredient': ingredient_id, 'required': quantity, 'available': stock.get(ingredient_id, 0)}
+            for ingredient_id, quantity in sorted(required.items()) if stock.get(ingredient_id, 0) < quantity
+        ]
+        if shortfalls:
+            raise InsufficientStockError(shortfalls)
+
+        now = timezone.now()
+        actions = Action.objects.bulk_create(
+            Action(user=user, item=meal, ingredient_id=ingredient_id, action_type='COOK', quantity=quantity, timestamp=now)
+            for ingredient_id, quantity in required.items()
+        )
+        Action.apply_all_to_rollups(actions)
+
+        delta = {}
+        for action in actions:
+            for item_id, change in PantryItem.get_action_deltas(action).items():
+                delta[item_id] = delta.get(item_id, 0) + change
+        return actions, delta
+
+    def get_eaten_food_queryset(self, since=None, until=None, limit=None):
+        eaten_foods = Action.objects.filter(user=self.user, action_type='EAT')
+        if since is not None:
+            eaten_foods = eaten_foods.filter(timestamp__gte=since)
+        if until is not None:
+            eaten_foods = eaten_foods.filter(timestamp__lt=until)
+        eaten_foods = eaten_foods.order_by('timestamp', 'action_id').values('action_id', 'item', 'quantity', 'timestamp')
+        if limit is not None:
+            eaten_foods = eaten_foods[:limit]
+        return eaten_foods
+
+    def iter_eaten_food(self, since=None, until=None, limit=None, chunk_size=2000):
+        for eaten in self.get_eaten_food_queryset(since, until, limit).iterator(chunk_size=chunk_size):
+            yield {
                 'action_id': eaten['action_id'],
                 'item_id': eaten['item'],
                 'quantity': eaten['quantity'],
                 'timestamp': eaten['timestamp']
+            }
+
+    def get_eaten_food(self, since=None, until=None, limit=None):
+        return list(self.iter_eaten_food(since, until, limit))
+
+def increment_rows(model, key_field, deltas, chunk_size=500):
+    # deltas maps (user_id, key) to {field: delta}. Missing rows are inserted at their zero
+    # defaults, then each user's rows are incremented in one UPDATE per chunk, so concurrent
+    # writers add to each other's totals instead of overwriting them
+    model.objects.bulk_create(
+        [model(user_id=user_id, **{key_field: key}) for user_id, key in deltas],
+        ignore_conflicts=True,
+    )
+    by_user = {}
+    for (user_id, key), fields in deltas.items():
+        by_user.setdefault(user_id, {})[key] = fields
+    for user_id, rows in by_user.items():
+        keys = list(rows)
+        for start in range(0, len(keys), chunk_size):
+            chunk = keys[start:start + chunk_size]
+            model.objects.filter(user_id=user_id, **{f'{key_field}__in': chunk}).update(**{
+                field: F(field) + Case(
+                    *[When(**{key_field: key}, then=Value(rows[key][field])) for key in chunk],
+                    default=Value(0.0),
+                    output_field=models.FloatField(),
+                )
+                for field in rows[chunk[0]]
             })
 
-        return eaten_food
\ No newline at end of file
+class PantryItem(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='pantry_items')
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='pantry_items')
+    quantity = models.FloatField(default=0.0)  # Net available grams, negative if more was consumed than added
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'item'], name='unique_pantry_item'),
+        ]
+
+    @staticmethod
+    def get_action_deltas(action):
+        deltas = {}
+        if action.action_type in ('ADD', 'COOK'):
+            deltas[action.item_id] = deltas.get(action.item_id, 0) + action.quantity
+        if action.action_type in ('EAT', 'DISPOSE', 'COOK'):
+            deltas[action.ingredient_id] = deltas.get(action.ingredient_id, 0) - action.quantity
+        return deltas
+
+    @classmethod
+    def apply_actions(cls, actions, sign=1):
+        # Must run in the same transaction as the Action inserts/deletes it mirrors
+        deltas = {}
+        for action in actions:
+            for item_id, delta in cls.get_action_deltas(action).items():
+                key = (action.user_id, item_id)
+                deltas[key] = deltas.get(key, 0) + sign * delta
+
+        increment_rows(cls, 'item_id', {key: {'quantity': delta} for key, delta in deltas.items()})
+
+    @classmethod
+    def get_available_ingredients(cls, user):
+        return dict(cls.objects.filter(user=user, quantity__gt=0).values_list('item_id', 'quantity'))
+
+    @classmethod
+    def rebuild_for_user(cls, user):
+        balances = Action.get_balances(user)
+        cls.objects.filter(user=user).delete()
+        cls.objects.bulk_create(
+            cls(user=user, item_id=item_id, quantity=quantity) for item_id, quantity in balances.items()
+        )
+        return balances
+
+class PantrySnapshot(models.Model):
+    """Pantry balances of a user as of action_id, replacing the folded Action rows."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='pantry_snapshots')
+    action_id = models.IntegerField()  # Last action folded into the snapshot
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'action_id'], name='unique_pantry_snapshot'),
+        ]
+
+    @staticmethod
+    def get_compaction_point(user, before):
+        # Only a contiguous prefix of the log can be folded: stop below the first action at or after `before`
+        actions = Action.objects.filter(user=user)
+        first_recent = actions.filter(timestamp__gte=before).aggregate(first=Min('action_id'))['first']
+        if first_recent is not None:
+            actions = actions.filter(action_id__lt=first_recent)
+        return actions.aggregate(last=Max('action_id'))['last']
+
+    @classmethod
+    def compact(cls, user, up_to):
+        """Folds the actions with action_id <= up_to into a new snapshot and deletes them.
+
+        Returns the snapshot and the number of deleted actions. Must run in a transaction.
+        """
+        balances = Action.get_balances(user, up_to=up_to)
+        snapshot = cls.objects.create(user=user, action_id=up_to)
+        PantrySnapshotEntry.objects.bulk_create(
+            PantrySnapshotEntry(snapshot=snapshot, item_id=item_id, quantity=quantity)
+            for item_id, quantity in balances.items() if quantity
+        )
+        cls.objects.filter(user=user, action_id__lt=up_to).delete()
+        folded, _ = Action.objects.filter(user=user, action_id__lte=up_to).delete()
+        return snapshot, folded
+
+class PantrySnapshotEntry(models.Model):
+    snapshot = models.ForeignKey(PantrySnapshot, on_delete=models.CASCADE, related_name='entries')
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='+')
+    quantity = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['snapshot', 'item'], name='unique_pantry_snapshot_entry'),
+        ]
+
+class DailyNutrition(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_nutrition')
+    date = models.DateField()
+    calories = models.FloatField(default=0.0)
+    protein = models.FloatField(default=0.0)
+    carbs = models.FloatField(default=0.0)
+    fats = models.FloatField(default=0.0)
+
+    TOTAL_FIELDS = ('calories', 'protein', 'carbs', 'fats')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date'], name='unique_daily_nutrition'),
+        ]
+
+    @staticmethod
+    def get_eaten_totals(item, quantity):
+        if not item.serving_weight:
+            return dict.fromkeys(DailyNutrition.TOTAL_FIELDS, 0.0)
+        ratio = quantity / item.serving_weight
+        return {
+            'calories': item.calories * ratio,
+            'protein': item.protein * ratio,
+            'carbs': (item.carbs_sugar + item.carbs_fiber + item.carbs_starch) * ratio,
+            'fats': (item.fats_saturated + item.fats_unsaturated) * ratio,
+        }
+
+    @classmethod
+    def apply_actions(cls, actions, sign=1):
+        eaten = [action for action in actions if action.action_type == 'EAT']
+        if not eaten:
+            return
+        # Actions carry the macros recorded when they were inserted, so a delete subtracts exactly
+        # that even if the item was edited in between; only rows logged before the columns existed
+        # are looked up, with the item's current values
+        Action.record_eaten_totals(eaten)
+
+        days = {}
+        for action in eaten:
+            totals = days.setdefault((action.user_id, timezone.localdate(action.timestamp)), dict.fromkeys(cls.TOTAL_FIELDS, 0.0))
+            for field in cls.TOTAL_FIELDS:
+                totals[field] += sign * getattr(action, field)
+
+        increment_rows(cls, 'date', days)
@@ -0,0 +1,158 @@
+# nutrition.py
+"""Incremental nutrition rollups for meals.
+
+A meal stores the sum over its Recipe rows of quantity times the ingredient's per-gram
+values, and its serving_weight is the sum of those quantities. Instead of re-aggregating
+the whole recipe, changes are applied as deltas and pushed up to every meal that uses the
+changed item, directly or through nested meals. Callers must run inside a transaction.
+calories and serving_weight are integer columns: rounded deltas would drift without bound,
+so for every updated meal they are recomputed from its MealRequirement rows and rounded once.
+"""
+from collections import defaultdict
+
+from .models import Item, Recipe, MealRequirement
+
+NUTRIENT_FIELDS = (
+    'calories',
+    'protein',
+    'fats_saturated',
+    'fats_unsaturated',
+    'carbs_sugar',
+    'carbs_fiber',
+    'carbs_starch',
+)
+ROLLUP_FIELDS = NUTRIENT_FIELDS + ('serving_weight',)
+INTEGER_FIELDS = ('calories', 'serving_weight')
+
+
+def per_gram_values(item):
+    if not item.serving_weight:
+        return {field: 0.0 for field in NUTRIENT_FIELDS}
+    return {field: getattr(item, field) / item.serving_weight for field in NUTRIENT_FIELDS}
+
+
+def set_totals(item, totals):
+    for field, value in totals.items():
+        setattr(item, field, round(value) if field in INTEGER_FIELDS else value)
+
+
+def apply_recipes(meal, recipes, sign=1):
+    """Adds (sign=1) or removes (sign=-1) the contribution of Recipe rows of one meal.
+
+    Must run after the Recipe write and MealRequirement.sync, which the integer columns are read from.
+    """
+    meal = Item.objects.select_for_update().get(pk=meal.pk)
+    old_per_gram = per_gram_values(meal)
+    ingredients = Item.objects.in_bulk({recipe.ingredient_id for recipe in recipes})
+    has_other_recipes = Recipe.objects.filter(meal=meal).exclude(pk__in=[recipe.pk for recipe in recipes]).exists()
+
+    if has_other_recipes or sign < 0:
+        totals = {field: getattr(meal, field) for field in ROLLUP_FIELDS}
+    else:
+        # First ingredients of a meal replace whatever values it was created with
+        totals = dict.fromkeys(ROLLUP_FIELDS, 0)
+
+    for recipe in recipes:
+        ingredient_per_gram = per_gram_values(ingredients[recipe.ingredient_id])
+        for field in NUTRIENT_FIELDS:
+            totals[field] += sign * recipe.quantity * ingredient_per_gram[field]
+        totals['serving_weight'] += sign * recipe.quantity
+
+    if not has_other_recipes and sign < 0:
+        totals = dict.fromkeys(ROLLUP_FIELDS, 0)
+    totals.update(_integer_totals(_load_requirements([meal.pk])[meal.pk], {}))
+
+    set_totals(meal, totals)
+    new_per_gram = per_gram_values(meal)
+    propagate({meal.pk: _difference(new_per_gram, old_per_gram)}, updated={meal.pk: meal})
+    return meal
+
+
+def propagate_item_update(item, old_per_gram):
+    """Pushes an edit of an item's nutrition or serving weight to the meals using it."""
+    propagate({item.pk: _difference(per_gram_values(item), old_per_gram)})
+
+
+def propagate(per_gram_deltas, updated=None):
+    """Applies per-gram deltas of changed items to all their ancestor meals in one bulk UPDATE.
+
+    Ancestors are visited in topological order so a meal reached through several paths is
+    only finalized once all of its changed ingredients have been accounted for.
+    """
+    updated = dict(updated or {})
+    edges = _collect_parent_edges(per_gram_deltas.keys())
+    parents = defaultdict(list)
+    pending = defaultdict(int)
+    for meal_id, ingredient_id, quantity in edges:
+        parents[ingredient_id].append((meal_id, quantity))
+        pending[meal_id] += 1
+
+    # The totals below are written back as absolute values, so the ancestors are locked before
+    # they are read; pk order keeps concurrent writers sharing ancestors from deadlocking
+    ancestors = {
+        item.pk: item for item in
+        Item.objects.select_for_update().filter(pk__in={meal_id for meal_id, _, _ in edges} - updated.keys()).order_by('pk')
+    }
+    items = {**ancestors, **updated}
+    requirements = _load_requirements(ancestors.keys())
+    accumulated = defaultdict(lambda: dict.fromkeys(NUTRIENT_FIELDS, 0.0))
+
+    queue = list(per_gram_deltas.items())
+    while queue:
+        item_id, delta = queue.pop()
+        for meal_id, quantity in parents[item_id]:
+            for field in NUTRIENT_FIELDS:
+                accumulated[meal_id][field] += quantity * delta[field]
+            pending[meal_id] -= 1
+            if pending[meal_id]:
+                continue
+
+            # Meals caught in a recipe cycle never reach zero pending edges and are left untouched
+            meal = items[meal_id]
+            old_per_gram = per_gram_values(meal)
+            totals = {field: getattr(meal, field) + accumulated[meal_id][field] for field in NUTRIENT_FIELDS}
+            totals.update(_integer_totals(requirements[meal_id], updated))
+            set_totals(meal, totals)
+            updated[meal_id] = meal
+            queue.append((meal_id, _difference(per_gram_values(meal), old_per_gram)))
+
+    if updated:
+        Item.objects.bulk_update(updated.values(), ROLLUP_FIELDS)
+
+
+def _load_requirements(meal_ids):
+    requirements = defaultdict(list)
+    rows = MealRequirement.objects.filter(meal_id__in=meal_ids).values_list(
+        'meal', 'ingredient', 'quantity', 'ingredient__calories', 'ingredient__serving_weight'
+    )
+    for meal_id, *row in rows:
+        requirements[meal_id].append(row)
+    return requirements
+
+
+def _integer_totals(requirements, updated):
+    # Sub-meals already updated in this pass are read from memory, the rest from the query
+    totals = dict.fromkeys(INTEGER_FIELDS, 0.0)
+    for ingredient_id, quantity, calories, serving_weight in requirements:
+        if ingredient_id in updated:
+            calories, serving_weight = updated[ingredient_id].calories, updated[ingredient_id].serving_weight
+        if serving_weight:
+            totals['calories'] += quantity * calories / serving_weight
+        totals['serving_weight'] += quantity
+    return totals
+
+
+def _collect_parent_edges(item_ids):
+    edges = []
+    seen = set(item_ids)
+    frontier = set(item_ids)
+    while frontier:
+        level = list(Recipe.objects.filter(ingredient_id__in=frontier).values_list('meal_id', 'ingredient_id', 'quantity'))
+        edges.extend(level)
+        frontier = {meal_id for meal_id, _, _ in level} - seen
+        seen |= frontier
+    return edges
+
+
+def _difference(new, old):
+    return {field: new[field] - old[field] for field in NUTRIENT_FIELDS}
@@ -0,0 +1,15 @@
+# pagination.py
+from rest_framework.pagination import CursorPagination
+
+
+class ItemCursorPagination(CursorPagination):
+    ordering = 'item_id'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # Opt-in, so clients that expect the full list keep getting a plain array
+        if self.cursor_query_param not in request.query_params and self.page_size_query_param not in request.query_params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
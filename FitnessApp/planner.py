@@ -0,0 +1,132 @@
+# planner.py
+"""Meal planning against the remaining daily macro goals.
+
+The goals in UserSettings minus what DailyNutrition already records for today give the
+remaining calories, protein, carbs and fats. Candidates are the items in the pantry and the
+meals that can be cooked from it; each has per-gram macros and consumes pantry stock (a
+cooked meal consumes its ingredients in recipe proportions). The planner greedily adds the
+portion that most reduces the squared error relative to the goals, choosing each portion's
+size in closed form, until nothing improves, MAX_STEPS portions were added or the time
+budget runs out. Portions are rounded to PORTION_GRAMS and never exceed the stock.
+"""
+from time import perf_counter
+
+from django.utils import timezone
+
+from .models import Item, UserSettings, PantryItem, MealRequirement, DailyNutrition
+
+MACROS = DailyNutrition.TOTAL_FIELDS
+PORTION_GRAMS = 5
+MAX_STEPS = 25
+TIME_BUDGET = 0.05  # Seconds spent searching before returning the best plan so far
+
+
+class Candidate:
+    __slots__ = ('item', 'source', 'vector', 'norm', 'uses')
+
+    def __init__(self, item, source, per_gram, goals, uses):
+        self.item = item
+        self.source = source
+        self.vector = tuple(per_gram[macro] / goals[macro] for macro in MACROS)
+        self.norm = sum(value * value for value in self.vector)
+        self.uses = uses  # {pantry item_id: grams consumed per gram}
+
+
+def get_remaining_goals(user, day=None):
+    user_settings = UserSettings.for_user(user)
+    goals = {
+        'calories': user_settings.goal_calories,
+        'protein': user_settings.goal_protein,
+        'carbs': user_settings.goal_carbs,
+        'fats': user_settings.goal_fats,
+    }
+    eaten = DailyNutrition.objects.filter(user=user, date=day or timezone.localdate()).values(*MACROS).first() or {}
+    return goals, {macro: goals[macro] - eaten.get(macro, 0) for macro in MACROS}
+
+
+def get_candidates(user, goals):
+    stock = PantryItem.get_available_ingredients(user)
+    cookable = list(MealRequirement.get_cookable_meal_ids(user).values_list('meal', flat=True))
+    items = Item.objects.in_bulk(set(stock) | set(cookable))
+
+    requirements = {}
+    for meal_id, ingredient_id, quantity in MealRequirement.objects.filter(meal__in=cookable).values_list(
+        'meal', 'ingredient', 'quantity'
+    ):
+        requirements.setdefault(meal_id, {})[ingredient_id] = quantity
+
+    candidates = []
+    for item_id in stock:
+        item = items[item_id]
+        if item.serving_weight:
+            candidates.append(Candidate(item, 'pantry', DailyNutrition.get_eaten_totals(item, 1), goals, {item_id: 1.0}))
+    for meal_id in cookable:
+        meal = items[meal_id]
+        if meal.serving_weight:
+            # Zero-gram rows (a pinch of salt) use no stock and would divide by zero in plan()
+            uses = {
+                ingredient_id: quantity / meal.serving_weight
+                for ingredient_id, quantity in requirements[meal_id].items() if quantity
+            }
+            candidates.append(Candidate(meal, 'cook', DailyNutrition.get_eaten_totals(meal, 1), goals, uses))
+    return candidates, stock
+
+
+def plan(candidates, stock, goals, remaining, time_budget=TIME_BUDGET, max_steps=MAX_STEPS):
+    deadline = perf_counter() + time_budget
+    residual = [remaining[macro] / goals[macro] for macro in MACROS]
+    stock = dict(stock)
+    portions = {}
+
+    candidates = [candidate for candidate in candidates if candidate.norm]
+    for _ in range(max_steps):
+        best = None
+        best_gain = 0.0
+        r0, r1, r2, r3 = residual
+        for candidate in candidates:
+            v0, v1, v2, v3 = candidate.vector
+            projection = r0 * v0 + r1 * v1 + r2 * v2 + r3 * v3
+            if projection <= 0:
+                continue
+            limit = min(stock.get(item_id, 0) / use for item_id, use in candidate.uses.items())
+            grams = min(projection / candidate.norm, limit) // PORTION_GRAMS * PORTION_GRAMS
+            gain = 2 * grams * projection - grams * grams * candidate.norm
+            if grams > 0 and gain > best_gain:
+                best, best_grams, best_gain = candidate, grams, gain
+        if best is None:
+            break
+
+        residual = [r - best_grams * v for r, v in zip(residual, best.vector)]
+        for item_id, use in best.uses.items():
+            stock[item_id] -= best_grams * use
+        key = (best.item.item_id, best.source)
+        portions[key] = portions.get(key, 0) + best_grams
+        if perf_counter() > deadline:
+            break
+
+    return portions
+
+
+def build_plan(user):
+    goals, remaining = get_remaining_goals(user)
+    # Errors are relative to each goal; a macro without a positive goal is not scored
+    scale = {macro: goal if goal > 0 else float('inf') for macro, goal in goals.items()}
+    candidates, stock = get_candidates(user, scale)
+    portions = plan(candidates, stock, scale, remaining)
+
+    items = {candidate.item.item_id: candidate.item for candidate in candidates}
+    entries = []
+    totals = dict.fromkeys(MACROS, 0.0)
+    for (item_id, source), grams in portions.items():
+        item = items[item_id]
+        macros = DailyNutrition.get_eaten_totals(item, grams)
+        for macro in MACROS:
+            totals[macro] += macros[macro]
+        entries.append({'item_id': item_id, 'name': item.name, 'source': source, 'quantity': grams, **macros})
+
+    return {
+        'remaining': remaining,
+        'plan': entries,
+        'totals': totals,
+        'left_after_plan': {macro: remaining[macro] - totals[macro] for macro in MACROS},
+    }
@@ -0,0 +1,151 @@
+# recipe_graph.py
+"""Flattening of nested meals into raw ingredient grams.
+
+A meal's MealRequirement rows may name other meals (a sauce inside a lasagna). flatten()
+follows them down to items without requirements and returns the grams of each raw
+ingredient in one full batch of the meal, a sub-meal being scaled by the share of its own
+batch that is used. Recipe cycles raise RecipeCycleError.
+
+Flattened meals are memoized in the cache alias of caching.py. They only depend on the
+recipe structure, so nutrition edits keep them valid; a Recipe write must call
+invalidate() with its meal, which drops that meal and every meal that contains it.
+"""
+from django.db import transaction
+
+from .caching import get_cache
+from .models import Item, MealRequirement, PantryItem
+from .nutrition import NUTRIENT_FIELDS
+
+CACHE_TIMEOUT = 24 * 60 * 60
+
+
+class RecipeCycleError(ValueError):
+    def __init__(self, path):
+        super().__init__('Recipe cycle: ' + ' -> '.join(map(str, path)))
+        self.path = path
+
+
+def _flat_key(meal_id):
+    return f'fitnessapp:recipe-graph:flat:{meal_id}'
+
+
+def flatten(meal_id):
+    return flatten_many([meal_id])[meal_id]
+
+
+def flatten_many(meal_ids, skip_cycles=False):
+    """Returns {meal_id: {raw item_id: grams}}; an item without requirements maps to itself.
+
+    With skip_cycles=True meals caught in a cycle are left out instead of raising.
+    """
+    cache = get_cache()
+    cached = cache.get_many([_flat_key(meal_id) for meal_id in meal_ids])
+    flat = {meal_id: cached[_flat_key(meal_id)] for meal_id in meal_ids if _flat_key(meal_id) in cached}
+    missing = set(meal_ids) - flat.keys()
+    if not missing:
+        return flat
+
+    requirements = _load_requirements(missing)
+    computed = {}
+    for meal_id in missing:
+        try:
+            flat[meal_id] = _flatten(meal_id, requirements, computed, [])
+        except RecipeCycleError:
+            if not skip_cycles:
+                raise
+    cache.set_many({_flat_key(meal_id): value for meal_id, value in computed.items()}, CACHE_TIMEOUT)
+    return flat
+
+
+def _load_requirements(meal_ids):
+    # One query per nesting level
+    requirements = {}
+    visited = set()
+    frontier = set(meal_ids)
+    while frontier:
+        visited |= frontier
+        level = MealRequirement.objects.filter(meal_id__in=frontier).values_list('meal_id', 'ingredient_id', 'quantity')
+        for meal_id, ingredient_id, quantity in level:
+            requirements.setdefault(meal_id, {})[ingredient_id] = quantity
+        frontier = {ingredient_id for meal_id in frontier for ingredient_id in requirements.get(meal_id, ())} - visited
+    return requirements
+
+
+def _flatten(meal_id, requirements, computed, path):
+    if meal_id in computed:
+        return computed[meal_id]
+    if meal_id in path:
+        raise RecipeCycleError(path[path.index(meal_id):] + [meal_id])
+    ingredients = requirements.get(meal_id)
+    if not ingredients:
+        return {meal_id: 1.0}
+
+    path.append(meal_id)
+    flat = {}
+    for ingredient_id, quantity in ingredients.items():
+        if ingredient_id not in requirements:
+            flat[ingredient_id] = flat.get(ingredient_id, 0) + quantity
+            continue
+        sub_flat = _flatten(ingredient_id, requirements, computed, path)
+        share = quantity / sum(requirements[ingredient_id].values())
+        for raw_id, grams in sub_flat.items():
+            flat[raw_id] = flat.get(raw_id, 0) + grams * share
+    path.pop()
+    computed[meal_id] = flat
+    return flat
+
+
+def invalidate(meal_ids):
+    """Drops the memoized flattening of the given meals and all meals containing them."""
+    keys = [_flat_key(meal_id) for meal_id in _collect_ancestors(meal_ids)]
+    get_cache().delete_many(keys)
+    transaction.on_commit(lambda: get_cache().delete_many(keys))
+
+
+def check_new_ingredients(meal_id, ingredient_ids):
+    """Raises RecipeCycleError if adding the ingredients to the meal would close a cycle."""
+    ancestors = _collect_ancestors([meal_id])
+    for ingredient_id in ingredient_ids:
+        if ingredient_id in ancestors:
+            # The ingredient is the meal itself or already contains it
+            raise RecipeCycleError([meal_id, ingredient_id] if ingredient_id != meal_id else [meal_id, meal_id])
+
+
+def _collect_ancestors(meal_ids):
+    seen = set(meal_ids)
+    frontier = set(meal_ids)
+    while frontier:
+        parents = set(MealRequirement.objects.filter(ingredient_id__in=frontier).values_list('meal_id', flat=True))
+        frontier = parents - seen
+        seen |= frontier
+    return seen
+
+
+def get_flat_nutrition(meal_id):
+    """Sums nutrition over a meal's raw ingredients for one full batch, with its weight."""
+    flat = flatten(meal_id)
+    raw_items = Item.objects.in_bulk(flat.keys())
+    totals = dict.fromkeys(NUTRIENT_FIELDS, 0.0)
+    for item_id, grams in flat.items():
+        item = raw_items[item_id]
+        if not item.serving_weight:
+            continue
+        for field in NUTRIENT_FIELDS:
+            totals[field] += getattr(item, field) * grams / item.serving_weight
+    totals['serving_weight'] = sum(flat.values())
+    return totals
+
+
+def get_expanded_cookable_meal_ids(user):
+    """Meals whose raw ingredients, after expanding nested meals, are all in the user's pantry."""
+    stock = PantryItem.get_available_ingredients(user)
+    if not stock:
+        return set()
+    candidates = set(
+        MealRequirement.objects.filter(meal_id__in=_collect_ancestors(stock), meal__is_meal=True)
+        .values_list('meal_id', flat=True).distinct()
+    )
+    return {
+        meal_id for meal_id, flat in flatten_many(candidates, skip_cycles=True).items()
+        if all(stock.get(item_id, 0) >= grams for item_id, grams in flat.items())
+    }
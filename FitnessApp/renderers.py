@@ -0,0 +1,32 @@
+# renderers.py
+import json
+
+from rest_framework.compat import LONG_SEPARATORS, SHORT_SEPARATORS
+from rest_framework.renderers import JSONRenderer
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer with one reusable encoder and no circular-reference bookkeeping.
+
+    Output is byte-identical: the same separators, escaping and encoder default hook for
+    types json does not know. Indented output is left to JSONRenderer.
+    """
+    def __init__(self):
+        self.encoder = json.JSONEncoder(
+            ensure_ascii=self.ensure_ascii,
+            allow_nan=not self.strict,
+            separators=SHORT_SEPARATORS if self.compact else LONG_SEPARATORS,
+            check_circular=False,
+            default=self.encoder_class().default,
+        )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = self.encoder.encode(data)
+        if '\u2028' in ret or '\u2029' in ret:
+            ret = ret.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+        return ret.encode()
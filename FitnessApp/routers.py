@@ -0,0 +1,88 @@
+# routers.py
+"""Read-replica routing for the read-heavy endpoints.
+
+Views mixing in ReplicaReadMixin run their GET requests with reads routed by ReplicaRouter
+to a random alias from FITNESSAPP_READ_REPLICAS; everything else uses the primary
+('default'). After a user's Actions are written the user is pinned to the primary for
+FITNESSAPP_REPLICA_STICKY_SECONDS, so their next reads see their own writes while the
+replicas catch up. Item and Recipe writes pin every user the same way, as a stale replica
+read would otherwise be cached under the new catalog version. The pins live in the cache
+alias of caching.py and so are shared by all workers.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from rest_framework.permissions import SAFE_METHODS
+
+from .caching import get_cache
+
+use_replica = ContextVar('fitnessapp_use_replica', default=False)
+
+
+def get_replicas():
+    return getattr(settings, 'FITNESSAPP_READ_REPLICAS', [])
+
+
+def _sticky_key(user_id):
+    return f'fitnessapp:replica:sticky:{user_id}'
+
+
+CATALOG_STICKY_KEY = 'fitnessapp:replica:sticky:catalog'
+
+
+def _pin(key):
+    # The window starts when the write is committed on the primary
+    timeout = getattr(settings, 'FITNESSAPP_REPLICA_STICKY_SECONDS', 5)
+    if get_replicas() and timeout:
+        transaction.on_commit(lambda: get_cache().set(key, True, timeout))
+
+
+def pin_to_primary(user_id):
+    _pin(_sticky_key(user_id))
+
+
+def pin_catalog_to_primary():
+    _pin(CATALOG_STICKY_KEY)
+
+
+def is_pinned_to_primary(user_id=None):
+    keys = [CATALOG_STICKY_KEY] if user_id is None else [CATALOG_STICKY_KEY, _sticky_key(user_id)]
+    return any(get_cache().get_many(keys).values())
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = get_replicas()
+        if replicas and use_replica.get():
+            return random.choice(replicas)
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Objects read from a replica must still be saved to the primary
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+
+class ReplicaReadMixin:
+    """Routes the reads of safe requests to the replicas unless the user is pinned to the primary."""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS and get_replicas():
+            if not is_pinned_to_primary(request.user.pk if request.user.is_authenticated else None):
+                self._replica_token = use_replica.set(True)
+
+    def dispatch(self, request, *args, **kwargs):
+        self._replica_token = None
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            if self._replica_token is not None:
+                use_replica.reset(self._replica_token)
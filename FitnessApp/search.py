@@ -0,0 +1,61 @@
+# search.py
+"""Item name search.
+
+On SQLite the FitnessApp_item_fts FTS5 table (kept in sync by triggers, see migration 0011)
+answers prefix queries ranked by bm25. Other databases fall back to matching every token
+as a word prefix, ranked prefix-first like the FTS path, which migration 0011 backs with
+pg_trgm / text_pattern_ops indexes on PostgreSQL.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.functions import Length
+
+from .models import Item
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def search_items(query, limit=DEFAULT_LIMIT, is_meal=None):
+    tokens = TOKEN_RE.findall(query)
+    if not tokens:
+        return []
+    if connection.vendor == 'sqlite':
+        return _search_fts(tokens, limit, is_meal)
+    return _search_fallback(tokens, limit, is_meal)
+
+
+def _search_fts(tokens, limit, is_meal):
+    # Every token is a quoted prefix term, so user input can never inject FTS5 query syntax
+    match = ' '.join(f'"{token}"*' for token in tokens)
+    sql = (
+        'SELECT item.* FROM FitnessApp_item_fts fts '
+        'JOIN FitnessApp_item item ON item.item_id = fts.rowid '
+        'WHERE FitnessApp_item_fts MATCH %s'
+    )
+    params = [match]
+    if is_meal is not None:
+        sql += ' AND item.is_meal = %s'
+        params.append(is_meal)
+    # Names starting with the query come first, as in the fallback ranking
+    sql += " ORDER BY item.name LIKE %s ESCAPE '\\' DESC, fts.rank, length(item.name), item.item_id LIMIT %s"
+    params += [' '.join(tokens).replace('_', '\\_') + '%', limit]
+    return list(Item.objects.raw(sql, params))
+
+
+def _search_fallback(tokens, limit, is_meal):
+    # Like the FTS MATCH, every token must start a word of the name, in any order
+    items = Item.objects.all()
+    for token in tokens:
+        items = items.filter(Q(name__istartswith=token) | Q(name__iregex=rf'\W{token}'))
+    query = ' '.join(tokens)
+    if is_meal is not None:
+        items = items.filter(is_meal=is_meal)
+    return list(items.annotate(
+        prefix_rank=Case(When(name__istartswith=query, then=Value(0)), default=Value(1), output_field=IntegerField()),
+        name_length=Length('name'),
+    ).order_by('prefix_rank', 'name_length', 'item_id')[:limit])
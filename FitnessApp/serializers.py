@@ -55,4 +55,28 @@ class RecipeSerializer(serializers.ModelSerializer):
 class ActionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Action
-        fields = ['item', 'ingredient', 'action_type', 'quantity']
\ No newline at end of file
+        fields = ['item', 'ingredient', 'action_type', 'quantity']
+
+class CookSerializer(serializers.Serializer):
+    meal = serializers.PrimaryKeyRelatedField(queryset=Item.objects.all())
+    servings = serializers.FloatField(default=1)
+
+    def validate_meal(self, value):
+        if not value.is_meal:
+            raise serializers.ValidationError("Item is not a meal.")
+        return value
+
+    def validate_servings(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("servings must be positive.")
+        return value
+
+class ActionBatchEntrySerializer(serializers.ModelSerializer):
+    # Plain ids are checked with one query for the whole batch instead of one per entry
+    item = serializers.IntegerField(source='item_id')
+    ingredient = serializers.IntegerField(source='ingredient_id')
+    client_key = serializers.CharField(max_length=64)
+
+    class Meta:
+        model = Action
+        fields = ['client_key', 'item', 'ingredient', 'action_type', 'quantity', 'timestamp']
@@ -0,0 +1,29 @@
+# signals.py
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import invalidate_cached_user
+from .models import UserSettings
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    # Covers deactivation and password changes, which both save the User row
+    invalidate_cached_user(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=UserSettings)
+def user_settings_changed(sender, instance, **kwargs):
+    invalidate_cached_user(instance.user_id)
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in getattr(settings, 'FITNESSAPP_SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
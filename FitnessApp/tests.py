@@ -1,3 +1,1262 @@
-from django.test import TestCase
+import contextlib
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, connections
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from backend.databases import get_databases
+
+from . import planner, recipe_graph, search
+from .benchmarking import get_route_names, get_scenarios
+from .caching import get_cache, get_user_version
+from .checks import check_auth_cache_is_shared
+from .fast_serializers import ValuesSerializer
+from .metrics import parse_prometheus, registry, summarize
+from .models import Item, Recipe, Action, PantryItem, PantrySnapshot, MealRequirement, DailyNutrition
+from .renderers import FastJSONRenderer
+from .search import search_items
+from .routers import CATALOG_STICKY_KEY, ReplicaRouter, use_replica
+from .serializers import ActionSerializer, ItemSerializer, RecipeSerializer
+
+
+@override_settings(FITNESSAPP_READ_REPLICAS=[])  # Replicas from the environment are test mirrors, keep reads on default
+class FitnessAppTestCase(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create_user(username='alice', password='secret-password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        self.rice = Item.objects.create(name='Rice', calories=130, serving_weight=100, protein=2.7, carbs_starch=28)
+        self.chicken = Item.objects.create(name='Chicken', calories=165, serving_weight=100, protein=31, fats_saturated=1, fats_unsaturated=2.6)
+        self.meal = Item.objects.create(name='Chicken rice', is_meal=True)
+        self.add_recipe(self.meal, self.rice, 150)
+        self.add_recipe(self.meal, self.chicken, 100)
+
+    def add_recipe(self, meal, ingredient, quantity):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/recipes/', {'meal': meal.item_id, 'ingredient': ingredient.item_id, 'quantity': quantity})
+        self.assertEqual(response.status_code, 201)
+        return Recipe.objects.latest('recipe_id')
+
+    def log(self, action_type, item, quantity, ingredient=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/actions/', {
+                'item': item.item_id,
+                'ingredient': (ingredient or item).item_id,
+                'action_type': action_type,
+                'quantity': quantity,
+            })
+        self.assertEqual(response.status_code, 201)
+        return Action.objects.latest('action_id')
+
+
+class PantryTests(FitnessAppTestCase):
+    def test_actions_update_pantry_incrementally(self):
+        self.log('ADD', self.rice, 500)
+        self.log('ADD', self.chicken, 300)
+        self.log('EAT', self.rice, 120)
+        self.log('DISPOSE', self.chicken, 50)
+        self.log('COOK', self.meal, 150, ingredient=self.rice)
+
+        pantry = PantryItem.get_available_ingredients(self.user)
+        self.assertEqual(pantry, {self.rice.item_id: 230, self.chicken.item_id: 250, self.meal.item_id: 150})
+        self.assertEqual(pantry, {k: v for k, v in Action.get_balances(self.user).items() if v > 0})
+
+        response = self.client.get('/available-ingredients/')
+        self.assertEqual(response.json(), {str(k): v for k, v in pantry.items()})
+
+    def test_deleting_action_reverts_pantry(self):
+        self.log('ADD', self.rice, 500)
+        eaten = self.log('EAT', self.rice, 200)
+
+        response = self.client.delete(f'/actions/{eaten.action_id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(PantryItem.get_available_ingredients(self.user), {self.rice.item_id: 500})
+
+    def test_rebuild_command_repairs_and_verifies(self):
+        self.log('ADD', self.rice, 500)
+        self.log('EAT', self.rice, 100)
+        PantryItem.objects.filter(user=self.user).update(quantity=1)
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_pantry', '--verify', stdout=StringIO())
+
+        version = get_user_version(self.user.pk)
+        errors = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('rebuild_pantry', stdout=StringIO(), stderr=errors)
+        call_command('rebuild_pantry', '--verify', stdout=StringIO())
+        self.assertEqual(PantryItem.get_available_ingredients(self.user), {self.rice.item_id: 400})
+        # Cached pantry responses are invalidated, but only in this process with the locmem cache
+        self.assertNotEqual(get_user_version(self.user.pk), version)
+        self.assertIn('process-local', errors.getvalue())
+
+    def test_meal_recommendations_use_pantry(self):
+        self.log('ADD', self.rice, 200)
+        response = self.client.get('/meal-recommendations/')
+        self.assertEqual(response.status_code, 204)
+
+        self.log('ADD', self.chicken, 100)
+        response = self.client.get('/meal-recommendations/')
+        self.assertEqual([meal['item_id'] for meal in response.json()], [self.meal.item_id])
+
+
+class PantrySnapshotTests(FitnessAppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.log('ADD', self.rice, 500)
+        self.log('ADD', self.chicken, 300)
+        self.log('COOK', self.meal, 150, ingredient=self.rice)
+        self.log('EAT', self.rice, 100)
+        Action.objects.update(timestamp=timezone.now() - timedelta(days=30))
+
+    def compact(self, *args):
+        call_command('compact_actions', '--keep-days', '7', '--min-actions', '1', *args, stdout=StringIO())
+
+    def test_compaction_keeps_balances(self):
+        balances = Action.get_balances(self.user)
+        recent = self.log('DISPOSE', self.chicken, 50)
+        self.compact()
+
+        self.assertEqual(list(Action.objects.values_list('action_id', flat=True)), [recent.action_id])
+        snapshot = PantrySnapshot.objects.get(user=self.user)
+        self.assertEqual(snapshot.action_id, recent.action_id - 1)
+        self.assertEqual(dict(snapshot.entries.values_list('item', 'quantity')), balances)
+
+        balances[self.chicken.item_id] -= 50
+        self.assertEqual(Action.get_balances(self.user), balances)
+        call_command('rebuild_pantry', '--verify', stdout=StringIO())
+
+    def test_only_contiguous_prefix_is_folded(self):
+        recent = self.log('ADD', self.rice, 10)
+        backdated = self.log('ADD', self.rice, 20)
+        Action.objects.filter(pk=backdated.pk).update(timestamp=timezone.now() - timedelta(days=30))
+        self.compact()
+
+        self.assertEqual(PantrySnapshot.objects.get().action_id, recent.action_id - 1)
+        self.assertEqual(Action.objects.count(), 2)
+
+    def test_repeated_compaction_replaces_snapshot(self):
+        self.compact()
+        self.log('EAT', self.chicken, 100)
+        Action.objects.update(timestamp=timezone.now() - timedelta(days=30))
+        self.compact()
+
+        self.assertEqual(PantrySnapshot.objects.count(), 1)
+        self.assertFalse(Action.objects.exists())
+        self.assertEqual(Action.get_balances(self.user), {self.rice.item_id: 250, self.chicken.item_id: 200, self.meal.item_id: 150})
+        call_command('rebuild_pantry', '--verify', stdout=StringIO())
+
+    def test_endpoints_after_full_compaction(self):
+        self.compact()
+        self.assertFalse(Action.objects.exists())
+
+        response = self.client.get('/available-ingredients/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[str(self.rice.item_id)], 250)
+        self.assertEqual(self.client.get('/eaten-food/').json(), [])
+        self.assertEqual(self.client.get('/meal-recommendations/').status_code, 200)
+
+    def test_min_actions_skips_small_logs(self):
+        call_command('compact_actions', '--keep-days', '7', stdout=StringIO())
+        self.assertFalse(PantrySnapshot.objects.exists())
+        self.assertEqual(Action.objects.count(), 4)
+
+
+class MealRecommendationTests(FitnessAppTestCase):
+    def test_requirement_index_follows_recipes(self):
+        self.add_recipe(self.meal, self.rice, 50)
+        requirements = dict(MealRequirement.objects.filter(meal=self.meal).values_list('ingredient', 'quantity'))
+        self.assertEqual(requirements, {self.rice.item_id: 200, self.chicken.item_id: 100})
+
+    def test_recommendations_require_every_ingredient_in_stock(self):
+        salad = Item.objects.create(name='Rice salad', is_meal=True)
+        self.add_recipe(salad, self.rice, 100)
+        self.log('ADD', self.rice, 150)
+        self.log('ADD', self.chicken, 99)
+
+        response = self.client.get('/meal-recommendations/')
+        self.assertEqual([meal['item_id'] for meal in response.json()], [salad.item_id])
+
+        self.log('ADD', self.chicken, 1)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/meal-recommendations/')
+        self.assertEqual([meal['item_id'] for meal in response.json()], [self.meal.item_id, salad.item_id])
+        self.assertEqual(len(queries), 2)
+
+    def test_partial_mode_ranks_by_coverage_with_shortfalls(self):
+        salad = Item.objects.create(name='Rice salad', is_meal=True)
+        self.add_recipe(salad, self.rice, 100)
+        curry = Item.objects.create(name='Chicken curry', is_meal=True)
+        self.add_recipe(curry, self.chicken, 300)
+        self.log('ADD', self.rice, 120)
+        self.log('ADD', self.chicken, 60)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/meal-recommendations/?mode=partial&limit=2')
+        self.assertEqual(len(queries), 3)
+        matches = response.json()
+        self.assertEqual([match['meal'] for match in matches], [salad.item_id, self.meal.item_id])
+        self.assertEqual(matches[0]['coverage'], 1.0)
+        self.assertEqual(matches[0]['missing'], [])
+        self.assertAlmostEqual(matches[1]['coverage'], 180 / 250)
+        self.assertEqual(matches[1]['missing'], [
+            {'ingredient': self.rice.item_id, 'shortfall': 30, 'name': 'Rice'},
+            {'ingredient': self.chicken.item_id, 'shortfall': 40, 'name': 'Chicken'},
+        ])
+
+        response = self.client.get('/meal-recommendations/?mode=partial&limit=0')
+        self.assertEqual(response.status_code, 400)
+
+
+class NutritionRollupTests(FitnessAppTestCase):
+    def assertStoredNutritionMatches(self, meal, calories_delta=0.5):
+        meal.refresh_from_db()
+        expected = meal.get_nutrition()
+        # Integer columns are rounded once from the exact sum; only a meal containing sub-meals
+        # adds up their already rounded calories and needs a larger calories_delta
+        self.assertAlmostEqual(meal.calories, expected['calories'], delta=calories_delta)
+        self.assertEqual(meal.serving_weight, round(expected['serving_weight']))
+        for field in ['protein', 'fats_saturated', 'fats_unsaturated', 'carbs_sugar', 'carbs_fiber', 'carbs_starch']:
+            self.assertAlmostEqual(getattr(meal, field), expected[field])
+
+    def test_recipe_insert_and_delete_apply_deltas(self):
+        self.assertStoredNutritionMatches(self.meal)
+        self.assertEqual(self.meal.calories, 360)
+        self.assertEqual(self.meal.serving_weight, 250)
+
+        extra = self.add_recipe(self.meal, self.rice, 50)
+        self.assertStoredNutritionMatches(self.meal)
+
+        response = self.client.delete(f'/recipes/{extra.recipe_id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertStoredNutritionMatches(self.meal)
+        self.assertEqual(MealRequirement.objects.get(meal=self.meal, ingredient=self.rice).quantity, 150)
+
+    def test_ingredient_edit_propagates_to_nested_meals(self):
+        lunchbox = Item.objects.create(name='Lunchbox', is_meal=True)
+        self.add_recipe(lunchbox, self.meal, 125)
+        self.add_recipe(lunchbox, self.chicken, 50)
+
+        response = self.client.patch(f'/items/{self.chicken.item_id}/', {'protein': 25, 'calories': 150}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertStoredNutritionMatches(self.meal)
+        self.assertStoredNutritionMatches(lunchbox, calories_delta=1)
+        self.assertAlmostEqual(self.meal.protein, 2.7 * 1.5 + 25)
+        self.assertAlmostEqual(lunchbox.protein, self.meal.protein / 2 + 12.5)
+
+    def test_catalog_edits_require_authentication(self):
+        recipe = Recipe.objects.get(meal=self.meal, ingredient=self.rice)
+        anonymous = APIClient()
+        self.assertEqual(anonymous.get(f'/items/{self.chicken.item_id}/').status_code, 200)
+        self.assertEqual(anonymous.patch(f'/items/{self.chicken.item_id}/', {'calories': 1}, format='json').status_code, 401)
+        self.assertEqual(anonymous.get(f'/recipes/{recipe.recipe_id}/').status_code, 200)
+        self.assertEqual(anonymous.delete(f'/recipes/{recipe.recipe_id}/').status_code, 401)
+        self.assertTrue(Recipe.objects.filter(pk=recipe.pk).exists())
+
+    def test_integer_columns_do_not_drift(self):
+        spice = Item.objects.create(name='Spice', calories=4, serving_weight=100)
+        stew = Item.objects.create(name='Stew', is_meal=True)
+        for _ in range(10):
+            self.add_recipe(stew, spice, 10)
+        self.assertStoredNutritionMatches(stew)
+        self.assertEqual(stew.calories, 4)
+        self.assertEqual(stew.serving_weight, 100)
+
+        for calories in range(5, 15):
+            response = self.client.patch(f'/items/{spice.item_id}/', {'calories': calories}, format='json')
+            self.assertEqual(response.status_code, 200)
+        self.assertStoredNutritionMatches(stew)
+        self.assertEqual(stew.calories, 14)
+
+        for recipe in Recipe.objects.filter(meal=stew)[:5]:
+            self.assertEqual(self.client.delete(f'/recipes/{recipe.recipe_id}/').status_code, 204)
+        self.assertStoredNutritionMatches(stew)
+        self.assertEqual(stew.calories, 7)
+        self.assertEqual(stew.serving_weight, 50)
+
+
+class RecipeGraphTests(FitnessAppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.lunchbox = Item.objects.create(name='Lunchbox', is_meal=True)
+        self.add_recipe(self.lunchbox, self.meal, 125)
+        self.add_recipe(self.lunchbox, self.chicken, 50)
+
+    def test_flatten_expands_nested_meals_and_is_memoized(self):
+        self.assertEqual(recipe_graph.flatten(self.lunchbox.item_id), {self.rice.item_id: 75, self.chicken.item_id: 100})
+        with self.assertNumQueries(0):
+            recipe_graph.flatten(self.lunchbox.item_id)
+
+        # Changing the sub-meal invalidates every meal containing it
+        self.add_recipe(self.meal, self.rice, 250)
+        self.assertEqual(recipe_graph.flatten(self.lunchbox.item_id), {self.rice.item_id: 100, self.chicken.item_id: 75})
+        self.assertAlmostEqual(self.lunchbox.get_nutrition()['protein'], 2.7 + 31 * 0.75)
+
+    def test_cycles_are_rejected_and_detected(self):
+        response = self.client.post('/recipes/', {'meal': self.meal.item_id, 'ingredient': self.lunchbox.item_id, 'quantity': 10})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/recipes/bulk/', {
+            'meal': self.meal.item_id, 'ingredients': [{'ingredient': self.meal.item_id, 'quantity': 10}],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        Recipe.objects.create(meal=self.meal, ingredient=self.lunchbox, quantity=10)
+        MealRequirement.sync(self.meal.item_id, [self.lunchbox.item_id])
+        recipe_graph.invalidate([self.meal.item_id])
+        with self.assertRaises(recipe_graph.RecipeCycleError):
+            recipe_graph.flatten(self.lunchbox.item_id)
+
+    def test_expanded_recommendations_see_through_sub_meals(self):
+        self.log('ADD', self.rice, 75)
+        self.log('ADD', self.chicken, 100)
+        self.assertEqual(self.client.get('/meal-recommendations/').status_code, 204)
+
+        response = self.client.get('/meal-recommendations/?expand=1')
+        self.assertEqual([meal['item_id'] for meal in response.json()], [self.lunchbox.item_id])
+
+
+class RecipeBulkCreateTests(FitnessAppTestCase):
+    def test_bulk_create_requires_authentication(self):
+        bowl = Item.objects.create(name='Bowl', is_meal=True)
+        response = APIClient().post('/recipes/bulk/', {
+            'meal': bowl.item_id, 'ingredients': [{'ingredient': self.rice.item_id, 'quantity': 200}],
+        }, format='json')
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(Recipe.objects.filter(meal=bowl).exists())
+
+    def test_bulk_create_builds_meal_in_one_request(self):
+        bowl = Item.objects.create(name='Bowl', is_meal=True)
+        response = self.client.post('/recipes/bulk/', {
+            'meal': bowl.item_id,
+            'ingredients': [
+                {'ingredient': self.rice.item_id, 'quantity': 200},
+                {'ingredient': self.chicken.item_id, 'quantity': 150},
+                {'ingredient': self.rice.item_id, 'quantity': 50},
+            ],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()), 3)
+
+        bowl.refresh_from_db()
+        self.assertEqual(bowl.serving_weight, 400)
+        self.assertEqual(bowl.calories, round(130 * 2.5 + 165 * 1.5))
+        requirements = dict(MealRequirement.objects.filter(meal=bowl).values_list('ingredient', 'quantity'))
+        self.assertEqual(requirements, {self.rice.item_id: 250, self.chicken.item_id: 150})
+
+    def test_bulk_create_is_all_or_nothing(self):
+        response = self.client.post('/recipes/bulk/', {
+            'meal': self.meal.item_id,
+            'ingredients': [
+                {'ingredient': self.rice.item_id, 'quantity': 200},
+                {'ingredient': 999999, 'quantity': 150},
+            ],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Recipe.objects.filter(meal=self.meal).count(), 2)
+
+
+class ActionBatchTests(FitnessAppTestCase):
+    def sync(self, actions):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/actions/batch/', {'actions': actions}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def entry(self, key, action_type, item, quantity, **extra):
+        return {'client_key': key, 'item': item.item_id, 'ingredient': item.item_id,
+                'action_type': action_type, 'quantity': quantity, **extra}
+
+    def test_batch_is_idempotent_on_retry(self):
+        actions = [self.entry('a1', 'ADD', self.rice, 500), self.entry('a2', 'EAT', self.rice, 120)]
+        first = self.sync(actions)
+        self.assertEqual([result['status'] for result in first], ['created', 'created'])
+
+        second = self.sync(actions + [self.entry('a3', 'ADD', self.chicken, 300)])
+        self.assertEqual([result['status'] for result in second], ['duplicate', 'duplicate', 'created'])
+        self.assertEqual([result['action_id'] for result in second[:2]], [result['action_id'] for result in first])
+        self.assertEqual(Action.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(PantryItem.get_available_ingredients(self.user), {self.rice.item_id: 380, self.chicken.item_id: 300})
+
+    def test_invalid_entries_are_reported_per_item(self):
+        results = self.sync([
+            self.entry('ok', 'ADD', self.rice, 100),
+            self.entry('ok', 'ADD', self.rice, 100),
+            {**self.entry('bad-type', 'ADD', self.rice, 100), 'action_type': 'STEAL'},
+            {**self.entry('bad-item', 'ADD', self.rice, 100), 'ingredient': 999999},
+        ])
+        self.assertEqual([result['status'] for result in results], ['created', 'invalid', 'invalid', 'invalid'])
+        self.assertIn('action_type', results[2]['errors'])
+        self.assertEqual(list(results[3]['errors']), ['ingredient'])
+        self.assertEqual(Action.objects.filter(user=self.user).count(), 1)
+
+    def test_client_timestamps_feed_daily_rollup(self):
+        yesterday = timezone.now() - timedelta(days=1)
+        self.sync([self.entry('e1', 'EAT', self.chicken, 200, timestamp=yesterday.isoformat())])
+
+        action = Action.objects.get(user=self.user, client_key='e1')
+        self.assertEqual(action.timestamp, yesterday)
+        day = DailyNutrition.objects.get(user=self.user)
+        self.assertEqual(day.date, timezone.localdate(yesterday))
+        self.assertEqual(day.calories, 330)
+
+    def test_rejects_oversized_batch(self):
+        actions = [self.entry(f'k{n}', 'ADD', self.rice, 1) for n in range(1001)]
+        response = self.client.post('/actions/batch/', {'actions': actions}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class CookTests(FitnessAppTestCase):
+    def cook(self, meal, servings):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/actions/cook/', {'meal': meal.item_id, 'servings': servings}, format='json')
+
+    def test_cook_consumes_ingredients_and_produces_meal(self):
+        self.log('ADD', self.rice, 500)
+        self.log('ADD', self.chicken, 300)
+
+        response = self.cook(self.meal, 2)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['pantry_delta'], {
+            str(self.rice.item_id): -300, str(self.chicken.item_id): -200, str(self.meal.item_id): 500,
+        })
+        cooked = Action.objects.filter(action_type='COOK')
+        self.assertEqual(sorted(response.json()['action_ids']), sorted(cooked.values_list('action_id', flat=True)))
+        self.assertEqual(PantryItem.get_available_ingredients(self.user), {
+            self.rice.item_id: 200, self.chicken.item_id: 100, self.meal.item_id: 500,
+        })
+        call_command('rebuild_pantry', '--verify', stdout=StringIO())
+        self.assertEqual(self.client.get('/available-ingredients/').json()[str(self.meal.item_id)], 500)
+
+    def test_insufficient_stock_writes_nothing(self):
+        self.log('ADD', self.rice, 500)
+        self.log('ADD', self.chicken, 150)
+
+        response = self.cook(self.meal, 2)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['shortfalls'], [{'ingredient': self.chicken.item_id, 'required': 200, 'available': 150}])
+        self.assertFalse(Action.objects.filter(action_type='COOK').exists())
+        self.assertEqual(PantryItem.get_available_ingredients(self.user), {self.rice.item_id: 500, self.chicken.item_id: 150})
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.cook(self.rice, 1).status_code, 400)
+        self.assertEqual(self.cook(self.meal, 0).status_code, 400)
+        empty = Item.objects.create(name='Empty meal', is_meal=True)
+        self.assertEqual(self.cook(empty, 1).json(), {'detail': 'The meal has no recipe.'})
+
+    def test_query_count_does_not_grow_with_recipe(self):
+        for index in range(20):
+            ingredient = Item.objects.create(name=f'Spice {index}', calories=1, serving_weight=1)
+            self.add_recipe(self.meal, ingredient, 1)
+            self.log('ADD', ingredient, 10)
+        self.log('ADD', self.rice, 500)
+        self.log('ADD', self.chicken, 300)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.cook(self.meal, 1)
+        self.assertEqual(response.status_code, 201)
+        self.assertLess(len(queries), 15)
+
+
+class ItemListTests(FitnessAppTestCase):
+    def test_unpaginated_list_is_unchanged(self):
+        response = self.client.get('/items/')
+        self.assertEqual(len(response.json()), 3)
+        self.assertEqual(len(response.json()[0]), 12)
+
+    def test_cursor_pagination_walks_catalog_in_item_id_order(self):
+        Item.objects.bulk_create(Item(name=f'Food {i}') for i in range(7))
+        seen = []
+        url = '/items/?page_size=4&fields=name,calories'
+        while url:
+            page = self.client.get(url).json()
+            self.assertTrue(all(set(row) == {'item_id', 'name', 'calories'} for row in page['results']))
+            seen += [row['item_id'] for row in page['results']]
+            url = page['next']
+        self.assertEqual(seen, list(Item.objects.order_by('item_id').values_list('item_id', flat=True)))
+
+    def test_projection_matches_serializer_output(self):
+        full = self.client.get(f'/items/{self.chicken.item_id}/').json()
+        projected = self.client.get('/items/?fields=protein,is_meal,name').json()
+        self.assertIn({key: full[key] for key in ['item_id', 'protein', 'is_meal', 'name']}, projected)
+
+    def test_unknown_projection_field_is_rejected(self):
+        response = self.client.get('/items/?fields=name,password')
+        self.assertEqual(response.status_code, 400)
+
+
+class FastSerializationTests(FitnessAppTestCase):
+    def test_list_endpoints_match_model_serializers_byte_for_byte(self):
+        self.log('ADD', self.rice, 500)
+        self.log('EAT', self.rice, 120)
+        Item.objects.create(name='Crème brûlée \u2028', is_meal=False, protein=1.5)
+        for path, queryset, serializer_class in [
+            ('/items/', Item.objects.all(), ItemSerializer),
+            ('/items/?page_size=2', Item.objects.order_by('item_id')[:2], ItemSerializer),
+            ('/recipes/', Recipe.objects.all(), RecipeSerializer),
+            ('/actions/', Action.objects.all(), ActionSerializer),
+        ]:
+            expected = JSONRenderer().render(serializer_class(queryset, many=True).data)
+            content = self.client.get(path).content
+            if 'page_size' in path:
+                content = JSONRenderer().render(json.loads(content)['results'])
+            self.assertEqual(content, expected, path)
+
+    def test_converters_run_for_fields_that_need_them(self):
+        class TimedActionSerializer(serializers.ModelSerializer):
+            class Meta:
+                model = Action
+                fields = ['action_id', 'action_type', 'quantity', 'timestamp', 'client_key']
+
+        self.log('ADD', self.rice, 500)
+        fast = ValuesSerializer.for_serializer(TimedActionSerializer)
+        self.assertEqual([name for name, _ in fast.converters], ['timestamp'])
+        self.assertEqual(
+            FastJSONRenderer().render(fast.to_representation(fast.values(Action.objects.all()))),
+            JSONRenderer().render(TimedActionSerializer(Action.objects.all(), many=True).data),
+        )
+        data = {'when': timezone.now(), 'amount': Decimal('1.50'), 'text': 'a\u2029b'}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+
+@skipUnless(os.environ.get('FITNESSAPP_BENCHMARKS'), 'Set FITNESSAPP_BENCHMARKS=1 to run benchmarks.')
+class FastSerializationBenchmarkTests(FitnessAppTestCase):
+    CATALOG_SIZE = 50_000
+    MIN_SPEEDUP = 3
+
+    def test_item_list_throughput(self):
+        Item.objects.bulk_create(
+            (Item(name=f'Food {i}', calories=i % 900, serving_weight=100, protein=i / 7) for i in range(self.CATALOG_SIZE)),
+            batch_size=10000,
+        )
+        started = time.perf_counter()
+        expected = JSONRenderer().render(ItemSerializer(Item.objects.all(), many=True).data)
+        model_serializer_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        content = self.client.get('/items/').content
+        endpoint_time = time.perf_counter() - started
+        self.assertEqual(content, expected)
+        self.assertGreater(model_serializer_time / endpoint_time, self.MIN_SPEEDUP)
+
+
+class CatalogImportTests(FitnessAppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content):
+        path = Path(self.directory.name) / name
+        path.write_text(content)
+        return str(path)
+
+    def import_catalog(self, *args):
+        output, errors = StringIO(), StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_catalog', '--chunk-size', '2', *args, stdout=output, stderr=errors)
+        # The test settings use the locmem cache, which the command cannot invalidate for servers
+        self.assertIn('process-local', errors.getvalue())
+        return output.getvalue()
+
+    def test_items_and_recipes(self):
+        items = self.write('items.csv', (
+            'external_id,name,is_meal,calories,serving_weight,protein\n'
+            'usda-1,Oats,false,389.4,100,16.9\n'
+            'usda-2,Milk,,42,100,3.4\n'
+            ',Nameless,,1,1,1\n'
+            'usda-3,Porridge,true,,,\n'
+            'usda-4,Oat bowl,yes,,,\n'
+        ))
+        recipes = self.write('recipes.jsonl', '\n'.join(json.dumps(row) for row in [
+            {'meal': 'usda-3', 'ingredient': 'usda-1', 'quantity': 50},
+            {'meal': 'usda-3', 'ingredient': 'Milk', 'quantity': 200},
+            {'meal': 'usda-4', 'ingredient': 'usda-3', 'quantity': 125},
+            {'meal': 'usda-4', 'ingredient': 'Chicken', 'quantity': 100},
+            {'meal': 'Rice', 'ingredient': 'usda-1', 'quantity': 10},
+            {'meal': 'usda-3', 'ingredient': 'Unknown', 'quantity': 10},
+        ]) + '\nnot json\n')
+        output = self.import_catalog('--items', items, '--recipes', recipes)
+        self.assertIn('items: 5 rows, 4 imported, 1 invalid', output)
+        self.assertIn('recipes: 7 rows, 4 imported, 3 invalid', output)
+        self.assertIn('rows/s', output)
+
+        oats = Item.objects.get(external_id='usda-1')
+        self.assertEqual((oats.calories, oats.protein, oats.is_meal), (389, 16.9, False))
+        porridge = Item.objects.get(external_id='usda-3')
+        bowl = Item.objects.get(external_id='usda-4')
+        self.assertEqual(dict(porridge.requirements.values_list('ingredient__name', 'quantity')), {'Oats': 50, 'Milk': 200})
+        # The set-based pass matches the nested expansion used by get_nutrition, up to the
+        # rounding of the sub-meal's integer calories
+        for meal in (porridge, bowl):
+            meal.refresh_from_db()
+            expected = meal.get_nutrition()
+            self.assertAlmostEqual(meal.calories, expected['calories'], delta=1)
+            self.assertEqual(meal.serving_weight, expected['serving_weight'])
+            self.assertAlmostEqual(meal.protein, expected['protein'], delta=0.01)
+        self.assertEqual(bowl.serving_weight, 225)
+        self.assertEqual([item.name for item in search_items('porr')], ['Porridge'])
+
+    def test_reimport_updates_in_place(self):
+        items = self.write('items.jsonl', json.dumps({'external_id': 'x-1', 'name': 'Bean', 'calories': 100, 'serving_weight': 100}))
+        self.import_catalog('--items', items)
+        bowl = self.write('more.jsonl', '\n'.join(json.dumps(row) for row in [
+            {'external_id': 'x-1', 'name': 'Black bean', 'calories': 120, 'serving_weight': 100},
+            {'external_id': 'x-2', 'name': 'Bean bowl', 'is_meal': True},
+        ]))
+        recipes = self.write('recipes.csv', 'meal,ingredient,quantity\nx-2,x-1,200\n')
+        self.import_catalog('--items', bowl, '--recipes', recipes)
+        self.import_catalog('--recipes', recipes)
+
+        self.assertEqual(Item.objects.filter(external_id='x-1').get().name, 'Black bean')
+        meal = Item.objects.get(external_id='x-2')
+        self.assertEqual(meal.meal_recipes.count(), 1)
+        self.assertEqual((meal.calories, meal.serving_weight), (240, 200))
+
+    def test_cycle_rolls_back(self):
+        items = self.write('items.csv', 'external_id,name,is_meal\nm-1,Stew,1\nm-2,Stock,1\n')
+        recipes = self.write('recipes.csv', 'meal,ingredient,quantity\nm-1,m-2,10\nm-2,m-1,10\n')
+        with self.assertRaisesMessage(CommandError, 'Recipe cycle'):
+            self.import_catalog('--items', items, '--recipes', recipes)
+        self.assertFalse(Item.objects.filter(external_id__isnull=False).exists())
+
+
+class ItemSearchTests(FitnessAppTestCase):
+    def search(self, query, **params):
+        response = self.client.get('/items/search/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [item['name'] for item in response.json()]
+
+    def test_prefix_search_ranks_and_filters(self):
+        Item.objects.create(name='Brown rice')
+        Item.objects.create(name='Rice pudding', is_meal=True)
+
+        self.assertEqual(self.search('ric'), ['Rice', 'Rice pudding', 'Brown rice', 'Chicken rice'])
+        self.assertEqual(self.search('ric', is_meal='true'), ['Rice pudding', 'Chicken rice'])
+        self.assertEqual(self.search('chick ric'), ['Chicken rice'])
+        self.assertEqual(self.search('ric', limit=1), ['Rice'])
+
+    def test_index_follows_item_writes(self):
+        self.client.patch(f'/items/{self.rice.item_id}/', {'name': 'Basmati'}, format='json')
+        self.client.post('/items/', {'name': 'Basil'})
+        self.assertEqual(self.search('bas'), ['Basil', 'Basmati'])
+        self.assertEqual(self.search('rice'), ['Chicken rice'])
+
+    def test_fallback_matches_tokens_like_fts(self):
+        Item.objects.create(name='Brown rice')
+        Item.objects.create(name='Rice pudding', is_meal=True)
+        Item.objects.create(name='Licorice')
+        for query in ['ric', 'chick ric', 'ric chick', 'rice pud', 'orice']:
+            expected = [item.name for item in search_items(query)]
+            with mock.patch.object(connection, 'vendor', 'postgresql'):
+                self.assertEqual([item.name for item in search_items(query)], expected, query)
+        self.assertEqual([item.name for item in search._search_fallback(['chick', 'ric'], 20, None)], ['Chicken rice'])
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.assertEqual(self.search('"rice*:'), ['Rice', 'Chicken rice'])
+        self.assertEqual(self.client.get('/items/search/').status_code, 400)
+
+
+@skipUnless(os.environ.get('FITNESSAPP_BENCHMARKS'), 'Set FITNESSAPP_BENCHMARKS=1 to run benchmarks.')
+class ItemSearchBenchmarkTests(FitnessAppTestCase):
+    CATALOG_SIZE = 500_000
+    QUERY_BUDGET = 0.5
+    WORDS = ['apple', 'banana', 'bread', 'cheese', 'chicken', 'oat', 'rice', 'salmon', 'tofu', 'yogurt']
+
+    def test_search_latency_on_large_catalog(self):
+        Item.objects.bulk_create((
+            Item(name=f'{self.WORDS[i % 10]} {self.WORDS[(i // 10) % 10]} {i}', is_meal=i % 3 == 0)
+            for i in range(self.CATALOG_SIZE)
+        ), batch_size=10000)
+
+        for query, params in [('chi', {}), ('rice sal', {}), ('yog', {'is_meal': 'true'})]:
+            started = time.perf_counter()
+            self.client.get('/items/search/', {'q': query, 'limit': 20, **params})
+            self.assertLess(time.perf_counter() - started, self.QUERY_BUDGET, query)
+
+
+class MealPlanTests(FitnessAppTestCase):
+    def set_goals(self, **goals):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch('/user-settings/', goals, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_plan_approaches_goals_within_stock(self):
+        self.set_goals(goal_calories=600, goal_protein=45, goal_carbs=90, goal_fats=6)
+        self.log('ADD', self.rice, 1000)
+        self.log('ADD', self.chicken, 120)
+
+        response = self.client.get('/meal-plan/')
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertTrue(body['plan'])
+        used = {}
+        for entry in body['plan']:
+            uses = {self.rice.item_id: 0.6, self.chicken.item_id: 0.4} if entry['source'] == 'cook' else {entry['item_id']: 1}
+            for item_id, share in uses.items():
+                used[item_id] = used.get(item_id, 0) + share * entry['quantity']
+        self.assertLessEqual(used.get(self.chicken.item_id, 0), 120 + 1e-6)
+        self.assertLessEqual(used.get(self.rice.item_id, 0), 1000 + 1e-6)
+        self.assertAlmostEqual(body['totals']['calories'], 600, delta=60)
+
+    def test_plan_subtracts_what_was_eaten_today(self):
+        self.log('ADD', self.chicken, 500)
+        self.log('EAT', self.chicken, 100)
+        body = self.client.get('/meal-plan/').json()
+        self.assertAlmostEqual(body['remaining']['calories'], 2000 - 165)
+        self.assertAlmostEqual(body['remaining']['protein'], 150 - 31)
+
+    def test_zero_gram_recipe_rows_are_ignored(self):
+        egg = Item.objects.create(name='Egg', calories=155, serving_weight=100, protein=13, fats_saturated=3, fats_unsaturated=8)
+        salt = Item.objects.create(name='Salt', serving_weight=100)
+        omelette = Item.objects.create(name='Omelette', is_meal=True)
+        self.add_recipe(omelette, egg, 100)
+        self.add_recipe(omelette, salt, 0)
+        self.log('ADD', egg, 300)
+        self.log('ADD', salt, 50)
+
+        response = self.client.get('/meal-plan/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['plan'])
+        goals, _ = planner.get_remaining_goals(self.user)
+        candidates, _ = planner.get_candidates(self.user, goals)
+        cook = [candidate for candidate in candidates if candidate.source == 'cook' and candidate.item == omelette]
+        self.assertEqual([candidate.uses for candidate in cook], [{egg.item_id: 1.0}])
+
+    def test_planner_respects_time_budget_on_large_catalogs(self):
+        rng = random.Random(7)
+        goals = {'calories': 2000, 'protein': 150, 'carbs': 250, 'fats': 45}
+        candidates, stock = [], {}
+        for item_id in range(1, 5001):
+            item = Item(item_id=item_id, name=f'Food {item_id}', serving_weight=100, calories=rng.randint(50, 400),
+                        protein=rng.uniform(0, 30), carbs_starch=rng.uniform(0, 60), fats_saturated=rng.uniform(0, 15))
+            candidates.append(planner.Candidate(item, 'pantry', DailyNutrition.get_eaten_totals(item, 1), goals, {item_id: 1.0}))
+            stock[item_id] = 200
+
+        started = time.perf_counter()
+        portions = planner.plan(candidates, stock, goals, goals)
+        self.assertLess(time.perf_counter() - started, 0.1)
+        self.assertTrue(portions)
+        self.assertTrue(all(grams <= 200 for grams in portions.values()))
+
+
+class DailySummaryTests(FitnessAppTestCase):
+    def test_eat_actions_maintain_daily_rollup(self):
+        self.log('ADD', self.rice, 500)
+        self.log('EAT', self.rice, 200)
+        eaten = self.log('EAT', self.chicken, 100)
+
+        rollup = DailyNutrition.objects.get(user=self.user)
+        self.assertAlmostEqual(rollup.calories, 260 + 165)
+        self.assertAlmostEqual(rollup.protein, 5.4 + 31)
+        self.assertAlmostEqual(rollup.carbs, 56)
+        self.assertAlmostEqual(rollup.fats, 3.6)
+
+        self.client.delete(f'/actions/{eaten.action_id}/')
+        rollup.refresh_from_db()
+        self.assertAlmostEqual(rollup.calories, 260)
+
+    def test_delete_subtracts_the_recorded_contribution(self):
+        # The macros are set before the insert, without a second write to the action row
+        with CaptureQueriesContext(connection) as queries:
+            eaten = self.log('EAT', self.chicken, 100)
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE "FitnessApp_action"')])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/actions/batch/', {'actions': [
+                {'client_key': 'offline-1', 'item': self.rice.item_id, 'ingredient': self.rice.item_id, 'action_type': 'EAT', 'quantity': 50},
+            ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertAlmostEqual(Action.objects.get(client_key='offline-1').calories, 65)
+
+        self.client.patch(f'/items/{self.chicken.item_id}/', {'calories': 300}, format='json')
+        self.client.patch(f'/items/{self.rice.item_id}/', {'calories': 10}, format='json')
+        self.client.delete(f'/actions/{eaten.action_id}/')
+        self.client.delete(f"/actions/{Action.objects.get(client_key='offline-1').action_id}/")
+        rollup = DailyNutrition.objects.get(user=self.user)
+        for field in DailyNutrition.TOTAL_FIELDS:
+            self.assertAlmostEqual(getattr(rollup, field), 0)
+
+    def test_summary_reports_progress_against_goals(self):
+        self.client.patch('/user-settings/', {'goal_calories': 2600, 'goal_fats': 0}, format='json')
+        self.log('EAT', self.rice, 200)
+
+        today = timezone.localdate()
+        yesterday = today - timedelta(days=1)
+        response = self.client.get('/daily-summary/', {'since': yesterday.isoformat()})
+        days = response.json()['days']
+        self.assertEqual([day['date'] for day in days], [yesterday.isoformat(), today.isoformat()])
+        self.assertEqual(days[0]['calories'], 0)
+        self.assertAlmostEqual(days[1]['progress']['calories'], 0.1)
+        self.assertIsNone(days[1]['progress']['fats'])
+
+        self.assertEqual(self.client.get('/daily-summary/', {'since': 'yesterday'}).status_code, 400)
+
+
+class EatenFoodTests(FitnessAppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.eaten = []
+        for day in (3, 2, 1):
+            action = self.log('EAT', self.rice, day * 10)
+            action.timestamp = timezone.now() - timedelta(days=day)
+            action.save()
+            self.eaten.append(action)
+
+    def test_range_and_limit(self):
+        since = (timezone.localdate() - timedelta(days=2)).isoformat()
+        response = self.client.get('/eaten-food/', {'since': since})
+        self.assertEqual([row['quantity'] for row in response.json()], [20, 10])
+
+        response = self.client.get('/eaten-food/', {'until': self.eaten[1].timestamp.isoformat(), 'limit': 1})
+        self.assertEqual([row['action_id'] for row in response.json()], [self.eaten[0].action_id])
+
+        self.assertEqual(self.client.get('/eaten-food/', {'limit': 'all'}).status_code, 400)
+
+    def test_ndjson_export_streams_same_rows(self):
+        response = self.client.get('/eaten-food/', {'export': 'ndjson'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], self.client.get('/eaten-food/').json())
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Query plans are captured with SQLite EXPLAIN QUERY PLAN.')
+class QueryPlanTests(FitnessAppTestCase):
+    HOT_TABLES = ('FitnessApp_action', 'FitnessApp_recipe', 'FitnessApp_pantryitem', 'FitnessApp_mealrequirement', 'FitnessApp_dailynutrition')
+
+    def setUp(self):
+        super().setUp()
+        self.log('ADD', self.rice, 500)
+        self.log('ADD', self.chicken, 300)
+        self.log('EAT', self.rice, 100)
+
+    def get_query_plans(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data, format='json')
+        self.assertLess(response.status_code, 400, url)
+
+        plans = []
+        with connection.cursor() as cursor:
+            for query in queries.captured_queries:
+                if not query['sql'].lstrip().upper().startswith('SELECT'):
+                    continue
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                plans.append((query['sql'], [row[-1] for row in cursor.fetchall()]))
+        return plans
+
+    def assertNoFullScans(self, method, url, data=None):
+        for sql, plan in self.get_query_plans(method, url, data):
+            for step in plan:
+                # "SCAN <table>" without an index is a full table scan; SEARCH and index scans are fine
+                words = step.split()
+                if words[0] == 'SCAN' and words[1] in self.HOT_TABLES and 'INDEX' not in step:
+                    self.fail(f'{url} full scan of {words[1]}: {step}\n{sql}')
+
+    def assertUsesIndex(self, url, index_name):
+        steps = [step for _, plan in self.get_query_plans('get', url) for step in plan]
+        self.assertTrue(any(index_name in step for step in steps), f'{url} does not use {index_name}: {steps}')
+
+    def test_hot_endpoints_use_indexes(self):
+        for url in ['/available-ingredients/', '/meal-recommendations/', '/meal-recommendations/?mode=partial',
+                    '/eaten-food/', '/daily-summary/',
+                    f'/items/{self.meal.item_id}/ingredients/']:
+            self.assertNoFullScans('get', url)
+
+        self.assertNoFullScans('post', '/actions/', {
+            'item': self.rice.item_id, 'ingredient': self.rice.item_id, 'action_type': 'EAT', 'quantity': 10,
+        })
+        self.assertNoFullScans('post', '/recipes/', {'meal': self.meal.item_id, 'ingredient': self.rice.item_id, 'quantity': 10})
+        self.assertNoFullScans('patch', f'/items/{self.rice.item_id}/', {'protein': 3})
+
+        self.assertUsesIndex('/eaten-food/', 'action_user_type_time_idx')
+        self.assertUsesIndex(f'/items/{self.meal.item_id}/ingredients/', 'COVERING INDEX recipe_meal_ingr_qty_idx')
+
+    def test_log_replay_uses_user_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            Action.get_balances(self.user)
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + queries.captured_queries[0]['sql'])
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('USING', plan)
+
+
+class ResponseCacheTests(FitnessAppTestCase):
+    def test_unchanged_pantry_is_not_modified(self):
+        self.log('ADD', self.rice, 500)
+        response = self.client.get('/available-ingredients/')
+        etag = response['ETag']
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/available-ingredients/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(queries), 0)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/available-ingredients/')
+        self.assertEqual(response.json(), {str(self.rice.item_id): 500})
+        self.assertEqual(len(queries), 0)
+
+    def test_action_writes_invalidate_pantry(self):
+        self.log('ADD', self.rice, 500)
+        etag = self.client.get('/available-ingredients/')['ETag']
+        eaten = self.log('EAT', self.rice, 100)
+
+        response = self.client.get('/available-ingredients/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {str(self.rice.item_id): 400})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/actions/{eaten.action_id}/')
+        self.assertEqual(self.client.get('/available-ingredients/').json(), {str(self.rice.item_id): 500})
+
+    def test_catalog_writes_invalidate_recommendations(self):
+        self.log('ADD', self.rice, 150)
+        self.log('ADD', self.chicken, 100)
+        etag = self.client.get('/meal-recommendations/')['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/items/{self.rice.item_id}/', {'name': 'White rice'}, format='json')
+        response = self.client.get('/meal-recommendations/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class CachedAuthenticationTests(FitnessAppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.log('ADD', self.rice, 500)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_cached_user_and_response_need_no_queries(self):
+        self.assertEqual(self.client.get('/available-ingredients/').status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/available-ingredients/')
+        self.assertEqual(response.json(), {str(self.rice.item_id): 500})
+        self.assertEqual(len(queries), 0)
+
+    def test_settings_are_served_from_the_cached_user(self):
+        self.client.get('/available-ingredients/')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/user-settings/')
+        self.assertEqual(response.json()['goal_calories'], 2000)
+        self.assertEqual(len(queries), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch('/user-settings/', {'goal_calories': 1800}, format='json')
+        self.assertEqual(self.client.get('/daily-summary/').json()['goals']['calories'], 1800)
+
+    def test_deactivation_and_password_change_invalidate(self):
+        self.assertEqual(self.client.get('/available-ingredients/').status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.client.get('/available-ingredients/').status_code, 401)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = True
+            self.user.save()
+        with mock.patch.object(jwt_settings, 'CHECK_REVOKE_TOKEN', True):
+            token = AccessToken.for_user(self.user)
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+            self.assertEqual(self.client.get('/available-ingredients/').status_code, 200)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.user.set_password('new-secret-password')
+                self.user.save()
+            self.assertEqual(self.client.get('/available-ingredients/').status_code, 401)
+
+
+    def test_deploy_check_warns_about_a_process_local_cache(self):
+        self.assertEqual([warning.id for warning in check_auth_cache_is_shared(None)], ['FitnessApp.W001'])
+        with override_settings(FITNESSAPP_AUTH_CACHE_TIMEOUT=0):
+            self.assertEqual(check_auth_cache_is_shared(None), [])
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'cache'}}):
+            self.assertEqual(check_auth_cache_is_shared(None), [])
+class AsyncViewTests(FitnessAppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.log('ADD', self.rice, 500)
+        self.log('ADD', self.chicken, 200)
+        self.log('EAT', self.rice, 120)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_async_endpoints_match_sync_ones(self):
+        for path in ['/items/', f'/items/{self.rice.item_id}/', '/items/999999/', f'/items/{self.meal.item_id}/ingredients/',
+                     f'/items/{self.rice.item_id}/ingredients/', '/available-ingredients/', '/eaten-food/?limit=5',
+                     '/eaten-food/?since=nope', '/meal-recommendations/']:
+            sync_response = self.client.get(path)
+            async_response = self.client.get('/async' + path)
+            self.assertEqual(async_response.status_code, sync_response.status_code, path)
+            self.assertEqual(async_response.content, sync_response.content, path)
+
+    async def test_async_client_authentication(self):
+        client = AsyncClient()
+        response = await client.get('/async/available-ingredients/')
+        self.assertEqual(response.status_code, 401)
+        response = await client.get('/async/available-ingredients/', headers={'Authorization': 'Bearer not-a-token'})
+        self.assertEqual(response.status_code, 401)
+
+        token = await sync_to_async(AccessToken.for_user)(self.user)
+        response = await client.get('/async/available-ingredients/', headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.json(), {str(self.rice.item_id): 380, str(self.chicken.item_id): 200})
+
+
+class DatabaseProfileTests(TestCase):
+    def test_sqlite_profile_is_the_default(self):
+        default = get_databases(Path('/srv'), {})['default']
+        self.assertEqual(default['NAME'], Path('/srv/db.sqlite3'))
+        self.assertEqual(default['OPTIONS'], {'transaction_mode': 'IMMEDIATE', 'timeout': 5})
+
+    def test_postgresql_profiles(self):
+        environ = {'FITNESSAPP_DB_ENGINE': 'postgresql', 'FITNESSAPP_DB_NAME': 'fitness', 'FITNESSAPP_DB_CONN_MAX_AGE': '300'}
+        default = get_databases(Path('/srv'), environ)['default']
+        self.assertEqual((default['NAME'], default['CONN_MAX_AGE'], default['CONN_HEALTH_CHECKS']), ('fitness', 300, True))
+
+        default = get_databases(Path('/srv'), {**environ, 'FITNESSAPP_DB_POOL': '1', 'FITNESSAPP_DB_POOL_MAX_SIZE': '8'})['default']
+        self.assertEqual(default['CONN_MAX_AGE'], 0)
+        self.assertEqual(default['OPTIONS']['pool'], {'min_size': 2, 'max_size': 8})
+
+        with self.assertRaises(ImproperlyConfigured):
+            get_databases(Path('/srv'), {'FITNESSAPP_DB_ENGINE': 'mysql'})
+
+    @skipUnless(connection.vendor == 'sqlite', 'Checks the SQLite connection hook.')
+    def test_sqlite_connections_get_pragmas(self):
+        with tempfile.TemporaryDirectory() as directory:
+            wrapper = connections['default'].__class__({**connection.settings_dict, 'NAME': str(Path(directory) / 'pragmas.sqlite3')}, 'pragmas')
+            try:
+                with wrapper.cursor() as cursor:
+                    pragmas = [cursor.execute(f'PRAGMA {name}').fetchone()[0] for name in ('journal_mode', 'synchronous', 'busy_timeout')]
+            finally:
+                wrapper.close()
+        self.assertEqual(pragmas, ['wal', 1, 5000])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Uses a separate SQLite file as the replica.')
+@override_settings(FITNESSAPP_READ_REPLICAS=['replica'])
+class ReplicaRoutingTests(FitnessAppTestCase):
+    """The replica is an empty, migrated SQLite file, so replica reads miss everything written in a test."""
+    @classmethod
+    def setUpClass(cls):
+        # Set here as the test runner checks the class attribute before the alias exists
+        cls.databases = {'default', 'replica'}
+        cls.replica_directory = tempfile.TemporaryDirectory()
+        connections.settings['replica'] = {
+            **connections['default'].settings_dict, 'NAME': str(Path(cls.replica_directory.name) / 'replica.sqlite3'),
+        }
+        call_command('migrate', database='replica', verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        cls.replica_directory.cleanup()
+
+    def expire_pin(self):
+        get_cache().delete_many([f'fitnessapp:replica:sticky:{self.user.pk}', CATALOG_STICKY_KEY])
+
+    def test_listed_views_read_from_replica(self):
+        self.expire_pin()
+        self.assertEqual(self.client.get('/items/').json(), [])
+        self.assertEqual(self.client.get(f'/items/{self.rice.item_id}/').status_code, 404)
+        self.assertEqual(len(self.client.get('/recipes/').json()), 2)
+
+    def test_user_views_read_from_replica(self):
+        self.log('ADD', self.rice, 500)
+        self.log('EAT', self.rice, 100)
+        self.expire_pin()
+        get_cache().clear()
+        self.assertEqual(self.client.get(f'/items/{self.meal.item_id}/ingredients/').status_code, 404)
+        self.assertEqual(self.client.get('/eaten-food/').status_code, 404)
+        self.assertEqual(self.client.get('/meal-recommendations/').status_code, 404)
+
+    def test_catalog_write_pins_every_user_to_primary(self):
+        self.expire_pin()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/items/{self.rice.item_id}/', {'protein': 3}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(f'/items/{self.rice.item_id}/').json()['protein'], 3)
+        self.assertEqual(len(APIClient().get(f'/items/{self.meal.item_id}/ingredients/').json()), 2)
+
+        self.expire_pin()
+        self.assertEqual(APIClient().get(f'/items/{self.meal.item_id}/ingredients/').status_code, 404)
+
+    def test_action_write_pins_user_to_primary(self):
+        self.log('ADD', self.rice, 500)
+        response = self.client.get('/available-ingredients/')
+        self.assertEqual(response.json(), {str(self.rice.item_id): 500})
+
+        self.expire_pin()
+        get_cache().clear()
+        self.assertEqual(self.client.get('/available-ingredients/').status_code, 404)
+
+    def test_router_only_routes_marked_reads(self):
+        router = ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Item))
+        token = use_replica.set(True)
+        try:
+            self.assertEqual(router.db_for_read(Item), 'replica')
+            self.assertEqual(router.db_for_write(Item), 'default')
+        finally:
+            use_replica.reset(token)
+
+    def test_replicas_from_environment(self):
+        databases = get_databases(Path('/srv'), {'FITNESSAPP_DB_REPLICAS': 'a.sqlite3, b.sqlite3'})
+        self.assertEqual([databases[alias]['NAME'] for alias in ('replica1', 'replica2')], ['a.sqlite3', 'b.sqlite3'])
+        self.assertEqual(databases['replica1']['TEST'], {'MIRROR': 'default'})
+
+
+class MetricsTests(FitnessAppTestCase):
+    def setUp(self):
+        super().setUp()
+        registry.reset()
+
+    def test_requests_are_recorded_per_url_name(self):
+        self.log('ADD', self.rice, 500)
+        self.client.get('/available-ingredients/')
+        self.client.get(f'/items/{self.meal.item_id}/ingredients/')
+
+        self.user.is_staff = True
+        response = self.client.get('/metrics/')
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        text = response.content.decode()
+        self.assertIn('fitnessapp_responses_total{view="action_list_create",method="POST",status="201"} 1', text)
+
+        snapshot = parse_prometheus(text)
+        self.assertEqual(snapshot, {view: stats for view, stats in registry.snapshot().items() if view != 'metrics'})
+        self.assertEqual(snapshot['item_ingredients']['db_queries']['sum'], 2)
+        self.assertGreater(snapshot['available_ingredients']['serialization_duration_seconds']['sum'], 0)
+
+        output = StringIO()
+        call_command('metrics_top', '--sort', 'queries', stdout=output)
+        self.assertEqual(output.getvalue().splitlines()[1].split()[0], 'action_list_create')
+        self.assertEqual({row['view'] for row in summarize(snapshot)}, {'action_list_create', 'available_ingredients', 'item_ingredients'})
+
+    def test_metrics_are_restricted_to_staff(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        self.assertEqual(APIClient().get('/metrics/').status_code, 401)
+
+    def test_metrics_top_sends_the_token(self):
+        self.client.get('/items/')
+        self.user.is_staff = True
+        self.user.save()
+
+        def fetch(request):
+            # Serves the request from the test client, with the headers metrics_top set
+            response = APIClient().get('/metrics/', HTTP_AUTHORIZATION=request.get_header('Authorization'))
+            self.assertEqual(response.status_code, 200)
+            return contextlib.closing(mock.Mock(read=lambda: response.content))
+
+        output = StringIO()
+        with mock.patch('FitnessApp.management.commands.metrics_top.urlopen', fetch):
+            call_command('metrics_top', '--url', 'http://testserver/metrics/', '--token', str(AccessToken.for_user(self.user)), stdout=output)
+        self.assertEqual(output.getvalue().splitlines()[1].split()[0], 'item_list_create')
+
+    @override_settings(FITNESSAPP_METRICS={'SAMPLE_RATE': 0.0})
+    def test_sampling_can_disable_recording(self):
+        self.client.get('/items/')
+        self.assertEqual(registry.snapshot(), {})
+
+
+@override_settings(FITNESSAPP_READ_REPLICAS=[])
+class BenchmarkHarnessTests(TestCase):
+    def test_every_route_has_a_scenario(self):
+        self.assertEqual({scenario.route for scenario in get_scenarios()}, get_route_names())
+
+    def run_benchmark(self, baseline, *args):
+        call_command('benchmark_api', '--scale', 'smoke', '--requests', '2', '--current-db',
+                     '--baseline', str(baseline), *args, stdout=StringIO())
+
+    def test_smoke_run_writes_baseline(self):
+        with tempfile.TemporaryDirectory() as directory:
+            baseline = Path(directory) / 'baseline.json'
+            self.run_benchmark(baseline, '--write-baseline')
+            results = json.loads(baseline.read_text())['results']
+        self.assertEqual(set(results), {scenario.name for scenario in get_scenarios()})
+        self.assertEqual({name for name, row in results.items() if row['errors']}, set())
+
+    def test_query_count_regression_fails_run(self):
+        with tempfile.TemporaryDirectory() as directory:
+            baseline = Path(directory) / 'baseline.json'
+            baseline.write_text(json.dumps({'scale': 'smoke', 'results': {'pantry': {'queries': 0, 'p95_ms': 1000}}}))
+            with self.assertRaisesRegex(CommandError, 'pantry: 3 queries, baseline 0'):
+                self.run_benchmark(baseline, '--only', 'pantry')
+
+
+class PantryQueryTests(FitnessAppTestCase):
+    def test_log_replay_reads_snapshot_and_tail(self):
+        self.log('ADD', self.rice, 500)
+        self.log('COOK', self.meal, 150, ingredient=self.rice)
+        self.log('EAT', self.meal, 100)
+        action = Action.objects.select_related('user').first()
+
+        # Latest snapshot entries plus one grouped query over the actions after it
+        with CaptureQueriesContext(connection) as queries:
+            available = action.get_available_ingredients()
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(available, {self.rice.item_id: 350, self.meal.item_id: 50})
+
+
+@skipUnless(os.environ.get('FITNESSAPP_BENCHMARKS'), 'Set FITNESSAPP_BENCHMARKS=1 to run benchmarks.')
+class PantryBenchmarkTests(FitnessAppTestCase):
+    ACTIONS_PER_USER = 100_000
+    LOG_REPLAY_BUDGET = 2.0
+    ENDPOINT_BUDGET = 0.25
+
+    def seed_actions(self, user):
+        items = [self.rice, self.chicken]
+        Item.objects.bulk_create(Item(name=f'Food {i}', calories=100, serving_weight=100) for i in range(200))
+        items += list(Item.objects.filter(name__startswith='Food '))
+        action_types = ['ADD', 'ADD', 'EAT', 'DISPOSE']
+        Action.objects.bulk_create((
+            Action(user=user, item=items[i % len(items)], ingredient=items[i % len(items)],
+                   action_type=action_types[i % len(action_types)], quantity=10)
+            for i in range(self.ACTIONS_PER_USER)
+        ), batch_size=5000)
+
+    def test_available_ingredients_at_100k_actions(self):
+        self.seed_actions(self.user)
+        other_user = User.objects.create_user(username='bob', password='secret-password')
+        self.seed_actions(other_user)
+
+        action = Action.objects.select_related('user').filter(user=self.user).first()
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            expected = action.get_available_ingredients()
+        # Latest snapshot entries plus the grouped tail, as in PantryQueryTests
+        self.assertEqual(len(queries), 2)
+        self.assertLess(time.perf_counter() - started, self.LOG_REPLAY_BUDGET)
+
+        PantryItem.rebuild_for_user(self.user)
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/available-ingredients/')
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(response.json(), {str(k): v for k, v in expected.items()})
+        self.assertLessEqual(len(queries), 2)
+        self.assertLess(elapsed, self.ENDPOINT_BUDGET)
@@ -1,16 +1,34 @@
 # views.py
+from datetime import datetime, time, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework import generics
+from rest_framework.exceptions import ValidationError
+from rest_framework.utils.encoders import JSONEncoder
 from rest_framework_simplejwt.tokens import AccessToken
 
-from .models import Item, Recipe, Action, UserSettings
+from .models import Item, Recipe, Action, UserSettings, PantryItem, MealRequirement, DailyNutrition, InsufficientStockError
+from .caching import bump_catalog_version, cache_user_response
+from .metrics import registry
+from .fast_serializers import FastListMixin
+from .pagination import ItemCursorPagination
+from .routers import ReplicaReadMixin, pin_catalog_to_primary
+from .search import search_items, DEFAULT_LIMIT, MAX_LIMIT
+from .nutrition import apply_recipes, per_gram_values, propagate_item_update
+from .planner import build_plan
+from . import recipe_graph
 from .serializers import ItemSerializer, RecipeSerializer, ActionSerializer, UserRegistrationSerializer, \
-    UserSettingsSerializer, CustomTokenObtainPairSerializer
+    UserSettingsSerializer, CustomTokenObtainPairSerializer, ActionBatchEntrySerializer, CookSerializer
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated, IsAuthenticatedOrReadOnly
 
 class UserRegistrationView(generics.CreateAPIView):
     serializer_class = UserRegistrationSerializer
@@ -31,15 +49,68 @@ class UserSettingsView(generics.RetrieveUpdateAPIView):
     permission_classes = [IsAuthenticated]
 
     def get_object(self):
-        return UserSettings.objects.get_or_create(user=self.request.user)[0]
+        return UserSettings.for_user(self.request.user)
 
-class ItemListCreateView(generics.ListCreateAPIView):
+class ItemListCreateView(ReplicaReadMixin, FastListMixin, generics.ListCreateAPIView):
     queryset = Item.objects.all()
     serializer_class = ItemSerializer
+    pagination_class = ItemCursorPagination
+
+    def get_requested_fields(self):
+        fields = self.request.query_params.get('fields')
+        if not fields:
+            return None
+
+        requested = [field.strip() for field in fields.split(',') if field.strip()]
+        unknown = set(requested) - {field.name for field in Item._meta.concrete_fields}
+        if unknown:
+            raise ValidationError({'fields': f"Unknown fields: {', '.join(sorted(unknown))}."})
+        # item_id is always returned, it is the pagination cursor and how clients fetch details
+        return ['item_id'] + [field for field in dict.fromkeys(requested) if field != 'item_id']
+
+    def list(self, request, *args, **kwargs):
+        fields = self.get_requested_fields()
+        if fields is None:
+            return super().list(request, *args, **kwargs)
+
+        # Projected rows are plain column values, identical to what ItemSerializer would render
+        queryset = self.filter_queryset(self.get_queryset()).values(*fields)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(page)
+        return Response(list(queryset))
+
+    def perform_create(self, serializer):
+        serializer.save()
+        bump_catalog_version()
+        pin_catalog_to_primary()
+
+class ItemSearchView(APIView):
+    def get(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '')
+        if not query.strip():
+            return Response({"detail": "Query parameter 'q' is required."}, status=status.HTTP_400_BAD_REQUEST)
 
-class ItemDetailView(generics.RetrieveAPIView):
+        is_meal = request.query_params.get('is_meal')
+        if is_meal is not None:
+            if is_meal.lower() not in ('true', 'false', '1', '0'):
+                return Response({"detail": "is_meal must be true or false."}, status=status.HTTP_400_BAD_REQUEST)
+            is_meal = is_meal.lower() in ('true', '1')
+
+        try:
+            limit = min(int(request.query_params.get('limit', DEFAULT_LIMIT)), MAX_LIMIT)
+        except ValueError:
+            return Response({"detail": "limit must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            return Response({"detail": "limit must be positive."}, status=status.HTTP_400_BAD_REQUEST)
+
+        items = search_items(query, limit=limit, is_meal=is_meal)
+        return Response(ItemSerializer(items, many=True).data, status=status.HTTP_200_OK)
+
+class ItemDetailView(ReplicaReadMixin, generics.RetrieveUpdateAPIView):
     queryset = Item.objects.all()
     serializer_class = ItemSerializer
+    permission_classes = [IsAuthenticatedOrReadOnly]
 
     def get(self, request, *args, **kwargs):
         item = self.get_object()
@@ -47,15 +118,23 @@ class ItemDetailView(generics.RetrieveAPIView):
         data = serializer.data
         return Response(data)
 
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            old_per_gram = per_gram_values(serializer.instance)
+            item = serializer.save()
+            propagate_item_update(item, old_per_gram)
+            bump_catalog_version()
+            pin_catalog_to_primary()
+
 
-class ItemIngredientsView(APIView):
+class ItemIngredientsView(ReplicaReadMixin, APIView):
     def get(self, request, item_id, *args, **kwargs):
         try:
             item = Item.objects.get(pk=item_id)
             if not item.is_meal:
                 return Response({"detail": "Item is not a meal."}, status=status.HTTP_400_BAD_REQUEST)
 
-            recipes = Recipe.objects.filter(meal=item)
+            recipes = Recipe.objects.filter(meal=item).select_related('ingredient')
             ingredients = [
                 {
                     "ingredient_id": recipe.ingredient.item_id,
@@ -68,90 +147,337 @@ class ItemIngredientsView(APIView):
         except Item.DoesNotExist:
             return Response({"detail": "Item not found."}, status=status.HTTP_404_NOT_FOUND)
 
-class RecipeListCreateView(generics.ListCreateAPIView):
+class RecipeListCreateView(FastListMixin, generics.ListCreateAPIView):
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
 
     def perform_create(self, serializer):
-        recipe = serializer.save()
-        meal = recipe.meal
-        meal_nutrition = meal.get_nutrition()
-        meal.calories = meal_nutrition['calories']
-        meal.serving_weight = meal_nutrition['serving_weight']
-        meal.protein = meal_nutrition['protein']
-        meal.fats_saturated = meal_nutrition['fats_saturated']
-        meal.fats_unsaturated = meal_nutrition['fats_unsaturated']
-        meal.carbs_sugar = meal_nutrition['carbs_sugar']
-        meal.carbs_fiber = meal_nutrition['carbs_fiber']
-        meal.carbs_starch = meal_nutrition['carbs_starch']
-        meal.save()
-
-class ActionListCreateView(generics.ListCreateAPIView):
+        meal, ingredient = serializer.validated_data['meal'], serializer.validated_data['ingredient']
+        try:
+            recipe_graph.check_new_ingredients(meal.pk, [ingredient.pk])
+        except recipe_graph.RecipeCycleError as error:
+            raise ValidationError({"ingredient": [str(error)]})
+
+        with transaction.atomic():
+            recipe = serializer.save()
+            MealRequirement.sync(recipe.meal_id, [recipe.ingredient_id])
+            apply_recipes(recipe.meal, [recipe])
+            recipe_graph.invalidate([recipe.meal_id])
+            bump_catalog_version()
+            pin_catalog_to_primary()
+
+class RecipeBulkCreateView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        ingredients = request.data.get('ingredients')
+        if not isinstance(ingredients, list) or not ingredients:
+            return Response({"detail": "ingredients must be a non-empty list."}, status=status.HTTP_400_BAD_REQUEST)
+
+        meal_id = request.data.get('meal')
+        serializer = RecipeSerializer(
+            data=[dict(entry, meal=meal_id) if isinstance(entry, dict) else entry for entry in ingredients],
+            many=True,
+        )
+        serializer.is_valid(raise_exception=True)
+        try:
+            recipe_graph.check_new_ingredients(
+                serializer.validated_data[0]['meal'].pk, [attrs['ingredient'].pk for attrs in serializer.validated_data]
+            )
+        except recipe_graph.RecipeCycleError as error:
+            return Response({"detail": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            recipes = Recipe.objects.bulk_create(Recipe(**attrs) for attrs in serializer.validated_data)
+            meal = recipes[0].meal
+            MealRequirement.sync(meal.pk, [recipe.ingredient_id for recipe in recipes])
+            apply_recipes(meal, recipes)
+            recipe_graph.invalidate([meal.pk])
+            bump_catalog_version()
+            pin_catalog_to_primary()
+
+        return Response(RecipeSerializer(recipes, many=True).data, status=status.HTTP_201_CREATED)
+
+class RecipeDetailView(generics.RetrieveDestroyAPIView):
+    queryset = Recipe.objects.all()
+    serializer_class = RecipeSerializer
+    permission_classes = [IsAuthenticatedOrReadOnly]
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            MealRequirement.sync(instance.meal_id, [instance.ingredient_id])
+            apply_recipes(instance.meal, [instance], sign=-1)
+            recipe_graph.invalidate([instance.meal_id])
+            bump_catalog_version()
+            pin_catalog_to_primary()
+
+class ActionListCreateView(FastListMixin, generics.ListCreateAPIView):
     queryset = Action.objects.all()
     serializer_class = ActionSerializer
     permission_classes = [IsAuthenticated]
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        with transaction.atomic():
+            action = serializer.save(user=self.request.user)
+            action.apply_to_rollups()
+
+class ActionBatchCreateView(APIView):
+    permission_classes = [IsAuthenticated]
+    MAX_BATCH_SIZE = 1000
+
+    def post(self, request, *args, **kwargs):
+        entries = request.data.get('actions')
+        if not isinstance(entries, list) or not entries:
+            return Response({"detail": "actions must be a non-empty list."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(entries) > self.MAX_BATCH_SIZE:
+            return Response({"detail": f"At most {self.MAX_BATCH_SIZE} actions per batch."}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = [None] * len(entries)
+        valid = {}
+        for index, entry in enumerate(entries):
+            serializer = ActionBatchEntrySerializer(data=entry)
+            if not serializer.is_valid():
+                results[index] = {"index": index, "status": "invalid", "errors": serializer.errors}
+                continue
+            key = serializer.validated_data['client_key']
+            if key in valid:
+                results[index] = {"index": index, "client_key": key, "status": "invalid",
+                                  "errors": {"client_key": ["Duplicate client_key within the batch."]}}
+                continue
+            valid[key] = (index, serializer.validated_data)
+
+        item_ids = set()
+        for _, attrs in valid.values():
+            item_ids.update((attrs['item_id'], attrs['ingredient_id']))
+        known_ids = set(Item.objects.filter(item_id__in=item_ids).values_list('item_id', flat=True))
+        for key, (index, attrs) in list(valid.items()):
+            unknown = [field for field in ('item', 'ingredient') if attrs[f'{field}_id'] not in known_ids]
+            if unknown:
+                results[index] = {"index": index, "client_key": key, "status": "invalid",
+                                  "errors": {field: ["Unknown item."] for field in unknown}}
+                del valid[key]
+
+        try:
+            with transaction.atomic():
+                # Keys already logged by an earlier, possibly interrupted, sync are reported back instead of re-inserted
+                existing = dict(
+                    Action.objects.filter(user=request.user, client_key__in=valid.keys()).values_list('client_key', 'action_id')
+                )
+                new_actions = [
+                    Action(user=request.user, **attrs) for key, (_, attrs) in valid.items() if key not in existing
+                ]
+                Action.record_eaten_totals(new_actions)
+                Action.objects.bulk_create(new_actions)
+                Action.apply_all_to_rollups(new_actions)
+        except IntegrityError:
+            return Response({"detail": "A concurrent sync logged some of these actions, retry the batch."}, status=status.HTTP_409_CONFLICT)
+
+        created = {action.client_key: action.action_id for action in new_actions}
+        for key, (index, _) in valid.items():
+            if key in existing:
+                results[index] = {"index": index, "client_key": key, "status": "duplicate", "action_id": existing[key]}
+            else:
+                results[index] = {"index": index, "client_key": key, "status": "created", "action_id": created[key]}
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+class CookView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = CookSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        meal = serializer.validated_data['meal']
+        servings = serializer.validated_data['servings']
+
+        try:
+            with transaction.atomic():
+                actions, delta = Action.cook(request.user, meal, servings)
+        except InsufficientStockError as error:
+            return Response({"detail": str(error), "shortfalls": error.shortfalls}, status=status.HTTP_409_CONFLICT)
+        except ValueError as error:
+            return Response({"detail": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            "meal": meal.item_id,
+            "servings": servings,
+            "action_ids": [action.action_id for action in actions],
+            "pantry_delta": delta,
+        }, status=status.HTTP_201_CREATED)
 
 class ActionDeleteView(generics.DestroyAPIView):
     queryset = Action.objects.all()
     serializer_class = ActionSerializer
     permission_classes = [IsAuthenticated]
 
-class AvailableIngredientsView(APIView):
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.apply_to_rollups(sign=-1)
+            instance.delete()
+
+class AvailableIngredientsView(ReplicaReadMixin, APIView):
     permission_classes = [IsAuthenticated]
 
+    @cache_user_response('available-ingredients')
     def get(self, request, *args, **kwargs):
         user = request.user
-        action = Action.objects.filter(user=user).first()
-        if action:
-            available_ingredients = action.get_available_ingredients()
+        if Action.has_history(user):
+            available_ingredients = PantryItem.get_available_ingredients(user)
             return Response(available_ingredients, status=status.HTTP_200_OK)
         return Response({}, status=status.HTTP_404_NOT_FOUND)
 
-class EatenFoodView(APIView):
+class EatenFoodView(ReplicaReadMixin, APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
         user = request.user
-        action = Action.objects.filter(user=user).first()
-        if action:
-            eaten_food = action.get_eaten_food()
+        try:
+            since = self.parse_bound(request.query_params.get('since'), is_until=False)
+            until = self.parse_bound(request.query_params.get('until'), is_until=True)
+            limit = request.query_params.get('limit')
+            limit = int(limit) if limit is not None else None
+        except ValueError:
+            return Response({"detail": "since/until must be ISO dates or datetimes and limit an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        if limit is not None and limit < 1:
+            return Response({"detail": "limit must be positive."}, status=status.HTTP_400_BAD_REQUEST)
+
+        if Action.has_history(user):
+            action = Action(user=user)
+            if request.query_params.get('export') == 'ndjson':
+                return self.stream_ndjson(action.iter_eaten_food(since, until, limit))
+            eaten_food = action.get_eaten_food(since, until, limit)
             return Response(eaten_food, status=status.HTTP_200_OK)
         return Response({}, status=status.HTTP_404_NOT_FOUND)
 
-class MealRecommendationsView(APIView):
+    @staticmethod
+    def parse_bound(value, is_until):
+        # A bare date covers the whole day, so until=2024-12-20 includes that day
+        if value is None:
+            return None
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            if day is None:
+                raise ValueError(value)
+            moment = datetime.combine(day + timedelta(days=1) if is_until else day, time.min)
+        elif is_until:
+            moment += timedelta(microseconds=1)
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment
+
+    @staticmethod
+    def stream_ndjson(rows):
+        encoder = JSONEncoder(separators=(',', ':'), ensure_ascii=False)
+        lines = (encoder.encode(row) + '\n' for row in rows)
+        return StreamingHttpResponse(lines, content_type='application/x-ndjson')
+
+class MealRecommendationsView(ReplicaReadMixin, APIView):
     permission_classes = [IsAuthenticated]
+    DEFAULT_LIMIT = 10
+    MAX_LIMIT = 100
 
+    @cache_user_response('meal-recommendations', catalog=True)
     def get(self, request, *args, **kwargs):
         user = request.user
-        action = Action.objects.filter(user=user).first()
-        if not action:
+        if not Action.has_history(user):
             return Response({"detail": "No actions found for the user."}, status=status.HTTP_404_NOT_FOUND)
 
-        available_ingredients = action.get_available_ingredients()
-        available_ingredient_ids = available_ingredients.keys()
-
-        recommended_meals = Item.objects.filter(
-            is_meal=True,
-            meal_recipes__ingredient__item_id__in=available_ingredient_ids
-        ).distinct()
-
-        valid_meals = []
-        for meal in recommended_meals:
-            recipes = Recipe.objects.filter(meal=meal)
-            fail = False
-            for recipe in recipes:
-                if recipe.ingredient.item_id not in available_ingredients.keys():
-                    fail = True
-            if fail:
-                continue
-            if all(available_ingredients[recipe.ingredient.item_id] >= recipe.quantity for recipe in recipes):
-                valid_meals.append(meal)
+        if request.query_params.get('mode') == 'partial':
+            try:
+                limit = int(request.query_params.get('limit', self.DEFAULT_LIMIT))
+            except ValueError:
+                return Response({"detail": "limit must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+            if not 1 <= limit <= self.MAX_LIMIT:
+                return Response({"detail": f"limit must be between 1 and {self.MAX_LIMIT}."}, status=status.HTTP_400_BAD_REQUEST)
+            return self.partial_matches(user, limit)
+
+        cookable = MealRequirement.get_cookable_meal_ids(user)
+        if request.query_params.get('expand'):
+            # Also count meals whose nested sub-meals can be cooked from raw pantry ingredients
+            cookable = Q(item_id__in=cookable) | Q(item_id__in=recipe_graph.get_expanded_cookable_meal_ids(user))
+        else:
+            cookable = Q(item_id__in=cookable)
+        valid_meals = Item.objects.filter(cookable).order_by('item_id')
 
         if not valid_meals:
             return Response({"detail": "No valid meal recommendations found."}, status=status.HTTP_204_NO_CONTENT)
 
         serializer = ItemSerializer(valid_meals, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
\ No newline at end of file
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    @staticmethod
+    def partial_matches(user, limit):
+        matches = MealRequirement.get_partial_matches(user, limit)
+        if not matches:
+            return Response({"detail": "No valid meal recommendations found."}, status=status.HTTP_204_NO_CONTENT)
+
+        item_ids = {match['meal'] for match in matches}
+        item_ids.update(missing['ingredient'] for match in matches for missing in match['missing'])
+        names = dict(Item.objects.filter(item_id__in=item_ids).values_list('item_id', 'name'))
+        for match in matches:
+            match['name'] = names[match['meal']]
+            for missing in match['missing']:
+                missing['name'] = names[missing['ingredient']]
+        return Response(matches, status=status.HTTP_200_OK)
+
+class MealPlanView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        if not Action.has_history(request.user):
+            return Response({"detail": "No actions found for the user."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(build_plan(request.user), status=status.HTTP_200_OK)
+
+class DailySummaryView(APIView):
+    permission_classes = [IsAuthenticated]
+    MAX_DAYS = 366
+
+    def get(self, request, *args, **kwargs):
+        today = timezone.localdate()
+        try:
+            until = self.parse_day(request.query_params.get('until'), today)
+            since = self.parse_day(request.query_params.get('since'), until)
+        except ValueError:
+            return Response({"detail": "since and until must be dates in YYYY-MM-DD format."}, status=status.HTTP_400_BAD_REQUEST)
+        if since > until or (until - since).days >= self.MAX_DAYS:
+            return Response({"detail": f"since must be on or before until, at most {self.MAX_DAYS} days apart."}, status=status.HTTP_400_BAD_REQUEST)
+
+        user_settings = UserSettings.for_user(request.user)
+        goals = {
+            'calories': user_settings.goal_calories,
+            'protein': user_settings.goal_protein,
+            'carbs': user_settings.goal_carbs,
+            'fats': user_settings.goal_fats,
+        }
+        rollups = {
+            row['date']: row
+            for row in DailyNutrition.objects.filter(user=request.user, date__range=(since, until)).values('date', *DailyNutrition.TOTAL_FIELDS)
+        }
+
+        days = []
+        for offset in range((until - since).days + 1):
+            day = since + timedelta(days=offset)
+            totals = rollups.get(day, dict.fromkeys(DailyNutrition.TOTAL_FIELDS, 0.0))
+            days.append({
+                'date': day,
+                **{field: totals[field] for field in DailyNutrition.TOTAL_FIELDS},
+                'progress': {field: totals[field] / goal if goal else None for field, goal in goals.items()},
+            })
+        return Response({'goals': goals, 'days': days}, status=status.HTTP_200_OK)
+
+    @staticmethod
+    def parse_day(value, default):
+        if value is None:
+            return default
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        return day
+
+class MetricsView(APIView):
+    # Per-view traffic and latency are operational data, so only staff users may scrape them
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(registry.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,75 @@
+# databases.py
+"""Database profiles selected with environment variables.
+
+FITNESSAPP_DB_ENGINE picks the profile:
+
+* sqlite (default): FITNESSAPP_DB_NAME is the file, db.sqlite3 next to manage.py by default.
+  Transactions start with BEGIN IMMEDIATE so concurrent writers queue on the busy timeout
+  instead of failing with "database is locked" when upgrading a read lock; WAL mode,
+  synchronous=NORMAL and the busy timeout are applied per connection by the
+  connection_created hook in FitnessApp/signals.py (see FITNESSAPP_SQLITE_PRAGMAS).
+* postgresql: FITNESSAPP_DB_NAME/USER/PASSWORD/HOST/PORT. Connections are kept open for
+  FITNESSAPP_DB_CONN_MAX_AGE seconds (default 60, health-checked before reuse), or, with
+  FITNESSAPP_DB_POOL=1, taken from a psycopg connection pool of FITNESSAPP_DB_POOL_MIN_SIZE to
+  FITNESSAPP_DB_POOL_MAX_SIZE connections (needs psycopg[pool]; Django then requires
+  CONN_MAX_AGE=0).
+
+FITNESSAPP_DB_REPLICAS adds read replicas as aliases replica1, replica2, ... from a comma
+separated list: SQLite file names, or PostgreSQL hosts (host or host:port) sharing the other
+settings of the primary. Tests run them as mirrors of the primary.
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+SQLITE_BUSY_TIMEOUT_MS = 5000
+
+
+def get_sqlite_busy_timeout(environ=os.environ):
+    return int(environ.get('FITNESSAPP_SQLITE_BUSY_TIMEOUT_MS', SQLITE_BUSY_TIMEOUT_MS))
+
+
+def get_databases(base_dir, environ=os.environ):
+    engine = environ.get('FITNESSAPP_DB_ENGINE', 'sqlite')
+    if engine == 'sqlite':
+        default = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': environ.get('FITNESSAPP_DB_NAME', base_dir / 'db.sqlite3'),
+            'OPTIONS': {
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': get_sqlite_busy_timeout(environ) / 1000,
+            },
+        }
+    elif engine == 'postgresql':
+        default = {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': environ.get('FITNESSAPP_DB_NAME', 'fitnessapp'),
+            'USER': environ.get('FITNESSAPP_DB_USER', ''),
+            'PASSWORD': environ.get('FITNESSAPP_DB_PASSWORD', ''),
+            'HOST': environ.get('FITNESSAPP_DB_HOST', ''),
+            'PORT': environ.get('FITNESSAPP_DB_PORT', ''),
+            'OPTIONS': {},
+        }
+        if environ.get('FITNESSAPP_DB_POOL') == '1':
+            default['CONN_MAX_AGE'] = 0
+            default['OPTIONS']['pool'] = {
+                'min_size': int(environ.get('FITNESSAPP_DB_POOL_MIN_SIZE', 2)),
+                'max_size': int(environ.get('FITNESSAPP_DB_POOL_MAX_SIZE', 20)),
+            }
+        else:
+            default['CONN_MAX_AGE'] = int(environ.get('FITNESSAPP_DB_CONN_MAX_AGE', 60))
+            default['CONN_HEALTH_CHECKS'] = True
+    else:
+        raise ImproperlyConfigured(f"FITNESSAPP_DB_ENGINE must be 'sqlite' or 'postgresql', not '{engine}'.")
+
+    databases = {'default': default}
+    replicas = [name.strip() for name in environ.get('FITNESSAPP_DB_REPLICAS', '').split(',') if name.strip()]
+    for index, name in enumerate(replicas, start=1):
+        replica = {**default, 'OPTIONS': dict(default['OPTIONS']), 'TEST': {'MIRROR': 'default'}}
+        if engine == 'sqlite':
+            replica['NAME'] = name
+        else:
+            replica['HOST'], _, port = name.partition(':')
+            replica['PORT'] = port or default['PORT']
+        databases[f'replica{index}'] = replica
+    return databases
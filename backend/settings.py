@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 import os
 from pathlib import Path
 
+from .databases import get_databases, get_sqlite_busy_timeout
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -57,6 +59,7 @@ SIMPLE_JWT = {
 }
 
 MIDDLEWARE = [
+	'FitnessApp.middleware.MetricsMiddleware',
 	'django.middleware.security.SecurityMiddleware',
 	'django.contrib.sessions.middleware.SessionMiddleware',
 	'django.middleware.common.CommonMiddleware',
@@ -67,19 +70,39 @@ MIDDLEWARE = [
 	'corsheaders.middleware.CorsMiddleware',
 ]
 
+# Per-endpoint latency/query/serialization histograms served to staff users at /metrics/.
+# SAMPLE_RATE is the fraction of requests recorded.
+FITNESSAPP_METRICS = {
+    'ENABLED': True,
+    'SAMPLE_RATE': 1.0,
+}
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",  # React frontend
 ]
 
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework.renderers.JSONRenderer',
+        'FitnessApp.renderers.FastJSONRenderer',
     ),
 	'DEFAULT_AUTHENTICATION_CLASSES': (
-    	'rest_framework_simplejwt.authentication.JWTAuthentication',
+    	'FitnessApp.authentication.CachedJWTAuthentication',
 	),
 }
 
+# Per-user response cache for the pantry and recommendation endpoints.
+# Any configured backend works; point FITNESSAPP_CACHE_ALIAS at a shared one when running several workers.
+CACHES = {
+	'default': {
+		'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+	}
+}
+FITNESSAPP_CACHE_ALIAS = 'default'
+FITNESSAPP_CACHE_TIMEOUT = 300
+# Seconds an authenticated user stays cached; User and UserSettings writes invalidate it earlier,
+# in other workers only when the cache above is shared. 0 disables the auth cache.
+FITNESSAPP_AUTH_CACHE_TIMEOUT = 60
+
 ROOT_URLCONF = 'backend.urls'
 
 TEMPLATES = [
@@ -104,11 +127,19 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-	'default': {
-		'ENGINE': 'django.db.backends.sqlite3',
-		'NAME': BASE_DIR / 'db.sqlite3',
-	}
+# SQLite by default; set FITNESSAPP_DB_ENGINE=postgresql for PostgreSQL with persistent or
+# pooled connections. See backend/databases.py for the variables.
+DATABASES = get_databases(BASE_DIR)
+# GETs of the views using ReplicaReadMixin read from these aliases; a user is pinned to the
+# primary for FITNESSAPP_REPLICA_STICKY_SECONDS after writing Actions.
+DATABASE_ROUTERS = ['FitnessApp.routers.ReplicaRouter']
+FITNESSAPP_READ_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+FITNESSAPP_REPLICA_STICKY_SECONDS = 5
+# Applied to every new SQLite connection; journal_mode=WAL lets readers run alongside the writer.
+FITNESSAPP_SQLITE_PRAGMAS = {
+	'busy_timeout': get_sqlite_busy_timeout(),
+	'journal_mode': 'WAL',
+	'synchronous': 'NORMAL',
 }
 
 # Password validation
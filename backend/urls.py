@@ -2,17 +2,24 @@
 from django.urls import path
 from rest_framework_simplejwt.views import TokenRefreshView, TokenVerifyView
 
-from FitnessApp.views import ItemListCreateView, ItemDetailView, RecipeListCreateView, ActionDeleteView, \
-    ActionListCreateView, CustomTokenObtainPairView, UserRegistrationView, AvailableIngredientsView, EatenFoodView, \
-    ItemIngredientsView, MealRecommendationsView, UserSettingsView
+from FitnessApp import async_views
+from FitnessApp.views import ItemListCreateView, ItemSearchView, ItemDetailView, RecipeListCreateView, \
+    RecipeBulkCreateView, RecipeDetailView, ActionDeleteView, ActionListCreateView, CustomTokenObtainPairView, \
+    UserRegistrationView, AvailableIngredientsView, EatenFoodView, ItemIngredientsView, MealRecommendationsView, \
+    UserSettingsView, DailySummaryView, MetricsView, ActionBatchCreateView, MealPlanView, CookView
 
 urlpatterns = [
     path('items/', ItemListCreateView.as_view(), name='item_list_create'),
+    path('items/search/', ItemSearchView.as_view(), name='item_search'),
     path('items/<int:pk>/', ItemDetailView.as_view(), name='item_detail'),
     path('items/<int:item_id>/ingredients/', ItemIngredientsView.as_view(), name='item_ingredients'),
 
     path('recipes/', RecipeListCreateView.as_view(), name='recipe_list_create'),
+    path('recipes/bulk/', RecipeBulkCreateView.as_view(), name='recipe_bulk_create'),
+    path('recipes/<int:pk>/', RecipeDetailView.as_view(), name='recipe_detail'),
     path('actions/', ActionListCreateView.as_view(), name='action_list_create'),
+    path('actions/batch/', ActionBatchCreateView.as_view(), name='action_batch_create'),
+    path('actions/cook/', CookView.as_view(), name='action_cook'),
     path('actions/<int:pk>/', ActionDeleteView.as_view(), name='action_delete'),
     path('api/token/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
@@ -22,5 +29,16 @@ urlpatterns = [
     path('available-ingredients/', AvailableIngredientsView.as_view(), name='available_ingredients'),
     path('eaten-food/', EatenFoodView.as_view(), name='eaten_food'),
     path('meal-recommendations/', MealRecommendationsView.as_view(), name='meal_recommendations'),
+    path('meal-plan/', MealPlanView.as_view(), name='meal_plan'),
+    path('daily-summary/', DailySummaryView.as_view(), name='daily_summary'),
+
+    path('async/items/', async_views.item_list, name='async_item_list'),
+    path('async/items/<int:pk>/', async_views.item_detail, name='async_item_detail'),
+    path('async/items/<int:item_id>/ingredients/', async_views.item_ingredients, name='async_item_ingredients'),
+    path('async/available-ingredients/', async_views.available_ingredients, name='async_available_ingredients'),
+    path('async/eaten-food/', async_views.eaten_food, name='async_eaten_food'),
+    path('async/meal-recommendations/', async_views.meal_recommendations, name='async_meal_recommendations'),
+
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 
 ]
\ No newline at end of file